@@ -1,5 +1,7 @@
 """pylexirumah: API scripts for LexiRumah"""
 
+import os
+
 from pycldf import Dataset
 from clldutils.path import Path
 
@@ -7,7 +9,11 @@ from clldutils.path import Path
 repository = (Path(__file__).parent.parent /
               "cldf" / "cldf-metadata.json")
 
-def get_dataset(fname=None):
+# Derived data (compiled profiles etc.) that can be recomputed at any time.
+cache_directory = (Path(os.environ.get("XDG_CACHE_HOME") or
+                        Path.home() / ".cache") / "pylexirumah")
+
+def get_dataset(fname=None, snapshot=False):
     """Load a CLDF dataset.
 
     Load the file as `json` CLDF metadata description file, or as metadata-free
@@ -22,15 +28,23 @@ def get_dataset(fname=None):
     ----------
     fname : str or Path
         Path to a CLDF dataset
+    snapshot : bool
+        If true, load the dataset from its binary snapshot (see
+        `pylexirumah.snapshot`) if there is an up-to-date one.
 
     Returns
     -------
-    pycldf.Dataset
+    pycldf.Dataset or pylexirumah.snapshot.Snapshot
     """
     if fname is None:
         fname = repository
     else:
         fname = Path(fname)
+    if snapshot:
+        from pylexirumah.snapshot import load_snapshot
+        dataset = load_snapshot(fname)
+        if dataset is not None:
+            return dataset
     if not fname.exists():
         raise FileNotFoundError(
             '{:} does not exist'.format(fname))
@@ -2,8 +2,6 @@
 
 """Automatically align similar forms"""
 
-import copy
-
 import numpy
 import newick
 import pandas
@@ -12,53 +10,345 @@ import itertools
 
 import sys
 import argparse
+import multiprocessing
+
+from pylexirumah.pairwise import Aligner
+from pylexirumah.tree import upgma, SubtreeIndex
+
+
+def _init_distance_worker(forms, lodict, gop, gep):
+    global _worker_forms, _worker_aligner
+    _worker_forms = forms
+    _worker_aligner = Aligner(lodict, gop=gop, gep=gep)
+
+
+def _distance_worker(pairs):
+    return _worker_aligner.score_many(
+        (_worker_forms[i], _worker_forms[j]) for i, j in pairs)
+
+
+MIN_CHUNKSIZE = 500
+
+
+def pairwise_distance_matrix(forms, lodict=None, gop=-2.5, gep=-1.75,
+                             processes=None, chunksize=None):
+    """Compute the alignment distances between all pairs of forms.
+
+    Align every pair of segmented forms (typically, all forms of one concept)
+    globally and turn the alignment scores into distances
+    d(a, b) = 1 - 2 s(a, b) / (s(a, a) + s(b, b)).
+
+    Identical segment sequences are only aligned once. If there are many
+    distinct pairs, the alignments are distributed over a process pool.
+
+    Parameters
+    ----------
+    forms : sequence of sequences of str
+        The segmented forms, eg. the Segments column of the FormTable rows
+        for one concept.
+    lodict : dict, optional
+        Segment pair scores, see `pylexirumah.pairwise.Aligner`.
+    gop, gep : float, optional
+        Gap opening and extension penalties. (default: -2.5, -1.75)
+    processes : int, optional
+        Number of worker processes. (default: os.cpu_count(); 1 means to
+        compute everything in this process)
+    chunksize : int, optional
+        Number of distinct pairs a worker aligns in one go. (default: about
+        four chunks per process, but at least 500 pairs per chunk)
+
+    Returns
+    -------
+    numpy.ndarray
+        The condensed distance matrix, in the order of
+        `scipy.spatial.distance.pdist`, ie. the distances of the pairs
+        (0, 1), (0, 2), …, (0, n-1), (1, 2), …, (n-2, n-1).
+
+    Examples
+    --------
+    >>> pairwise_distance_matrix(["baba", "baba", "bapa"], processes=1)
+    array([0. , 0.5, 0.5])
+
+    """
+    if lodict is None:
+        lodict = {}
+    distinct = {}
+    codes = numpy.array(
+        [distinct.setdefault(tuple(f), len(distinct)) for f in forms],
+        dtype=int)
+    distinct = list(distinct)
+    n_distinct = len(distinct)
+
+    pairs = list(itertools.combinations(range(n_distinct), 2))
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if chunksize is None:
+        chunksize = max(-(-len(pairs) // (4 * processes)), MIN_CHUNKSIZE)
+    processes = min(processes, (len(pairs) - 1) // chunksize + 1)
+
+    aligner = Aligner(lodict, gop=gop, gep=gep)
+    self_scores = aligner.score_many((f, f) for f in distinct)
+    if processes > 1:
+        with multiprocessing.Pool(
+                processes, initializer=_init_distance_worker,
+                initargs=(distinct, lodict, gop, gep)) as pool:
+            scores = numpy.concatenate(pool.map(
+                _distance_worker,
+                [pairs[start:start + chunksize]
+                 for start in range(0, len(pairs), chunksize)]))
+    else:
+        scores = aligner.score_many(
+            (distinct[i], distinct[j]) for i, j in pairs)
+
+    distances = numpy.zeros((n_distinct, n_distinct))
+    if pairs:
+        i, j = numpy.array(pairs).T
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            d = 1 - 2 * scores / (self_scores[i] + self_scores[j])
+        # Only the empty form aligns to itself with score 0.
+        d[~numpy.isfinite(d)] = 1.0
+        distances[i, j] = d
+        distances[j, i] = d
+
+    i, j = numpy.triu_indices(len(codes), 1)
+    return distances[codes[i], codes[j]]
+
+
+def lect_distance_matrix(lects, concepts, cognatesets):
+    """Compute the lexical distances between lects from cognate codes.
+
+    The distance between two lects is one minus their average cognate
+    overlap: For every concept attested in at least one of the two lects,
+    take the Jaccard index of the sets of cognate classes the two lects have
+    for that concept, and average over these concepts.
+
+    The arguments are three parallel sequences with one entry per form, eg.
+    three columns of the FormTable. They are turned into a lect ×
+    (concept, cognate class) incidence matrix once; the overlaps of all lect
+    pairs are then computed by one matrix product per concept. Forms without
+    a cognate class (None or NaN) count as a class of their own.
+
+    Parameters
+    ----------
+    lects : sequence of hashable
+    concepts : sequence of hashable
+    cognatesets : sequence of hashable
+
+    Returns
+    -------
+    list
+        The sorted lect IDs
+    numpy.ndarray
+        The square matrix of distances between these lects
+
+    Examples
+    --------
+    >>> lects, distances = lect_distance_matrix(
+    ...     ["l1", "l1", "l2", "l2", "l3"],
+    ...     ["one", "two", "one", "two", "two"],
+    ...     [1, 2, 1, 3, 3])
+    >>> lects
+    ['l1', 'l2', 'l3']
+    >>> distances
+    array([[0. , 0.5, 1. ],
+           [0.5, 0. , 0.5],
+           [1. , 0.5, 0. ]])
+
+    """
+    lect_names = sorted(set(lects))
+    lect_index = {lect: i for i, lect in enumerate(lect_names)}
+
+    columns = {}
+    rows, cols, column_concepts = [], [], {}
+    for k, (lect, concept, cognateset) in enumerate(
+            zip(lects, concepts, cognatesets)):
+        if cognateset is None or cognateset != cognateset:
+            # No cognate class, or NaN from pandas: Never shared.
+            key = (concept, None, k)
+        else:
+            key = (concept, cognateset)
+        try:
+            col = columns[key]
+        except KeyError:
+            col = columns[key] = len(columns)
+            column_concepts.setdefault(concept, []).append(col)
+        rows.append(lect_index[lect])
+        cols.append(col)
 
-from newick import Node
+    incidence = numpy.zeros((len(lect_names), len(columns)))
+    incidence[rows, cols] = 1
 
-import infomapcog.dataio as dataio
+    shared = numpy.zeros((len(lect_names), len(lect_names)))
+    compared = numpy.zeros((len(lect_names), len(lect_names)))
+    for concept_columns in column_concepts.values():
+        block = incidence[:, concept_columns]
+        intersection = block @ block.T
+        sizes = block.sum(axis=1)
+        union = sizes[:, None] + sizes[None, :] - intersection
+        present = union > 0
+        shared[present] += intersection[present] / union[present]
+        compared += present
 
-def upgma(distance_matrix, names=None):
-    """Cluster based on distance matrix dist using UPGMA
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        distances = 1 - shared / compared
+    distances[compared == 0] = 1
+    numpy.fill_diagonal(distances, 0)
+    return lect_names, distances
 
-    That is, the Unweighted Pair Group Method with Arithmetic Mean algorithm
 
-    If node names are given (not None), they must be a sequence of the same
-    length as the size of the square distance_matrix.
+def alignment_tasks(data, cognate_col, only_necessary=False):
+    """Collect the forms of each cognate class that needs aligning.
 
-    The edge lengths in the tree are not useful for the time being.
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        The word list, indexed by (concept, language, tokens)
+    cognate_col : str
+        The column containing the cognate classes
+    only_necessary : bool
+        Skip the classes whose alignments all have the same length already
+
+    Returns
+    -------
+    list of (cognate class, list of (language, concept, tokens))
+        The classes, largest first, and their forms with the tokens as
+        tuples of segments
     """
+    tasks = []
+    for i, cognateclass in data.groupby(cognate_col):
+        if only_necessary and len(set([
+                len(r.split()) for r in cognateclass["Alignment"]])) == 1:
+            continue
+        tasks.append((i, [(l, c, tuple(t.split()))
+                          for (c, l, t), row in cognateclass.iterrows()]))
+    tasks.sort(key=lambda task: -len(task[1]))
+    return tasks
+
+
+def _init_alignment_worker(tree, lodict):
+    global _worker_subtrees, _worker_lodict
+    import infomapcog.dataio as dataio
+    if isinstance(tree, str):
+        tree = newick.loads(tree)[0]
+    _worker_subtrees = SubtreeIndex(tree)
+    _worker_lodict = dataio.MaxPairDict(lodict)
+
+
+def _alignment_worker(forms):
+    return align_class(forms, _worker_subtrees, _worker_lodict)
+
+
+def align_class(forms, subtrees, lodict):
+    """Align the forms of one cognate class along the guide tree.
+
+    `subtrees` is a `pylexirumah.tree.SubtreeIndex` of the guide tree. A
+    class none of whose lects are in the guide tree cannot be aligned.
+
+    Returns
+    -------
+    list of ((concept, language, tokens), alignment) or None
+        The alignments as space-separated strings, with the row keys they
+        belong to, or None if none of the lects are in the guide tree
+    """
+    # By its current API, infomapcog expects a list of sets of (L,C,V)
+    # tuples.
+    as_dict = [set(forms)]
+    if len(forms) == 1:
+        language, concept, alg = as_dict[0].pop()
+        return [((concept, language, ' '.join([a for a in alg if a])),
+                 " ".join([a for a in alg if a]))]
+
+    import infomapcog.dataio as dataio
+    # multi_align puts the forms on the nodes of the tree, so it gets a
+    # fresh tree restricted to the lects of this class.
+    languages = {language for language, _, _ in forms}
+    subtree = subtrees.subtree(languages)
+    if subtree is None:
+        return None
+    result = []
+    for group, (languages, concepts, algs) in dataio.multi_align(
+            as_dict, subtree, lodict=lodict, gop=-2.5, gep=-1.75).items():
+        for language, concept, alg in zip(languages, concepts, zip(*algs)):
+            result.append(
+                ((concept, language, ' '.join([a for a in alg if a])),
+                 " ".join([a or '-' for a in alg])))
+    return result
+
+
+def align_cognate_classes(tasks, tree, lodict=None, processes=None):
+    """Align the forms of many cognate classes, in a process pool.
+
+    The classes are handed to the workers in the order given, which should
+    be largest first (see `alignment_tasks`) so that no big class is left
+    over at the end. Every worker parses and indexes the guide tree once,
+    and takes the subtree for each class from that index.
+
+    Parameters
+    ----------
+    tasks : list of (cognate class, list of (language, concept, tokens))
+    tree : newick.Node
+        The guide tree, with lects as leaves
+    lodict : dict, optional
+        Segment pair scores
+    processes : int, optional
+        Number of worker processes. (default: os.cpu_count(); 1 means to
+        align everything in this process)
+
+    Returns
+    -------
+    dict
+        (concept, language, tokens): alignment
+    list
+        The cognate classes that were not aligned, because none of their
+        lects are in the guide tree
+    """
+    if lodict is None:
+        lodict = {}
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(tasks))
+    alignments = {}
+    skipped = []
+
+    def collect(results):
+        for (cognateclass, _), result in zip(tasks, results):
+            if result is None:
+                skipped.append(cognateclass)
+            else:
+                alignments.update(result)
+
+    if processes > 1:
+        with multiprocessing.Pool(
+                processes, initializer=_init_alignment_worker,
+                initargs=(tree.newick, lodict)) as pool:
+            collect(pool.imap(
+                _alignment_worker, [forms for _, forms in tasks]))
+    else:
+        _init_alignment_worker(tree, lodict)
+        collect(_alignment_worker(forms) for _, forms in tasks)
+    return alignments, skipped
+
+
+def update_alignments(data, alignments):
+    """Write new alignments into the "Alignment" column of the word list.
+
+    Rows without a new alignment keep their old one, or get none if `data`
+    has no "Alignment" column yet.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        The word list, indexed by (concept, language, tokens)
+    alignments : dict
+        (concept, language, tokens): alignment, see `align_cognate_classes`
+    """
+    try:
+        column = data["Alignment"]
+    except KeyError:
+        column = [None] * len(data)
+    data["Alignment"] = [alignments.get(key, value)
+                         for key, value in zip(data.index, column)]
 
-    # Initialize nodes
-    nodes = [Node(name) for name in (names or range(len(distance_matrix)))]
-
-    # Iterate until the number of clusters is k
-    nc = len(distance_matrix)
-    while nc > 1:
-        # Calculate the pairwise distance of each cluster, while searching for pair with least distance
-        minimum_distance = numpy.inf
-        i, j = 0, 1
-        for i in range(nc-1):
-            for j in range(i+1, nc):
-                dis = distance_matrix[i, j]
-                if dis < minimum_distance:
-                    minimum_distance = dis
-                    cluster = nodes[i], nodes[j]
-                    indices = i, j
-        # Merge these two nodes into one new node
-
-        i, j = indices
-        distance_matrix[i] = 0.5 * (distance_matrix[i]) + 0.5*(distance_matrix[j])
-        distance_matrix[:,i] = 0.5 * (distance_matrix[:,i]) + 0.5*(distance_matrix[:,j])
-        nodes[i] = Node.create(descendants=cluster)
-        for c in cluster:
-            c.length = distance_matrix[i,i]
-
-        distance_matrix = numpy.delete(distance_matrix, j, 0)
-        distance_matrix = numpy.delete(distance_matrix, j, 1)
-        del nodes[j]
-
-        nc -= 1
-    return nodes[0]
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
@@ -83,6 +373,9 @@ if __name__ == "__main__":
                         help="Newick tree to use as guide tree for multi-alignment")
     parser.add_argument("--only-necessary", action='store_true', default=False,
                         help="Only align those classes that appear unaligned")
+    parser.add_argument("--processes", default=None, type=int,
+                        help="Number of worker processes. (default: one per"
+                        " CPU)")
     args = parser.parse_args()
 
     if args.lodict is None:
@@ -102,63 +395,23 @@ if __name__ == "__main__":
         tree = newick.load(args.guide_tree)[0]
     else:
         # Calculate an UPGMA tree or something
-        by_language = data.groupby("Language_ID")
-        languages = []
-        distance_matrix = numpy.zeros((len(by_language), len(by_language)))
-        for (l1, (language1, data1)), (l2, (language2, data2)) in (
-                itertools.combinations(enumerate(by_language), 2)):
-            if language1 not in languages:
-                languages.append(language1)
-            print(language1, language2)
-            c = 0
-            shared_vocab = 0
-            for concept in set(data1["Feature_ID"]) | set(data2["Feature_ID"]):
-                c1 = set(data1["Cognate Set"][data1["Feature_ID"] == concept])
-                c2 = set(data2["Cognate Set"][data2["Feature_ID"] == concept])
-                shared_vocab += len(c1 & c2)/len(c1 | c2)
-                c += 1
-
-            distance_matrix[l1, l2] = 1-shared_vocab/c
-            distance_matrix[l2, l1] = 1-shared_vocab/c
-        languages.append(language2)
+        languages, distance_matrix = lect_distance_matrix(
+            data.index.get_level_values("Language_ID"),
+            data["Feature_ID"],
+            data["Cognate Set"])
         tree = upgma(distance_matrix, languages)
         print(tree)
         open("tree.newick", "w").write(tree.newick)
 
-    for i, cognateclass in data.groupby(args.cognate_col):
-        if args.only_necessary and len(set([
-                len(r.split()) for r in cognateclass["Alignment"]])) == 1:
-            continue
-
-        # Convert the data from a dataframe into a dict that
-        # multi_align can work with. NOTE: By its current API,
-        # infomapcog expects (L,C,V) tuples as keys.
-        as_dict = [
-            {(l, c, tuple(t.split()))
-                for (c, l, t), row in cognateclass.iterrows()}]
-
-        if len(cognateclass) == 1:
-            language, concept, alg = as_dict[0].pop()
-            data.set_value(
-                (concept, language, ' '.join([a for a in alg if a])),
-                "Alignment",
-                " ".join([a for a in alg if a]))
-            continue
-
-        # Run the multi-alignment algorithm. Because it manipulates
-        # the tree internally, putting the forms on its nodes, we pass
-        # a copy of the tree so different groups don't come in conflict.
-        for group, (languages, concepts, algs) in dataio.multi_align(
-                as_dict, copy.deepcopy(tree),
-                lodict=dataio.MaxPairDict(lodict),
-                gop=-2.5, gep=-1.75).items():
-            for language, concept, alg in zip(
-                    languages, concepts, zip(*algs)):
-                print(alg)
-                data.set_value(
-                    (concept, language, ' '.join([a for a in alg if a])),
-                    "Alignment",
-                    " ".join([a or '-' for a in alg]))
+    alignments, skipped = align_cognate_classes(
+        alignment_tasks(data, args.cognate_col, args.only_necessary),
+        tree, lodict, processes=args.processes)
+    if skipped:
+        print("Not aligning {:d} cognate classes, none of whose lects are in"
+              " the guide tree: {:}".format(
+                  len(skipped), ", ".join(str(c) for c in skipped)),
+              file=sys.stderr)
+    update_alignments(data, alignments)
 
     data.to_csv(args.output,
                 index=True,
@@ -7,7 +7,6 @@ Example
     $ python pylexirumah/append_changed_cognate_classes.py edictor.tsv
 """
 
-import bisect
 import itertools
 import collections
 
@@ -16,6 +15,7 @@ from argparse import ArgumentParser, FileType
 import csv
 import datetime
 
+import numpy
 import pycldf.dataset
 from clldutils.path import Path
 from pycldf.sources import Source
@@ -48,6 +48,108 @@ def swap(dictionary):
     return swapped
 
 
+def _hungarian(cost):
+    """Solve the assignment problem for a square cost matrix.
+
+    This is the O(n³) Hungarian algorithm with potentials, with the scan over
+    columns vectorized. Return p, where p[j] is the (1-based) row assigned
+    to the (1-based) column j.
+
+    """
+    n = len(cost)
+    u = numpy.zeros(n + 1)
+    v = numpy.zeros(n + 1)
+    p = numpy.zeros(n + 1, dtype=int)
+    way = numpy.zeros(n + 1, dtype=int)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = numpy.full(n + 1, numpy.inf)
+        used = numpy.zeros(n + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used
+            free[0] = False
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free[1:] & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = numpy.where(free, minv, numpy.inf)
+            j1 = int(candidates.argmin())
+            delta = candidates[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    return p
+
+
+def max_weight_matching(weights):
+    """Find a maximum weight matching in a sparse bipartite graph.
+
+    The graph is given as a dict mapping (left, right) node pairs to their
+    positive edge weights. Each connected component of the graph is solved
+    separately with the Hungarian algorithm, so the cost depends on the size
+    of the components, not of the whole graph.
+
+    Parameters
+    ----------
+    weights : dict
+        (left, right): weight
+
+    Returns
+    -------
+    dict
+        left: right for all matched pairs
+
+    Examples
+    --------
+    >>> sorted(max_weight_matching({("a", 1): 3, ("a", 2): 2, ("b", 1): 2}).items())
+    [('a', 2), ('b', 1)]
+    """
+    # Find the connected components with a union-find structure
+    parent = {}
+
+    def find(node):
+        while parent.setdefault(node, node) != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for left, right in weights:
+        parent[find((0, left))] = find((1, right))
+    components = collections.defaultdict(list)
+    for (left, right), weight in weights.items():
+        components[find((0, left))].append((left, right, weight))
+
+    matching = {}
+    for edges in components.values():
+        if len(edges) == 1:
+            left, right, weight = edges[0]
+            matching[left] = right
+            continue
+        lefts = list(collections.OrderedDict.fromkeys(e[0] for e in edges))
+        rights = list(collections.OrderedDict.fromkeys(e[1] for e in edges))
+        size = max(len(lefts), len(rights))
+        gain = numpy.zeros((size, size))
+        left_index = {left: i for i, left in enumerate(lefts)}
+        right_index = {right: j for j, right in enumerate(rights)}
+        for left, right, weight in edges:
+            gain[left_index[left], right_index[right]] = weight
+        assignment = _hungarian(gain.max() - gain)
+        for j, i in enumerate(assignment[1:]):
+            if i - 1 < len(lefts) and j < len(rights) and gain[i - 1, j] > 0:
+                matching[lefts[i - 1]] = rights[j]
+    return matching
+
+
 def main(args):
     """ Update cognate codes and alignments of a CLDF dataset from an Edictor file.
 
@@ -102,76 +204,40 @@ def main(args):
         data_on_form[row["Form_ID"]] = row
         official_cognateset_assignments[row["Form_ID"]] = row["Cognateset_ID"]
         max_row_id = max(max_row_id, row["ID"])
-    official_cognatesets = swap(official_cognateset_assignments)
 
     # Find changed alignments
     for form, data in data_on_form.items():
         if data.get("Alignment", None) == alignments.get(form, False):
             del alignments[form]
 
-    # Construct a set of minimal changes to update cognate sets
-    pairs, overlaps = [], []
-
-    # First, sort all pairs of old and new cognate sets by overlap.
-    still_to_match = new_cognatesets.copy()
-    for name, cognateset in list(official_cognatesets.items()):
-        cognateset = cognateset.copy()
-        for new_name, new_cognateset in list(still_to_match.items()):
-            if cognateset == new_cognateset:
-                # This cognate set has not changed, ignore.
-                continue
-
-            overlap = cognateset & new_cognateset
-            if not overlap:
-                # There is no overlap.
-                continue
-
-            # This cognate set has changed.
-            official_cognatesets.pop(name, None)
-
-            # Insert the pair into an ordered table of pair sizes. Ensure
-            # biggest overlaps come first, so actually work with their negatives.
-            index = bisect.bisect(overlaps, -len(overlap))
-            overlaps.insert(index, -len(overlap))
-            pairs.insert(index, (name, new_name))
-
-            remainder = new_cognateset - overlap
-            if remainder:
-                still_to_match[new_name] = remainder
-            else:
-                # All entries of this set have been accounted for, remove it.
-                del still_to_match[new_name]
-
-            cognateset -= overlap
-            if not cognateset:
-                # All entries of this set have been accounted for, no need to look further.
-                break
+    # Construct a set of minimal changes to update cognate sets: Count the
+    # overlaps between old and new cognate sets in one pass over the forms,
+    # and give each new cognate set the name of the old one it shares most
+    # forms with, such that as many forms as possible keep their cognate
+    # class name.
+    overlaps = collections.Counter()
+    for form, new_cognateset in new_cognateset_assignments.items():
+        old_cognateset = official_cognateset_assignments.get(form)
+        if old_cognateset is not None:
+            overlaps[old_cognateset, new_cognateset] += 1
+    names = {new: old for old, new in max_weight_matching(overlaps).items()}
+
+    # New cognate sets that do not inherit a name get a fresh one, derived
+    # from their Edictor cognate ID.
+    used_names = set(official_cognateset_assignments.values())
+    used_names.update(names.values())
+    for new_cognateset in new_cognatesets:
+        if new_cognateset not in names:
+            new_name = " ".join(new_cognateset)
+            while new_name in used_names:
+                new_name = new_name + "X"
+            names[new_cognateset] = new_name
+            used_names.add(new_name)
 
-    # Now greedily assign new cognate class ids based on the old ones. (This
-    # greedy algorithm is not optimal, but that issue should not be too
-    # relevant.)
-    other_seen = set()
     moved_forms = collections.OrderedDict()
-    for index, (name, other) in enumerate(pairs):
-        if other in other_seen:
-            continue
-        else:
-            new_name = name
-            while new_name in official_cognatesets:
-                new_name = new_name + "X"
-            official_cognatesets[new_name] = set()
-            for form in new_cognatesets[other]:
-                if official_cognateset_assignments.get(form) != new_name:
-                    moved_forms[form] = new_name
-                official_cognatesets[new_name].add(form)
-            other_seen.add(other)
-
-    for new_name, new_cognateset in list(still_to_match.items()):
-        while new_name in official_cognatesets:
-            new_name = new_name + "X"
-        for form in new_cognateset:
-            moved_forms[form] = new_name
-        official_cognatesets[new_name] = new_cognateset
+    for form, new_cognateset in new_cognateset_assignments.items():
+        if official_cognateset_assignments.get(form) != names[new_cognateset]:
+            moved_forms[form] = names[new_cognateset]
 
     try:
         source = dataset.sources[args.source_id]
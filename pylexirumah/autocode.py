@@ -2,22 +2,141 @@
 
 """Similarity code tentative cognates in a word list and align them"""
 
+import os
 import sys
+import json
+import heapq
+import tempfile
+import random
 from pycldf.util import Path
 import hashlib
 import argparse
+import collections
+import concurrent.futures
+
+import numpy
 
 import lingpy
 import lingpy.compare.partial
 
 from pylexirumah import get_dataset
+from pylexirumah.sounds import normalize
 from segments import Tokenizer
 
 tokenizer = Tokenizer()
 
 
-def sha1(path):
-    return hashlib.sha1(str(path).encode('utf-8')).hexdigest()[:12]
+def scorer_key(lex, soundclass, ratio, threshold, runs, seed=0):
+    """Hash everything a LexStat scorer depends on.
+
+    That is, the forms (their IDs, lects, concepts and cleaned segments) and
+    the parameters of the permutation test, but not the path of the dataset.
+    An edited dataset thus gets a new scorer, while an unchanged one found
+    elsewhere reuses the cached scorer.
+
+    """
+    digest = hashlib.sha1()
+    for parameter in (lingpy.__version__, soundclass, ratio, threshold,
+                      runs, seed):
+        digest.update(repr(parameter).encode('utf-8'))
+        digest.update(b"\t")
+    rows = sorted(
+        (str(lex[idx, "reference"]), str(lex[idx, "doculect"]),
+         str(lex[idx, "concept"]), " ".join(lex[idx, "tokens"]))
+        for idx in lex)
+    for row in rows:
+        digest.update("\t".join(row).encode('utf-8'))
+        digest.update(b"\n")
+    return digest.hexdigest()[:12]
+
+
+RUNS_PER_CHUNK = 500
+
+_worker_lexstat = {}
+
+
+def load_wordlist(input, soundclass, rename_columns):
+    return lingpy.compare.partial.Partial.from_cldf(
+        input, columns=tuple(rename_columns.values()),
+        filter=clean_segments_and_rename(rename_columns),
+        model=lingpy.data.model.Model(soundclass),
+        check=True)
+
+
+def _init_scorer_worker(input, soundclass, rename_columns, included):
+    lex = load_wordlist(input, soundclass, rename_columns)
+    # The random distribution is scaled by the number of form pairs that
+    # entered the correspondence distribution, which the parent computed.
+    lex._included = included
+    _worker_lexstat["lex"] = lex
+
+
+def randist_chunk(lex, runs, seed, keywords):
+    """Compute the random distribution of one chunk of permutation runs.
+
+    The random generators are seeded per chunk, so the result does not
+    depend on which process computes which chunk. `lex` must have computed
+    its correspondence distribution already.
+
+    """
+    random.seed(seed)
+    numpy.random.seed(seed)
+    randist = lex._get_randist(runs=runs, **keywords)
+    return runs, {pair: dict(distribution)
+                  for pair, distribution in randist.items()}
+
+
+def _randist_chunk(task):
+    return randist_chunk(_worker_lexstat["lex"], *task)
+
+
+def parallel_get_scorer(lex, input, soundclass, rename_columns, runs=10000,
+                        processes=None, seed=0, **keywords):
+    """Compute the LexStat scorer of `lex`, with the permutation runs in parallel.
+
+    The correspondence distribution is computed once, in this process. The
+    runs are split into chunks of RUNS_PER_CHUNK, each with its own seed
+    derived from `seed`, and computed in a process pool whose workers load
+    the word list from `input` themselves, or in this process if
+    `processes` is 1. The random distributions of the chunks, each an
+    average over its runs, are averaged weighted by their number of runs,
+    and `lex.get_scorer` then computes the scorer from the two
+    distributions. The result only depends on `seed` and `runs`, not on
+    the number of processes.
+
+    """
+    kw = lex.get_scorer(defaults=True, **keywords)
+    del kw["defaults"], kw["runs"]
+    corrdist = lex._get_corrdist(**kw)
+
+    chunks = [min(RUNS_PER_CHUNK, runs - start)
+              for start in range(0, runs, RUNS_PER_CHUNK)]
+    tasks = [(chunk, seed * len(chunks) + c, kw)
+             for c, chunk in enumerate(chunks)]
+    combined = collections.defaultdict(lambda: collections.defaultdict(float))
+
+    def combine(results):
+        for chunk_runs, randist in results:
+            for pair, distribution in randist.items():
+                for characters, frequency in distribution.items():
+                    combined[pair][characters] += frequency * chunk_runs / runs
+
+    if processes == 1:
+        combine(randist_chunk(lex, *task) for task in tasks)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+                processes, initializer=_init_scorer_worker,
+                initargs=(input, soundclass, rename_columns,
+                          lex._included)) as executor:
+            combine(executor.map(_randist_chunk, tasks))
+
+    lex._get_corrdist = lambda **kwargs: corrdist
+    lex._get_randist = lambda **kwargs: combined
+    try:
+        lex.get_scorer(runs=runs, **keywords)
+    finally:
+        del lex._get_corrdist
+        del lex._get_randist
 
 
 def clean_segments(row):
@@ -38,7 +157,7 @@ def clean_segments(row):
     try:
         segments = row["tokens"]
     except KeyError:
-        segments = [str(bipa[x])
+        segments = [normalize(x)
                     for part in row["ipa"].split(".")
                     for x in tokenizer(part, ipa=True).split()]
     segments.insert(0, "#")
@@ -66,6 +185,344 @@ def clean_segments_and_rename(new_column_names):
     return filter
 
 
+def balanced_shards(sizes, n_shards):
+    """Split concepts into work units of about equal clustering cost.
+
+    Clustering a concept with n forms costs about n² alignments, so assign
+    the concepts, most expensive first, to the currently cheapest shard.
+
+    Parameters
+    ----------
+    sizes : dict
+        concept: number of forms
+    n_shards : int
+
+    Returns
+    -------
+    list of lists of concepts
+
+    >>> balanced_shards({"a": 4, "b": 3, "c": 3, "d": 1}, 2)
+    [['a', 'd'], ['b', 'c']]
+
+    """
+    shards = [[] for _ in range(min(n_shards, len(sizes)))]
+    loads = [(0, s) for s in range(len(shards))]
+    for concept in sorted(sizes, key=lambda c: (-sizes[c], str(c))):
+        load, s = heapq.heappop(loads)
+        shards[s].append(concept)
+        heapq.heappush(loads, (load + sizes[concept] ** 2, s))
+    return shards
+
+
+def anchor_concepts(shard, lects_by_concept, all_lects):
+    """Find further concepts so that the shard contains forms of every lect.
+
+    LexStat's language-specific scorers refer to lects by their position in
+    the whole word list, so a sub-wordlist must contain all lects to use
+    them. The anchors are clustered along with the shard, but their
+    results are discarded.
+
+    The anchors are a greedy cover of the lects missing from the shard, so
+    there are at most as many as there are missing lects, and none if the
+    shard covers all lects already. Shards of more than a few concepts
+    usually do, so the overhead is at most a few concepts per shard.
+
+    """
+    missing = set(all_lects)
+    for concept in shard:
+        missing -= lects_by_concept[concept]
+    anchors = []
+    while missing:
+        concept = max(lects_by_concept,
+                      key=lambda c: (len(lects_by_concept[c] & missing), str(c)))
+        anchors.append(concept)
+        missing -= lects_by_concept[concept]
+    return anchors
+
+
+def _init_cluster_worker(input, soundclass, rename_columns, scorer_file):
+    lex = load_wordlist(input, soundclass, rename_columns)
+    scorers = lingpy.compare.lexstat.LexStat(filename=scorer_file)
+    lex.scorer = scorers.scorer
+    lex.cscorer = scorers.cscorer
+    lex.bscorer = scorers.bscorer
+    _worker_lexstat["lex"] = lex
+
+
+def cluster_shard(lex, shard, anchors, keywords):
+    """Cluster the concepts of one shard of `lex` with the scorer of `lex`.
+
+    Return the cognate IDs and partial cognate IDs of the shard's forms,
+    by form reference, as numbered within the shard.
+
+    """
+    part = sub_wordlist(lex, set(shard) | set(anchors),
+                        cls=lingpy.compare.partial.Partial, model=lex.model)
+    part.scorer = lex.scorer
+    part.cscorer = lex.cscorer
+    part.bscorer = lex.bscorer
+    part.cluster(method='lexstat', ref='cogid', override=True, **keywords)
+    part.partial_cluster(method='lexstat', ref='partialcognateids',
+                         override=True, **keywords)
+    shard = set(shard)
+    cogids, partial_ids = {}, {}
+    for idx in part:
+        if part[idx, "concept"] in shard:
+            cogids[part[idx, "reference"]] = part[idx, "cogid"]
+            partial_ids[part[idx, "reference"]] = list(
+                part[idx, "partialcognateids"])
+    return cogids, partial_ids
+
+
+def _cluster_shard(task):
+    return cluster_shard(_worker_lexstat["lex"], *task)
+
+
+def shard_cognate_ids(lex, input, soundclass, rename_columns, scorer_file,
+                      n_shards, processes=None, concepts=None, offsets=(0, 0),
+                      **keywords):
+    """Cluster the concepts of `lex` in shards in a process pool.
+
+    Concepts (default: all of them) are split into `n_shards` balanced work
+    units (see `balanced_shards`). The workers load the word list from
+    `input` and the scorer from `scorer_file` once, and cluster each of
+    their shards in a sub-wordlist. A single shard, or all shards if
+    `processes` is 1, are clustered in this process instead, with the
+    scorer of `lex`. The shards' cognate IDs and partial
+    cognate IDs are offset to be unique across shards, and to be larger
+    than the `offsets` for cognate IDs and partial cognate IDs.
+
+    Returns
+    -------
+    (dict, dict)
+        Form reference: cognate ID, and form reference: list of partial
+        cognate IDs, for the forms of the clustered concepts
+    """
+    sizes = collections.Counter()
+    lects_by_concept = collections.defaultdict(set)
+    for idx in lex:
+        concept = lex[idx, "concept"]
+        lects_by_concept[concept].add(lex[idx, "doculect"])
+        if concepts is None or concept in concepts:
+            sizes[concept] += 1
+    all_lects = set.union(*lects_by_concept.values())
+    tasks = [(shard, anchor_concepts(shard, lects_by_concept, all_lects),
+              keywords)
+             for shard in balanced_shards(sizes, n_shards)]
+
+    cogids, partial_ids = {}, {}
+    cogid_offset, partial_offset = offsets
+
+    def combine(results):
+        nonlocal cogid_offset, partial_offset
+        for shard_cogids, shard_partial_ids in results:
+            for reference, cogid in shard_cogids.items():
+                cogids[reference] = cogid + cogid_offset
+            cogid_offset += max(shard_cogids.values(), default=0)
+            for reference, ids in shard_partial_ids.items():
+                partial_ids[reference] = [i + partial_offset for i in ids]
+            partial_offset += max(
+                (i for ids in shard_partial_ids.values() for i in ids),
+                default=0)
+
+    if processes == 1 or len(tasks) <= 1:
+        combine(cluster_shard(lex, *task) for task in tasks)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+                processes, initializer=_init_cluster_worker,
+                initargs=(input, soundclass, rename_columns,
+                          scorer_file)) as executor:
+            combine(executor.map(_cluster_shard, tasks))
+    return cogids, partial_ids
+
+
+def sharded_cluster(lex, input, soundclass, rename_columns, scorer_file,
+                    n_shards, processes=None, **keywords):
+    """Cluster `lex` by concept shards in a process pool.
+
+    See `shard_cognate_ids`. The results are stored in `lex` as 'cogid' and
+    'partialcognateids'.
+
+    """
+    cogids, partial_ids = shard_cognate_ids(
+        lex, input, soundclass, rename_columns, scorer_file, n_shards,
+        processes=processes, **keywords)
+    lex.add_entries('cogid', 'reference', lambda reference: cogids[reference],
+                    override=True)
+    lex.add_entries('partialcognateids', 'reference',
+                    lambda reference: partial_ids[reference], override=True)
+
+
+STATE_VERSION = 1
+
+
+def concept_fingerprints(lex):
+    """Hash the forms of each concept.
+
+    The fingerprint of a concept covers the IDs, lects and cleaned segments
+    of its forms, and the set of its lects, so it changes whenever anything
+    the clustering and alignment of the concept depend on changes.
+
+    """
+    rows = collections.defaultdict(list)
+    for idx in lex:
+        rows[lex[idx, "concept"]].append(
+            (str(lex[idx, "reference"]), str(lex[idx, "doculect"]),
+             " ".join(lex[idx, "tokens"])))
+    fingerprints = {}
+    for concept, forms in rows.items():
+        digest = hashlib.sha1()
+        digest.update(" ".join(sorted({lect for _, lect, _ in forms})).encode('utf-8'))
+        digest.update(b"\n")
+        for form in sorted(forms):
+            digest.update("\t".join(form).encode('utf-8'))
+            digest.update(b"\n")
+        fingerprints[str(concept)] = digest.hexdigest()
+    return fingerprints
+
+
+def load_state(filename, parameters, lects):
+    """Load the state of a previous run, if it can be continued.
+
+    The scorer of the previous run is reused for the changed concepts, so
+    that their cognate classes are comparable to the unchanged ones. It
+    refers to lects by position, so new or removed lects, like different
+    parameters or a missing scorer file, need a full run.
+
+    Returns
+    -------
+    dict or None
+        The state, or None if there is none or it does not fit
+    """
+    try:
+        with Path(filename).open(encoding='utf-8') as file:
+            state = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if (state.get("version") != STATE_VERSION or
+            state.get("parameters") != parameters or
+            state.get("lects") != lects or
+            not Path(str(state.get("scorer_file")) + '.tsv').exists()):
+        return None
+    return state
+
+
+def save_state(filename, state):
+    """Write the state of a run atomically, next to its output."""
+    filename = Path(filename)
+    with tempfile.NamedTemporaryFile(
+            "w", encoding='utf-8', dir=str(filename.parent.resolve()),
+            suffix=".tmp", delete=False) as file:
+        json.dump(dict(state, version=STATE_VERSION), file, indent=1)
+    os.replace(file.name, str(filename))
+
+
+def _integers(value):
+    """Read a list of IDs from a word list cell, parsed or not."""
+    if isinstance(value, str):
+        return [int(x) for x in value.split()]
+    if isinstance(value, int):
+        return [value]
+    return [int(x) for x in value]
+
+
+def previous_results(clusters_file, alignments_file):
+    """Read cognate IDs and alignments by form reference from a previous run."""
+    clusters = lingpy.Wordlist(str(clusters_file))
+    cogids, partial_ids = {}, {}
+    for idx in clusters:
+        reference = str(clusters[idx, "reference"])
+        cogids[reference] = _integers(clusters[idx, "cogid"])[0]
+        partial_ids[reference] = _integers(clusters[idx, "partialcognateids"])
+    aligned = lingpy.Wordlist(str(alignments_file))
+    alignments = {str(aligned[idx, "reference"]): aligned[idx, "alignment"]
+                  for idx in aligned}
+    return cogids, partial_ids, alignments
+
+
+def sub_wordlist(lex, concepts, cls=lingpy.Wordlist, **keywords):
+    """Build a word list of the forms of `lex` for the given concepts only.
+
+    The rows are copied, so adding columns to the new word list leaves
+    `lex` unchanged.
+
+    """
+    data = {0: list(lex.columns)}
+    for idx in lex:
+        if lex[idx, "concept"] in concepts:
+            data[idx] = list(lex[idx])
+    return cls(data, **keywords)
+
+
+def changed_concepts(lex, fingerprints, previous):
+    """Find the concepts to recluster in an incremental run.
+
+    These are the concepts whose fingerprint differs from the one in
+    `fingerprints`, the state of the previous run, and the concepts of
+    forms missing from the `previous` results, which cannot be spliced in.
+
+    """
+    cogids, partial_ids, alignments = previous
+    changed = {concept
+               for concept, fingerprint in concept_fingerprints(lex).items()
+               if fingerprints.get(concept) != fingerprint}
+    for idx in lex:
+        reference = str(lex[idx, "reference"])
+        if reference not in cogids or reference not in alignments:
+            changed.add(str(lex[idx, "concept"]))
+    return {lex[idx, "concept"] for idx in lex
+            if str(lex[idx, "concept"]) in changed}
+
+
+def incremental_cluster(lex, changed, previous, input, soundclass,
+                        rename_columns, scorer_file, n_shards=1,
+                        processes=None, **keywords):
+    """Recluster and realign only the changed concepts of `lex`.
+
+    The changed concepts are clustered with the scorer of `lex`, which must
+    be the one of the previous run, in `n_shards` shards (see
+    `shard_cognate_ids`), and get cognate IDs above all previous ones. The
+    forms of all other concepts keep their cognate IDs, partial cognate IDs
+    and alignments from the `previous` results (see `previous_results`).
+    The IDs are stored in `lex` as 'cogid' and 'partialcognateids'.
+
+    Returns
+    -------
+    lingpy.Alignments
+        The alignments of all forms of `lex`
+    """
+    cogids, partial_ids, alignments = (dict(part) for part in previous)
+    if changed:
+        new_cogids, new_partial_ids = shard_cognate_ids(
+            lex, input, soundclass, rename_columns, scorer_file, n_shards,
+            processes=processes, concepts=changed,
+            offsets=(max(cogids.values(), default=0),
+                     max((i for ids in partial_ids.values() for i in ids),
+                         default=0)),
+            **keywords)
+        cogids.update((str(r), c) for r, c in new_cogids.items())
+        partial_ids.update((str(r), i) for r, i in new_partial_ids.items())
+    lex.add_entries('cogid', 'reference',
+                    lambda reference: cogids[str(reference)], override=True)
+    lex.add_entries('partialcognateids', 'reference',
+                    lambda reference: partial_ids[str(reference)],
+                    override=True)
+
+    if changed:
+        realigned = sub_wordlist(
+            lex, changed, cls=lingpy.Alignments, ref="partialcognateids",
+            fuzzy=True)
+        realigned.align(method='progressive')
+        for idx in realigned:
+            alignments[str(realigned[idx, "reference"])] = realigned[
+                idx, "alignment"]
+    alm = lingpy.Alignments(lex, ref="partialcognateids", fuzzy=True)
+    alm.add_entries('alignment', 'reference',
+                    lambda reference: alignments[str(reference)],
+                    override=True)
+    return alm
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
     parser.add_argument("input", default=Path("Wordlist-metadata.json"),
@@ -105,6 +562,28 @@ if __name__ == "__main__":
                         type=float,
                         help="Threshold value for the initial pairs used to"
                         "bootstrap the calculation. (default: 0.7)")
+    parser.add_argument("--runs", default=10000,
+                        type=int,
+                        help="Number of permutation runs for the LexStat"
+                        " scorer. (default: 10000)")
+    parser.add_argument("--seed", default=0,
+                        type=int,
+                        help="Random seed for the permutation runs."
+                        " (default: 0)")
+    parser.add_argument("--processes", default=None,
+                        type=int,
+                        help="Number of worker processes for the permutation"
+                        " runs and sharded clustering. (default: one per CPU)")
+    parser.add_argument("--shards", default=0,
+                        type=int,
+                        help="Cluster the concepts in this many balanced"
+                        " shards in parallel. (default: 0, cluster the whole"
+                        " word list in this process)")
+    parser.add_argument("--incremental", default=False,
+                        action="store_true",
+                        help="Only recluster and realign the concepts whose"
+                        " forms changed since the previous run, and splice"
+                        " them into its output.")
     args = parser.parse_args()
 
     dataset = get_dataset(args.input)
@@ -120,10 +599,7 @@ if __name__ == "__main__":
          dataset["FormTable", "id"].name: "reference",
     }
 
-    lex = lingpy.compare.partial.Partial.from_cldf(
-        args.input, filter=clean_segments_and_rename(rename_columns),
-        model=lingpy.data.model.Model(args.soundclass),
-        check=True)
+    lex = load_wordlist(args.input, args.soundclass, rename_columns)
 
     if args.ratio != 1.5:
         if args.ratio == float("inf"):
@@ -143,32 +619,78 @@ if __name__ == "__main__":
         ratio_str = ""
     if args.initial_threshold != 0.7:
         ratio_str += "-t{:02d}".format(int(args.initial_threshold * 100))
+    parameters = {
+        "soundclass": args.soundclass, "threshold": args.threshold,
+        "cluster_method": args.cluster_method, "gop": args.gop,
+        "mode": args.mode, "ratio": list(ratio_pair),
+        "initial_threshold": args.initial_threshold, "runs": args.runs,
+        "seed": args.seed}
+    fingerprints = concept_fingerprints(lex)
+    lects = sorted({str(lex[idx, "doculect"]) for idx in lex})
+    state_file = Path(args.output + ".state.json")
+    state = None
+    if args.incremental:
+        state = load_state(state_file, parameters, lects)
+    if state is not None:
+        try:
+            previous = previous_results(
+                "auto-clusters.tsv", args.output + ".tsv")
+        except (OSError, KeyError, ValueError):
+            state = None
+
+    if state is not None:
+        scorer_file = state["scorer_file"]
+    else:
+        scorer_file = 'lexstats-{:}-{:s}{:s}'.format(
+            scorer_key(lex, args.soundclass, ratio_pair, args.initial_threshold,
+                       args.runs, args.seed),
+            args.soundclass, ratio_str)
     try:
         scorers_etc = lingpy.compare.lexstat.LexStat(
-            filename='lexstats-{:}-{:s}{:s}.tsv'.format(
-                sha1(args.input),
-                args.soundclass, ratio_str))
+            filename=scorer_file + '.tsv')
         lex.scorer = scorers_etc.scorer
         lex.cscorer = scorers_etc.cscorer
         lex.bscorer = scorers_etc.bscorer
     except (OSError, ValueError):
-        lex.get_scorer(runs=10000, ratio=ratio_pair, threshold=args.initial_threshold)
-        lex.output(
-            'tsv',
-            filename='lexstats-{:}-{:s}{:s}'.format(
-                sha1(args.input),
-                args.soundclass, ratio_str),
-            ignore=[])
-    # For some purposes it is useful to have monolithic cognate classes.
-    lex.cluster(method='lexstat', threshold=args.threshold, ref='cogid',
-                cluster_method=args.cluster_method, verbose=True, override=True,
-                gop=args.gop, mode=args.mode)
-    # But actually, in most cases partial cognates are much more useful.
-    lex.partial_cluster(method='lexstat', threshold=args.threshold,
-                        cluster_method=args.cluster_method, ref='partialcognateids',
-                        override=True, verbose=True, gop=args.gop,
-                        mode=args.mode)
-    lex.output("tsv", filename="auto-clusters")
-    alm = lingpy.Alignments(lex, ref="partialcognateids", fuzzy=True)
-    alm.align(method='progressive')
-    alm.output('tsv', filename=args.output, ignore='all', prettify=False)
+        parallel_get_scorer(
+            lex, args.input, args.soundclass, rename_columns,
+            runs=args.runs, processes=args.processes, seed=args.seed,
+            ratio=ratio_pair, threshold=args.initial_threshold)
+        lex.output('tsv', filename=scorer_file, ignore=[])
+    if state is not None:
+        changed = changed_concepts(lex, state["fingerprints"], previous)
+        print("Reclustering {:d} of {:d} concepts.".format(
+            len(changed), len(fingerprints)), file=sys.stderr)
+        alm = incremental_cluster(
+            lex, changed, previous, args.input, args.soundclass,
+            rename_columns, scorer_file + '.tsv', max(args.shards, 1),
+            processes=args.processes,
+            threshold=args.threshold, cluster_method=args.cluster_method,
+            verbose=False, gop=args.gop, mode=args.mode)
+        lex.output("tsv", filename="auto-clusters")
+        alm.output('tsv', filename=args.output, ignore='all', prettify=False)
+    else:
+        if args.shards:
+            sharded_cluster(
+                lex, args.input, args.soundclass, rename_columns,
+                scorer_file + '.tsv', args.shards, processes=args.processes,
+                threshold=args.threshold, cluster_method=args.cluster_method,
+                verbose=False, gop=args.gop, mode=args.mode)
+        else:
+            # For some purposes it is useful to have monolithic cognate classes.
+            lex.cluster(method='lexstat', threshold=args.threshold, ref='cogid',
+                        cluster_method=args.cluster_method, verbose=True,
+                        override=True, gop=args.gop, mode=args.mode)
+            # But actually, in most cases partial cognates are much more useful.
+            lex.partial_cluster(method='lexstat', threshold=args.threshold,
+                                cluster_method=args.cluster_method,
+                                ref='partialcognateids', override=True,
+                                verbose=True, gop=args.gop, mode=args.mode)
+        lex.output("tsv", filename="auto-clusters")
+        alm = lingpy.Alignments(lex, ref="partialcognateids", fuzzy=True)
+        alm.align(method='progressive')
+        alm.output('tsv', filename=args.output, ignore='all', prettify=False)
+
+    save_state(state_file, {
+        "parameters": parameters, "lects": lects, "scorer_file": scorer_file,
+        "fingerprints": fingerprints})
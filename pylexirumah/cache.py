@@ -0,0 +1,127 @@
+"""On-disk caches of derived data, and incremental readers of growing files.
+
+Compiled profiles, indexes and the state of incremental readers are pickled
+in `pylexirumah.cache_directory`, one file per source file, named after the
+hash of the source file's absolute path. Cache files are replaced
+atomically, so concurrent processes can share the cache directory, and a
+missing, corrupt or outdated cache file is just a cache miss.
+
+"""
+
+import os
+import pickle
+import hashlib
+import tempfile
+
+from clldutils.path import Path
+
+from pylexirumah import cache_directory
+
+# Everything unpickling a file written by an older version may raise
+CACHE_ERRORS = (OSError, EOFError, ValueError, KeyError, TypeError,
+                AttributeError, ImportError, pickle.UnpicklingError)
+
+
+def cache_file(kind, path, cache_directory=cache_directory):
+    """The cache file for data of the given kind derived from path."""
+    return Path(cache_directory) / kind / "{:}.pickle".format(
+        hashlib.sha1(str(Path(path).resolve()).encode("utf-8")).hexdigest())
+
+
+def load_cache(file, version):
+    """Load a cache entry, or return None if there is no valid one.
+
+    Returns
+    -------
+    dict or None
+        The entry, if the file exists, can be unpickled and was written with
+        this version
+    """
+    try:
+        with Path(file).open("rb") as cache:
+            entry = pickle.load(cache)
+        if entry["version"] == version:
+            return entry
+    except CACHE_ERRORS:
+        pass
+    return None
+
+
+def save_cache(file, version, entry):
+    """Write a cache entry atomically.
+
+    The cache is an optimization only, so failing to write it is not an
+    error.
+
+    """
+    file = Path(file)
+    try:
+        os.makedirs(str(file.parent), exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                dir=str(file.parent), suffix=".tmp", delete=False) as cache:
+            pickle.dump(dict(entry, version=version), cache,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(cache.name, str(file))
+    except OSError:
+        pass
+
+
+class AppendOnlyFile:
+    """The position of an incremental reader of an append-only file.
+
+    The reader remembers how much of the file it has processed, the hash
+    of that prefix and the size and modification time of the file. If
+    those are unchanged, `appended` returns without reading the file. Else
+    it reads the file and checks the hash of the processed prefix. That
+    check reads the whole file, but only the rows after the prefix need
+    parsing. If the prefix changed, or was not a whole number of lines,
+    or the reader is used with a different `key` (eg. other columns), the
+    reader is reinitialized and the whole file counts as appended.
+
+    Subclasses keep their derived state in attributes set by `__init__`,
+    which must take no arguments.
+
+    """
+    def __init__(self):
+        self.key = None
+        self.size = 0
+        self.prefix_hash = hashlib.sha1().hexdigest()
+        self.signature = None
+
+    def appended(self, path, key=None, content=None):
+        """Find the bytes appended to the file since the last call.
+
+        Parameters
+        ----------
+        path : str or Path
+        key : hashable
+            Anything else the derived state depends on
+        content : bytes, optional
+            The content of the file, if the caller has read it already
+
+        Returns
+        -------
+        (int, bytes) or None
+            The offset of the first byte to process, and the whole file
+            content; None if the file is unchanged
+        """
+        stat = Path(path).stat()
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if key == self.key and signature == self.signature:
+            return None
+        if content is None:
+            with Path(path).open("rb") as file:
+                content = file.read()
+        digest = hashlib.sha1(content[:self.size])
+        if (key != self.key or len(content) < self.size or
+                digest.hexdigest() != self.prefix_hash or
+                (self.size and content[self.size - 1:self.size] != b"\n")):
+            self.__init__()
+            self.key = key
+            digest = hashlib.sha1()
+        start = self.size
+        digest.update(content[start:])
+        self.size = len(content)
+        self.prefix_hash = digest.hexdigest()
+        self.signature = signature
+        return start, content
@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 
 import sys
+import hashlib
 import argparse
+import functools
 import itertools
+import concurrent.futures
 from collections import OrderedDict
 from clldutils.path import Path
 import numpy as np
@@ -11,15 +14,30 @@ import csvw
 import xlrd
 import pycldf
 
-import pyclts
 from segments import Tokenizer, Profile
 
-bipa = pyclts.TranscriptionSystem("bipa")
-sounds = list(bipa.sounds)
-sounds.extend([])
-tokenizer = Tokenizer(Profile(*({"Grapheme": x, "mapping": x} for x in sounds)))
+from pylexirumah import get_dataset, repository, cache_directory
+from pylexirumah.cache import cache_file, load_cache, save_cache
+from pylexirumah.diagnostics import Diagnostic, DiagnosticSink
+from pylexirumah.sounds import segment, bipa
+from pylexirumah.query import iter_forms
 
-from pylexirumah import get_dataset, repository
+_tokenizers = {}
+
+
+def bipa_tokenizer():
+    """The tokenizer for all BIPA sounds, built on first use.
+
+    Building it loads pyclts, so importing this module does not, and
+    worker processes only pay for it if they segment forms.
+
+    """
+    try:
+        return _tokenizers["bipa"]
+    except KeyError:
+        tokenizer = _tokenizers["bipa"] = Tokenizer(Profile(
+            *({"Grapheme": x, "mapping": x} for x in bipa().sounds)))
+        return tokenizer
 
 
 def needleman_wunsch(x, y, lodict={}, gop=-2.5, gep=-1.75, local=False, indel=''):
@@ -125,10 +143,98 @@ def resolve_brackets(string):
         yield string
 
 
+def compile_patterns(patterns):
+    """Compile a list of patterns into an Aho-Corasick automaton.
+
+    Return the automaton as a list of states, each a tuple (goto, fail,
+    matches): `goto` maps characters to the next state, `fail` is the state
+    to fall back to, and `matches` lists the (length, index) pairs of all
+    patterns that end in this state (including through fallbacks). Empty
+    patterns can never match and are left out.
+
+    """
+    goto = [{}]
+    fail = [0]
+    matches = [[]]
+    for index, pattern in enumerate(patterns):
+        if not pattern:
+            continue
+        state = 0
+        for character in pattern:
+            try:
+                state = goto[state][character]
+            except KeyError:
+                goto[state][character] = state = len(goto)
+                goto.append({})
+                fail.append(0)
+                matches.append([])
+        matches[state].append((len(pattern), index))
+
+    # Breadth-first search to find the fallback states.
+    queue = list(goto[0].values())
+    for state in queue:
+        for character, next_state in goto[state].items():
+            queue.append(next_state)
+            fallback = fail[state]
+            while fallback and character not in goto[fallback]:
+                fallback = fail[fallback]
+            fail[next_state] = goto[fallback].get(character, 0)
+            matches[next_state] = matches[next_state] + matches[fail[next_state]]
+    return [(g, f, tuple(m)) for g, f, m in zip(goto, fail, matches)]
+
+
+def apply_automaton(automaton, patterns, replacements, line):
+    """Replace patterns in line, first pattern in the list first.
+
+    At each position of `line`, find the first of the `patterns` (by index)
+    that starts there, replace it by the corresponding entry of
+    `replacements`, and continue after it. Where no pattern starts, copy one
+    character. All matches are found in one pass through the `automaton`
+    compiled from `patterns`.
+
+    """
+    n = len(line)
+    first_match = [None] * n
+    state = 0
+    for position, character in enumerate(line):
+        goto, fail, _ = automaton[state]
+        while state and character not in goto:
+            state = fail
+            goto, fail, _ = automaton[state]
+        state = goto.get(character, 0)
+        for length, index in automaton[state][2]:
+            start = position + 1 - length
+            if first_match[start] is None or index < first_match[start]:
+                first_match[start] = index
+
+    output = []
+    start = 0
+    while start < n:
+        index = first_match[start]
+        if index is None:
+            output.append(line[start])
+            start += 1
+        else:
+            output.append(replacements[index])
+            start += len(patterns[index])
+    return "".join(output)
+
+
 class Transducer:
     def __init__(self, rules):
         self.rules = rules
         self.wordboundary = "_"
+        self.befores = [before for before, after in rules]
+        self.afters = [after for before, after in rules]
+        self._forward = None
+        self._backward = None
+
+    def compile(self):
+        """Compile the automata for both directions now, not on first use."""
+        if self._forward is None:
+            self._forward = compile_patterns(self.befores)
+        if self._backward is None:
+            self._backward = compile_patterns(self.afters)
 
     def __repr__(self):
         return "Transducer({:})".format(self.rules)
@@ -145,6 +251,10 @@ class Transducer:
         of the string. Note this is different to applying each rule in order
         whereever it fits, see the examples!
 
+        The rules are compiled into an Aho-Corasick automaton on first use, so
+        applying the transducer takes time linear in the length of the line
+        and the number of matches, independent of the number of rules.
+
         Examples
         --------
 
@@ -157,28 +267,12 @@ class Transducer:
         'qaab'
 
         """
+        if self._forward is None:
+            self._forward = compile_patterns(self.befores)
         line = self.wordboundary + line + self.wordboundary
-        start = 0
-        output = ""
-        while start < len(line):
-            oldStart = start
-            for (left, right) in self.rules:
-                match = False
-                end = len(line) + 1
-                while end > start:
-                    if left == line[start:end]:
-                        output += right
-                        start = end
-                        match = True
-                        break
-                    else:
-                        end -= 1
-                if match:
-                    break
-            if start == oldStart:
-                output += line[start]
-                start += 1
-        return output.strip(self.wordboundary)
+        return apply_automaton(
+            self._forward, self.befores, self.afters, line).strip(
+                self.wordboundary)
 
     def undo(self, line):
         """Undo – as much as possible, due to mergers – the effect this.
@@ -197,64 +291,500 @@ class Transducer:
         True
 
         """
+        if self._backward is None:
+            self._backward = compile_patterns(self.afters)
         line = self.wordboundary + line + self.wordboundary
-        start = 0
-        output = ""
-        while start < len(line):
-            oldStart = start
-            for (right, left) in self.rules:
-                match = False
-                end = len(line) + 1
-                while end > start:
-                    if left == line[start:end]:
-                        output += right
-                        start = end
-                        match = True
-                        break
-                    else:
-                        end -= 1
-                if match:
-                    break
-            if start == oldStart:
-                output += line[start]
-                start += 1
-        return output.strip(self.wordboundary)
+        return apply_automaton(
+            self._backward, self.afters, self.befores, line).strip(
+                self.wordboundary)
+
+
+def parse_orthographic_profile(text):
+    """Parse the text of an orthographic profile into a Transducer.
+
+    Every non-empty line (after removing `//` comments) must contain one
+    rule, the text to replace and its replacement separated by a tab.
+
+    >>> parse_orthographic_profile("// Comment\\nng\\tŋ // velar nasal\\nc\\tt͡ʃ\\n")
+    Transducer([('ng', 'ŋ '), ('c', 't͡ʃ')])
+
+    """
+    substitutions = []
+    for rule in text.split("\n"):
+        rule = rule.strip("\n")
+        rule = rule.strip("\r")
+        if "//" in rule:
+            rule = rule[:rule.index("//")]
+        if not rule.strip():
+            continue
+        if "[" in rule or "#def" in rule:
+            raise NotImplementedError("Context groups are not supported yet.")
+        try:
+            before, after = rule.split("\t")
+        except ValueError:
+            print(rule)
+            raise
+        substitutions.append((before, after))
+    return Transducer(substitutions)
+
+
+PROFILE_CACHE_VERSION = 1
+
+
+def cached_orthographic_profile(path, cache_directory=cache_directory):
+    """Load an orthographic profile through the on-disk cache of compiled profiles.
+
+    Each profile is cached as a pickle of its compiled Transducer, in a file
+    named after the hash of its absolute path. The cache entry records the
+    profile's modification time, size and content hash: If the modification
+    time and size are unchanged, the cached transducer is used without
+    reading the profile. Otherwise, the profile is only parsed again if its
+    content has changed.
+
+    Cache files are replaced atomically, so concurrent processes (eg. the
+    workers of a process pool) can share the cache directory safely.
+
+    """
+    path = Path(path)
+    file = cache_file("profiles", path, cache_directory)
+    stat = path.stat()
+    entry = load_cache(file, PROFILE_CACHE_VERSION)
+    if entry is not None and (
+            entry["mtime"], entry["size"]) == (stat.st_mtime_ns, stat.st_size):
+        return entry["transducer"]
+
+    content = path.read_bytes()
+    content_hash = hashlib.sha1(content).hexdigest()
+    if entry is not None and entry["sha1"] == content_hash:
+        transducer = entry["transducer"]
+    else:
+        transducer = parse_orthographic_profile(content.decode("utf-8"))
+        transducer.compile()
+
+    save_cache(file, PROFILE_CACHE_VERSION, {
+        "mtime": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha1": content_hash,
+        "transducer": transducer})
+    return transducer
+
+
+_transducers = {}
+
+
+def load_orthographic_profile(transducer_files, root=repository.parent,
+                              transducer_cache=None, cache_directory=cache_directory):
+    """Load the transducers of a list of orthographic profiles.
 
+    Profiles are cached in memory in `transducer_cache` (by default, for the
+    whole process) by root and path, and compiled profiles are cached on
+    disk in `cache_directory`, see `cached_orthographic_profile`. Set
+    `cache_directory` to None to always parse the profile files.
 
-def load_orthographic_profile(transducer_files, root=repository.parent, transducer_cache={}):
+    """
     if transducer_files is None:
         return None
+    if transducer_cache is None:
+        transducer_cache = _transducers
 
     orthographic_profile = []
     for file in transducer_files:
         if not file:
             continue
+        key = (str(root), file)
         try:
-            transducer_cache[file]
+            transducer_cache[key]
         except KeyError:
             # That file is not in our cache yet, we have to load it and
             # turn it into a function.
-            substitutions = []
-            for rule in (root / file).open():
-                rule = rule.strip("\n")
-                rule = rule.strip("\r")
-                if "//" in rule:
-                    rule = rule[:rule.index("//")]
-                if not rule.strip():
-                    continue
-                if "[" in rule or "#def" in rule:
-                    raise NotImplementedError("Context groups are not supported yet.")
-                try:
-                    before, after = rule.split("\t")
-                except ValueError:
-                    print(rule)
-                    raise
-                substitutions.append((before, after))
-            transducer_cache[file] = Transducer(substitutions)
-        orthographic_profile.append(transducer_cache[file])
+            if cache_directory is None:
+                with (root / file).open(encoding="utf-8") as profile:
+                    transducer_cache[key] = parse_orthographic_profile(
+                        profile.read())
+            else:
+                transducer_cache[key] = cached_orthographic_profile(
+                    root / file, cache_directory)
+        orthographic_profile.append(transducer_cache[key])
     return orthographic_profile
 
 
+class Pipeline:
+    """A memoised chain of transducers, applied first to last.
+
+    Calling the pipeline applies all its transducers in turn, `undo` undoes
+    them in reverse order. Most forms of a lect share their substrings and
+    checking runs over the same forms repeatedly, so the results of both
+    directions are memoized per input string in a bounded LRU cache.
+
+    The stages are not fused into one automaton: a string that is not in
+    the cache takes one pass per transducer. Every transducer pads the line
+    with word boundaries and strips them again, including those its rules
+    produce, so a fused automaton would not be equivalent in general.
+
+    >>> p = Pipeline([Transducer([("qq", "a")]), Transducer([("aq", "b")])])
+    >>> p("qaqqqqq")
+    'qaab'
+    >>> p.undo("qb")
+    'qqqq'
+
+    """
+    def __init__(self, transducers, maxsize=2 ** 16):
+        self.transducers = tuple(transducers)
+        self.forward = functools.lru_cache(maxsize)(self._forward)
+        self.backward = functools.lru_cache(maxsize)(self._backward)
+
+    def __repr__(self):
+        return "Pipeline({:})".format(list(self.transducers))
+
+    def __str__(self):
+        return " ".join(str(t) for t in self.transducers)
+
+    def __len__(self):
+        return len(self.transducers)
+
+    def __iter__(self):
+        return iter(self.transducers)
+
+    def __reversed__(self):
+        return reversed(self.transducers)
+
+    def _forward(self, line):
+        for transducer in self.transducers:
+            line = transducer(line)
+        return line
+
+    def _backward(self, line):
+        for transducer in reversed(self.transducers):
+            line = transducer.undo(line)
+        return line
+
+    def __call__(self, line):
+        """Apply all transducers to line."""
+        return self.forward(line)
+
+    def undo(self, line):
+        """Undo, as much as possible, all transducers on line."""
+        return self.backward(line)
+
+
+_pipelines = {}
+
+
+def load_pipeline(transducer_files, root=repository.parent, pipeline_cache=None,
+                  cache_directory=cache_directory):
+    """Load a chain of orthographic profiles as one memoised Pipeline.
+
+    Pipelines are cached (by default, for the whole process) by the root and
+    the tuple of profile paths, so all lects and sources with the same chain
+    share one pipeline and its memoized results. The profiles are loaded
+    through `cache_directory`, see `load_orthographic_profile`. Return None
+    if transducer_files is None, like load_orthographic_profile.
+
+    """
+    if transducer_files is None:
+        return None
+    if pipeline_cache is None:
+        pipeline_cache = _pipelines
+    files = tuple(file for file in transducer_files if file)
+    key = (str(root), files)
+    try:
+        return pipeline_cache[key]
+    except KeyError:
+        pipeline = pipeline_cache[key] = Pipeline(
+            load_orthographic_profile(files, root=root,
+                                      cache_directory=cache_directory))
+        return pipeline
+
+
+class Columns:
+    """The names of the FormTable columns the checks need."""
+    def __init__(self, dataset):
+        self.segments = dataset["FormTable", "segments"].name
+        self.source = dataset["FormTable", "source"].name
+        self.language = dataset["FormTable", "languageReference"].name
+        self.value = dataset["FormTable", "value"].name
+        self.form = dataset["FormTable", "form"].name
+        self.id = dataset["FormTable", "id"].name
+        self.orth = "Local_Orthography" # This property is not codified by CLDF
+
+
+def main_source_of(line, columns):
+    """Return the line's main source, that is, the first entry in its sources."""
+    try:
+        return line[columns.source][0]
+    except (IndexError, KeyError):
+        return None
+
+
+def check_form(line, orthographic_profile, language_orthography, columns,
+               step=("report", "override", "fill"), check_stress=False):
+    """Check one form's value, form, segments and orthography for consistency.
+
+    Compare the form's original value, converted by the `orthographic_profile`
+    (a Pipeline, or None for idiosyncratic orthographies) of its main source,
+    with the phonetic form, the phonetic form with its BIPA segments, and
+    the phonetic form with the local orthography described by the
+    `language_orthography` Pipeline. `step` says, for each of these three
+    checks, whether to keep the data <quiet>, <report> differences,
+    <override> differences or <fill> empty cells. The `line` is modified in
+    place accordingly.
+
+    This function depends on nothing but its arguments, so it can run in a
+    worker process.
+
+    Returns
+    -------
+    list of Diagnostic
+        The discrepancies found
+
+    """
+    if check_stress:
+        def drop_stress(string):
+            return string
+    else:
+        def drop_stress(string):
+            return string and string.replace("ˈ", "").replace("ˌ", "")
+    c_segments, c_value, c_form = columns.segments, columns.value, columns.form
+    c_id, c_orth = columns.id, columns.orth
+
+    messages = []
+
+    def message(step, category, expected, given, text):
+        messages.append(Diagnostic(
+            line[c_id], step, category, expected, given, text))
+
+    if main_source_of(line, columns) is None:
+        message("source", "source-missing", None, None,
+                "Source not found for form {:}".format(line[c_id]))
+
+    if not line[c_value] or line[c_value] == '-':
+        if step[1] == "quiet":
+            pass
+        else:
+            if line[c_form]:
+                message("form", "form-without-value", None, line[c_form],
+                        "Form {:} is not given in source, but had a form "
+                        "{:} specified.".format(line[c_id], line[c_form]))
+            line[c_form] = None
+
+    if step[0] == 'quiet':
+        form = line[c_form] or ''
+    else:
+        if orthographic_profile is None:
+            # There is no way to do automatic transcription: Check that a form is given.
+            form = line[c_form] or ''
+            if not form:
+                message(
+                    "form", "form-missing-idiosyncratic", None, None,
+                    "Form {:} has ideosyncratic orthography and original value"
+                    " <{:}>, but no form was given.".format(line[c_id], line[c_value]))
+        else:
+            # Apply substitutions to form
+            form = orthographic_profile((line[c_value] or '').strip())
+
+        if form != line[c_form]:
+            resolutions = [drop_stress(r) for r in resolve_brackets(form)]
+            if len(resolutions) > 1 and drop_stress(line[c_form]) in resolutions:
+                variant = resolutions.index(drop_stress(line[c_form]))
+                resolution = list(resolve_brackets(form))[variant]
+                if len(resolution) > len(line[c_form]):
+                    message("form", "form-bracket-compromise", resolution, line[c_form],
+                            "Form {:} has original value <{:}>, which contains brackets. Canonically, it would be [{:}] according to the orthography. Variant form [{:}] was given explicitly. Taking form [{:}] as compromise.".format(line[c_id], line[c_value], form, line[c_form], resolution))
+                    form = resolution
+                else:
+                    message("form", "form-bracket-variant", form, line[c_form],
+                            "Form {:} has original value <{:}>, which contains brackets. Canonically, it would be [{:}] according to the orthography. Variant form [{:}] was given explicitly.".format(line[c_id], line[c_value], form, line[c_form]))
+                    form = line[c_form]
+            elif not line[c_form]:
+                if len(resolutions) > 1:
+                    form = [drop_stress(r) for r in resolve_brackets(form)][0]
+                message(
+                    "form", "form-missing", form, None,
+                    "Form {:} has original value <{:}>, which corresponds to"
+                    " [{:}] according to the orthography; no form given."
+                    "".format(line[c_id], line[c_value], form, line[c_form]))
+            elif line[c_form] != drop_stress(form):
+                message(
+                    "form", "form-mismatch", form, line[c_form],
+                    "Form {:} has original value <{:}>, which should correspond to"
+                    " [{:}] according to the orthography, but form [{:}] was given."
+                    "".format(line[c_id], line[c_value], form, line[c_form]))
+
+        if step[0] == "override" or (step[0] == "fill" and not line[c_form]):
+            line[c_form] = form
+
+    # Segment form and check with BIPA The segments cannot deal cleanly with
+    # suprasegmentals (syllable boundaries, syllable stress), so those are
+    # ignored explicitly or implicitly.
+    if step[1] == "quiet":
+        segments = [segment(x) for x in line[c_segments]]
+    else:
+        segments = [segment(x)
+                    for part in (line[c_form] or '').split(".")
+                    for x in bipa_tokenizer()(part, ipa=True).split()]
+        for s in segments:
+            if not s.known:
+                message(
+                    "segments", "segment-not-bipa", None, s.grapheme,
+                    "Form {:} [{:}] contains non-BIPA segment '{:}'.".format(
+                        line[c_id], form, s.grapheme))
+
+        if (line[c_segments]) and ([segment(x).normalized for x in line[c_segments]] !=
+            [str(x) for x in segments]):
+                message(
+                    "segments", "segments-mismatch",
+                    " ".join(map(str, segments)),
+                    " ".join([s or '' for s in line[c_segments]]),
+                    "Form {:} has form [{:}], which should correspond to segments"
+                    " [{:}], but segments [{:}] were given."
+                    "".format(
+                        line[c_id],
+                        line[c_form],
+                        " ".join(map(str, segments)),
+                        " ".join([s or '' for s in line[c_segments]])))
+
+        if step[1] == "override" or (step[1] == "fill" and not line[c_segments]):
+            # Plain strings, so that the row can be sent between processes.
+            line[c_segments] = [str(s) for s in segments]
+
+    if step[2] == "quiet":
+        pass
+    else:
+        language_orthography = language_orthography or load_pipeline([])
+
+        # Check the form's orthography.
+        if not language_orthography:
+            if not line[c_orth]:
+                message("orthography", "orthography-underivable",
+                        None, None,
+                        "Form {:} [{:}] is not given in the local orthography,"
+                        " and no way to derive it was given.".format(
+                            line[c_id], line[c_form]))
+
+        # For checking, transform the local orthography to the form by
+        # applying the language's orthography.
+        orth_form = line[c_orth] or ""
+        match = False
+        if orth_form:
+            expected_form = language_orthography(orth_form)
+
+            if drop_stress(expected_form) == drop_stress(line[c_form]):
+                match = True
+
+        # If that does not work, try tranforming the form to the local
+        # orthography by reverse-applying the language's orthography.
+        expected_orth = language_orthography.undo(line[c_form])
+        expected_orth = expected_orth.replace("_", " ").replace("+", "-").strip()
+
+        if match:
+            pass
+        elif expected_orth != orth_form and orth_form:
+            message(
+                "orthography", "orthography-mismatch", expected_orth, orth_form,
+                "Form {:} is given in the local orthography as <{:}>, but"
+                " phonetics [{:}] would correspond to <{:}>.".format(
+                    line[c_id], line[c_orth], form, expected_orth))
+        elif orth_form:
+            pass
+        else:
+            message(
+                "orthography", "orthography-missing", expected_orth, None,
+                "Form {:} is not given in the local orthography. From its"
+                " phonetics [{:}], taking <{:}>.".format(
+                    line[c_id], form, expected_orth))
+
+        if step[2] == "override" or (step[2] == "fill" and not line[c_orth]):
+            line[c_orth] = expected_orth
+
+    return messages
+
+
+def shard_forms(rows, columns, match=None):
+    """Split FormTable rows into shards of consecutive rows with the same main source.
+
+    Yield (main source, rows) pairs, where rows is a list of (row, check)
+    pairs. If `match` is given, rows that do not contain it in any column are
+    not to be checked, and are kept in the shard they appear in.
+
+    """
+    main_source = None
+    shard = []
+    for line in rows:
+        if match:
+            for value in line.values():
+                if match in str(value):
+                    break
+            else:
+                shard.append((line, False))
+                continue
+
+        source = main_source_of(line, columns)
+        if source != main_source:
+            if shard:
+                yield main_source, shard
+            main_source = source
+            shard = []
+        shard.append((line, True))
+    if shard:
+        yield main_source, shard
+
+
+_worker_settings = {}
+
+
+def _init_worker(settings):
+    _worker_settings.update(settings)
+
+
+def check_shard(shard):
+    """Check all forms of one shard, see `shard_forms`.
+
+    The orthographies and checking options are taken from the settings the
+    worker was initialized with. Return the original rows, the checked rows
+    (including those not to be checked) and the messages for the shard, in
+    order.
+
+    """
+    transducer_files, rows = shard
+    settings = _worker_settings
+    orthographic_profile = load_pipeline(transducer_files)
+    original_lines, new_lines, messages = [], [], []
+    for line, check in rows:
+        if not check:
+            new_lines.append(line)
+            continue
+        original_lines.append(line.copy())
+        messages.extend(check_form(
+            line,
+            orthographic_profile,
+            load_pipeline(settings["language_orthographies"].get(
+                line[settings["columns"].language])),
+            settings["columns"],
+            step=settings["step"],
+            check_stress=settings["check_stress"]))
+        new_lines.append(line)
+    return original_lines, new_lines, messages
+
+
+def check_shards(shards, settings, processes=None, chunksize=4):
+    """Check shards of forms, in parallel if processes != 1.
+
+    Yield the results of `check_shard` in the order of the shards, whatever
+    order the workers finish them in.
+
+    """
+    if processes == 1:
+        _init_worker(settings)
+        for shard in shards:
+            yield check_shard(shard)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+                processes, initializer=_init_worker,
+                initargs=(settings,)) as executor:
+            for result in executor.map(check_shard, shards, chunksize=chunksize):
+                yield result
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Import word lists from a new source into LexiRumah.")
     parser.add_argument("directory", nargs="?",
@@ -278,8 +808,31 @@ if __name__ == "__main__":
                         " in stress marking.")
     parser.add_argument("--match",
                         default=None,
-                        help="Check only forms in which one of the columns"
-                        " given has this substring.")
+                        help="Check only forms in which the raw text of one"
+                        " of the cells of the FormTable row, as written in"
+                        " the CSV file, contains this substring. List cells"
+                        " are matched with their separators, other cells"
+                        " before any conversion.")
+    parser.add_argument("--processes",
+                        default=None, type=int,
+                        help="Number of worker processes to check forms in."
+                        " (default: one per CPU)")
+    parser.add_argument("--diagnostics",
+                        default=None, type=argparse.FileType("w"),
+                        help="File to write the diagnostics to."
+                        " (default: standard output)")
+    parser.add_argument("--diagnostics-format",
+                        default="text", choices=DiagnosticSink.formats,
+                        help="Write diagnostics as plain messages, JSON lines"
+                        " or CSV. (default: text)")
+    parser.add_argument("--cap",
+                        default=None, type=int,
+                        help="Write at most this many diagnostics per category."
+                        " All of them are counted in the summary.")
+    parser.add_argument("--sample",
+                        default=None, type=float,
+                        help="Write only this fraction of the diagnostics,"
+                        " chosen at random with a fixed seed.")
 
     parser.add_argument(
         "--step",
@@ -291,12 +844,6 @@ if __name__ == "__main__":
         entries from these options. (Default: report override fill)""")
     args = parser.parse_args()
 
-    if args.check_stress:
-        def drop_stress(string):
-            return string
-    else:
-        def drop_stress(string):
-            return string and string.replace("ˈ", "").replace("ˌ", "")
     if args.override == 'none':
         def maybe_extend(collection, new, old):
             collection.extend(old)
@@ -328,9 +875,9 @@ if __name__ == "__main__":
             for new_row, old_row in zip(new, old):
                 try:
                     if new_row != old_row:
-                        old_row[c_source].insert(0, "corr")
+                        old_row[columns.source].insert(0, "corr")
                 except AttributeError:
-                    old_row[c_source].insert(0, "corr")
+                    old_row[columns.source].insert(0, "corr")
                 collection.append(old_row)
 
     dataset = get_dataset(args.wordlist)
@@ -347,215 +894,69 @@ if __name__ == "__main__":
         if not transducer_files:
             language_orthographies[line[c_languageid]] = None
         else:
-            language_orthographies[line[c_languageid]] = load_orthographic_profile(transducer_files)
-
-    transcription_systems = {None: None}
-
-    c_segments = dataset["FormTable", "segments"].name
-    c_source = dataset["FormTable", "source"].name
-    c_language = dataset["FormTable", "languageReference"].name
-    c_value = dataset["FormTable", "value"].name
-    c_form = dataset["FormTable", "form"].name
-    c_value = dataset["FormTable", "value"].name
-    c_id = dataset["FormTable", "id"].name
-    c_orth = "Local_Orthography" # This property is not codified by CLDF
+            language_orthographies[line[c_languageid]] = transducer_files
 
-    message = print
+    columns = Columns(dataset)
 
-    lines = []
-    original_lines_of_this_source = []
-    new_lines_of_this_source = []
-    previous_source = None
-    for line in dataset["FormTable"].iterdicts():
-        # Load the line's main source, that is, the first entry in the sources list.
-
-        if args.match:
-            for value in line.values():
-                if args.match in str(value):
-                    break
-            else:
-                new_lines_of_this_source.append(line)
-                continue
+    diagnostics = DiagnosticSink(
+        args.diagnostics, format=args.diagnostics_format,
+        cap=args.cap, sample=args.sample)
 
-        try:
-            main_source = line[c_source][0]
-        except (IndexError, KeyError):
-            main_source = None
-            message("Source not found for form {:}".format(line[c_id]))
-
-        if main_source != previous_source:
-            maybe_extend(
-                lines,
-                new_lines_of_this_source,
-                original_lines_of_this_source)
-            original_lines_of_this_source = []
-            new_lines_of_this_source = []
-            previous_source = main_source
-            print(main_source)
-
-        original_lines_of_this_source.append(line.copy())
-
-        if not line[c_value] or line[c_value] == '-':
-            if args.step[1] == "quiet":
-                pass
-            else:
-                if line[c_form]:
-                    message("Form {:} is not given in source, but had a form "
-                            "{:} specified.".format(line[c_id], line[c_form]))
-                line[c_form] = None
+    transcription_systems = {None: None}
 
-        # Load the orthographic profile of that main source.
+    def source_profile(main_source):
+        """Look up the orthographic profile files of a source."""
         try:
             # First, see whether we have it in cache
-            orthographic_profile = transcription_systems[main_source]
+            return transcription_systems[main_source]
         except KeyError:
-            # Otherwise, look up the name of the orthographic profile specified in
-            # the source metadata.
-            source = dataset.sources[main_source]
-            try:
-                transducer_files = source["orthographic_profile"].split(":")
-            except KeyError:
-                # It is permitted to not specify an orthographic profile in a
-                # source. Then we assume the source is in ideosyncratic and rely on
-                # forms being given explicitly. NOTE how this is different from
-                # specifying an empty orthographic profile: An empty profile means
-                # that no transducers are applied, i.e. that the data is already in
-                # IPA.
-                transducer_files = None
-
-            # Now we get the list of transducer functions to apply.
-            orthographic_profile = load_orthographic_profile(transducer_files)
-            if orthographic_profile:
-                print(*(str(o) for o in orthographic_profile))
-            transcription_systems[main_source] = orthographic_profile
-
-        if args.step[0] == 'quiet':
-            form = line[c_form] or ''
-        else:
-            if orthographic_profile is None:
-                # There is no way to do automatic transcription: Check that a form is given.
-                form = line[c_form] or ''
-                if not form:
-                    message(
-                        "Form {:} has ideosyncratic orthography and original value"
-                        " <{:}>, but no form was given.".format(line[c_id], line[c_value]))
-            else:
-                # Apply substitutions to form
-                form = (line[c_value] or '').strip()
-                for transducer in orthographic_profile:
-                    form = transducer(form)
-
-            if form != line[c_form]:
-                resolutions = [drop_stress(r) for r in resolve_brackets(form)]
-                if len(resolutions) > 1 and drop_stress(line[c_form]) in resolutions:
-                    variant = resolutions.index(drop_stress(line[c_form]))
-                    resolution = list(resolve_brackets(form))[variant]
-                    if len(resolution) > len(line[c_form]):
-                        message("Form {:} has original value <{:}>, which contains brackets. Canonically, it would be [{:}] according to the orthography. Variant form [{:}] was given explicitly. Taking form [{:}] as compromise.".format(line[c_id], line[c_value], form, line[c_form], resolution))
-                        form = resolution
-                    else:
-                        message("Form {:} has original value <{:}>, which contains brackets. Canonically, it would be [{:}] according to the orthography. Variant form [{:}] was given explicitly.".format(line[c_id], line[c_value], form, line[c_form]))
-                        form = line[c_form]
-                elif not line[c_form]:
-                    if len(resolutions) > 1:
-                        form = [drop_stress(r) for r in resolve_brackets(form)][0]
-                    message(
-                        "Form {:} has original value <{:}>, which corresponds to"
-                        " [{:}] according to the orthography; no form given."
-                        "".format(line[c_id], line[c_value], form, line[c_form]))
-                elif line[c_form] != drop_stress(form):
-                    message(
-                        "Form {:} has original value <{:}>, which should correspond to"
-                        " [{:}] according to the orthography, but form [{:}] was given."
-                        "".format(line[c_id], line[c_value], form, line[c_form]))
-
-            if args.step[0] == "override" or (args.step[0] == "fill" and not line[c_form]):
-                line[c_form] = form
-
-        # Segment form and check with BIPA The segments cannot deal cleanly with
-        # suprasegmentals (syllable boundaries, syllable stress), so those are
-        # ignored explicitly or implicitly.
-        if args.step[1] == "quiet":
-            segments = [bipa[x] for x in line[c_segments]]
-        else:
-            segments = [bipa[x]
-                        for part in (line[c_form] or '').split(".")
-                        for x in tokenizer(part, ipa=True).split()]
-            for s in segments:
-                if isinstance(s, pyclts.models.UnknownSound):
-                    message(
-                        "Form {:} [{:}] contains non-BIPA segment '{:}'.".format(
-                            line[c_id], form, s.source))
-
-            if (line[c_segments]) and ([str(bipa[x]) for x in line[c_segments]] !=
-                [str(x) for x in segments]):
-                    message(
-                        "Form {:} has form [{:}], which should correspond to segments"
-                        " [{:}], but segments [{:}] were given."
-                        "".format(
-                            line[c_id],
-                            line[c_form],
-                            " ".join(map(str, segments)),
-                            " ".join([s or '' for s in line[c_segments]])))
-
-            if args.step[1] == "override" or (args.step[1] == "fill" and not line[c_segments]):
-                line[c_segments] = segments
-
-        if args.step[2] == "quiet":
             pass
-        else:
-            language_orthography = language_orthographies[line[c_language]] or ""
-
-            # Check the form's orthography.
-            if not language_orthography:
-                if not line[c_orth]:
-                    message("Form {:} [{:}] is not given in the local orthography,"
-                            " and no way to derive it was given.".format(
-                                line[c_id], line[c_form]))
-
-            # For checking, transform the local orthography to the form by
-            # applying the language's orthography.
-            orth_form = line[c_orth] or ""
-            match = False
-            if orth_form:
-                expected_form = orth_form
-                for transducer in language_orthography:
-                    expected_form = transducer(expected_form)
-
-                if drop_stress(expected_form) == drop_stress(line[c_form]):
-                    match = True
-
-            # If that does not work, try tranforming the form to the local
-            # orthography by reverse-applying the language's orthography.
-            expected_orth = line[c_form]
-            for transducer in reversed(language_orthography):
-                expected_orth = transducer.undo(expected_orth)
-            expected_orth = expected_orth.replace("_", " ").replace("+", "-").strip()
-
-            if match:
-                pass
-            elif expected_orth != orth_form and orth_form:
-                message(
-                    "Form {:} is given in the local orthography as <{:}>, but"
-                    " phonetics [{:}] would correspond to <{:}>.".format(
-                        line[c_id], line[c_orth], form, expected_orth))
-            elif orth_form:
-                pass
-            else:
-                message(
-                    "Form {:} is not given in the local orthography. From its"
-                    " phonetics [{:}], taking <{:}>.".format(
-                        line[c_id], form, expected_orth))
-
-            if args.step[2] == "override" or (args.step[2] == "fill" and not line[c_orth]):
-                line[c_orth] = expected_orth
-
-        new_lines_of_this_source.append(line)
+        # Otherwise, look up the name of the orthographic profile specified in
+        # the source metadata.
+        source = dataset.sources[main_source]
+        try:
+            transducer_files = source["orthographic_profile"].split(":")
+        except KeyError:
+            # It is permitted to not specify an orthographic profile in a
+            # source. Then we assume the source is in ideosyncratic and rely on
+            # forms being given explicitly. NOTE how this is different from
+            # specifying an empty orthographic profile: An empty profile means
+            # that no transducers are applied, i.e. that the data is already in
+            # IPA.
+            transducer_files = None
+        orthographic_profile = load_pipeline(transducer_files)
+        if orthographic_profile:
+            diagnostics.note(str(orthographic_profile))
+        transcription_systems[main_source] = transducer_files
+        return transducer_files
+
+    if args.match and args.override == 'none':
+        # Nothing is written back, so forms that do not match can be
+        # skipped before they are even parsed.
+        shards = list(shard_forms(
+            iter_forms(match=args.match, dataset=dataset), columns))
+    else:
+        shards = list(shard_forms(
+            dataset["FormTable"].iterdicts(), columns, match=args.match))
+    settings = {
+        "language_orthographies": language_orthographies,
+        "columns": columns,
+        "step": args.step,
+        "check_stress": args.check_stress}
 
-    maybe_extend(
-        lines,
-        new_lines_of_this_source,
-        original_lines_of_this_source)
+    lines = []
+    for (main_source, rows), (original_lines, new_lines, messages) in zip(
+            shards,
+            check_shards(
+                [(source_profile(main_source), rows)
+                 for main_source, rows in shards],
+                settings,
+                processes=args.processes)):
+        diagnostics.note(str(main_source))
+        diagnostics.extend(messages)
+        maybe_extend(lines, new_lines, original_lines)
 
     if args.override != 'none':
         dataset["FormTable"].write(lines)
+
+    print(diagnostics.summary(), file=sys.stderr)
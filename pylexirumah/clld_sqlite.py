@@ -14,8 +14,10 @@ import os
 import argparse
 import json
 import sys
+import collections
 
 import pycldf
+import sqlalchemy
 
 import lexirumah
 import transaction
@@ -44,6 +46,7 @@ model_is_available = True
 
 from . import get_dataset
 from .util import identifier
+from .cognates import current_rows
 
 
 ICONS = {
@@ -244,6 +247,15 @@ def import_sources(wordlist, contribution, contributors = {}):
     return contributions
 
 
+def read_loans(wordlist):
+    """Collect the BorrowingTable rows by target form."""
+    loans = {}
+    for loan in wordlist["BorrowingTable"].iterdicts():
+        if loan["Status"] > loans.get("Form_ID_Target", 0):
+            loans[loan["Form_ID_Target"]] = loan
+    return loans
+
+
 def import_forms(
         wordlist,
         concepticon,
@@ -268,10 +280,7 @@ def import_forms(
     """
 
     # Import all the rows.
-    loans = {}
-    for loan in wordlist["BorrowingTable"].iterdicts():
-        if loan["Status"] > loans.get("Form_ID_Target", 0):
-            loans[loan["Form_ID_Target"]] = loan
+    loans = read_loans(wordlist)
     forms = {}
     for row in wordlist["FormTable"].iterdicts():
             language = languages[row["Lect_ID"]]
@@ -311,11 +320,8 @@ def import_forms(
 
 
 def import_cognatesets(dataset, forms, bibliography, contribution, cognatesets={}):
-    cognateset_by_formid = {}
-    for row in dataset["CognateTable"].iterdicts():
-        # Only incorporate the newest cognate codings.
-        cognateset_by_formid[row["Form_ID"]] = row
-    for row in cognateset_by_formid.values():
+    # Only incorporate the newest cognate codings.
+    for row in current_rows(dataset):
         cognateset_id = row["Cognateset_ID"]
         try:
             cognateset = cognatesets[cognateset_id]
@@ -337,12 +343,172 @@ def import_cognatesets(dataset, forms, bibliography, contribution, cognatesets={
                 source=bibliography[source]))
 
 
-def db_main():
+# Bulk loading
+BATCH_SIZE = 10000
+
+BULK_PRAGMAS = [
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",
+]
+
+BulkForm = collections.namedtuple("BulkForm", ["pk", "name"])
+
+
+class BulkRows:
+    """Plain row mappings for one mapped class, to be inserted in bulk.
+
+    Primary keys are assigned here, counting on from the largest one in the
+    database, so that rows of other tables can refer to them before
+    anything is inserted. Mappings of polymorphic classes get their
+    discriminator, which `bulk_insert_mappings` does not set.
+
+    """
+    def __init__(self, model):
+        self.model = model
+        self.rows = []
+        mapper = sqlalchemy.inspect(model)
+        self.defaults = {}
+        if mapper.polymorphic_on is not None and mapper.polymorphic_identity is not None:
+            key = mapper.get_property_by_column(mapper.polymorphic_on).key
+            self.defaults[key] = mapper.polymorphic_identity
+        # With joined table inheritance, this is the base table's key.
+        self.next_pk = (DBSession.query(
+            sqlalchemy.func.max(mapper.primary_key[0])).scalar() or 0) + 1
+
+    def add(self, **values):
+        """Add a row, and return its primary key."""
+        row = dict(self.defaults, pk=self.next_pk, **values)
+        self.next_pk += 1
+        self.rows.append(row)
+        return row["pk"]
+
+    def insert(self, batch_size=BATCH_SIZE):
+        for start in range(0, len(self.rows), batch_size):
+            DBSession.bulk_insert_mappings(
+                self.model, self.rows[start:start + batch_size])
+
+
+def bulk_import_forms(wordlist, concepticon, languages, bibliography,
+                      contribution):
+    """Load the forms of a word list as row mappings.
+
+    This creates the same value sets, counterparts and references as
+    `import_forms`, but as plain rows, which `bulk_load` inserts with one
+    `executemany` per batch instead of one ORM round-trip per object. The
+    ORM objects passed in must have been flushed, so that they have primary
+    keys.
+
+    Returns
+    -------
+    dict of str: BulkForm
+        The primary key and name of each form, by form ID
+    list of BulkRows
+        The rows to insert, in dependency order
+    """
+    valuesets = BulkRows(ValueSet)
+    counterparts = BulkRows(Counterpart)
+    references = BulkRows(CounterpartReference)
+    loans = read_loans(wordlist)
+    valueset_pks = {}
+    forms = {}
+    for row in wordlist["FormTable"].iterdicts():
+        language = languages[row["Lect_ID"]]
+        feature = concepticon[row["Concept_ID"]]
+        vsid = identifier("{:s}-{:}".format(language.id, feature.id))
+        try:
+            vs = valueset_pks[vsid]
+        except KeyError:
+            vs = valueset_pks[vsid] = valuesets.add(
+                id=vsid,
+                parameter_pk=feature.pk,
+                language_pk=language.pk,
+                contribution_pk=contribution.pk)
+        vid = row["ID"]
+        pk = counterparts.add(
+            id=vid,
+            valueset_pk=vs,
+            orthographic_form=row["Local_Orthography"],
+            loan=loans.get(row["ID"], {'Status': 0})['Status'],
+            comment=row['Comment'],
+            name=row["Form"],
+            segments=" ".join(row["Segments"]))
+        for source in row["Source"]:
+            references.add(
+                counterpart_pk=pk,
+                form_given_as=row["Form_according_to_Source"],
+                source_pk=bibliography[source].pk)
+        forms[vid] = BulkForm(pk, row["Form"])
+    return forms, [valuesets, counterparts, references]
+
+
+def bulk_import_cognatesets(dataset, forms, bibliography, contribution):
+    """Load the current cognate judgements as row mappings.
+
+    The bulk counterpart of `import_cognatesets`, see `bulk_import_forms`.
+
+    """
+    cognatesets = BulkRows(Cognateset)
+    judgements = BulkRows(CognatesetCounterpart)
+    references = BulkRows(CognatesetCounterpartReference)
+    cognateset_rows = {}
+    for row in current_rows(dataset):
+        form = forms[row["Form_ID"]]
+        try:
+            cognateset = cognateset_rows[row["Cognateset_ID"]]
+            cognateset["name"] = form.name
+        except KeyError:
+            cognatesets.add(
+                id=row["Cognateset_ID"],
+                contribution_pk=contribution.pk,
+                name=form.name)
+            cognateset = cognateset_rows[row["Cognateset_ID"]] = cognatesets.rows[-1]
+        pk = judgements.add(
+            cognateset_pk=cognateset["pk"],
+            doubt=True if "LexStat" in row["Source"] else False,
+            alignment=" ".join(row["Alignment"]),
+            counterpart_pk=form.pk)
+        for source in row["Source"]:
+            references.add(
+                cognatesetcounterpart_pk=pk,
+                source_pk=bibliography[source].pk)
+    return [cognatesets, judgements, references]
+
+
+def bulk_load(bulk_rows, batch_size=BATCH_SIZE):
+    """Insert row mappings in batches, with SQLite tuned for bulk loading.
+
+    The explicit indexes of the tables are dropped before and created again
+    after loading, which is faster than updating them row by row.
+
+    """
+    connection = DBSession.connection()
+    if connection.dialect.name == "sqlite":
+        for pragma in BULK_PRAGMAS:
+            connection.execute(sqlalchemy.text(pragma))
+    indexes = []
+    for rows in bulk_rows:
+        for table in sqlalchemy.inspect(rows.model).tables:
+            for index in table.indexes:
+                if index not in indexes:
+                    indexes.append(index)
+    for index in indexes:
+        index.drop(bind=connection)
+    for rows in bulk_rows:
+        rows.insert(batch_size)
+    for index in indexes:
+        index.create(bind=connection)
+
+
+def db_main(bulk=False, dataset=None):
     """Build the database.
 
-    Load the CLDF dataset and turn it into a SQLite dataset.
+    Load the CLDF dataset (default: the LexiRumah repository) and turn it
+    into a SQLite dataset. With `bulk`, forms and cognate judgements are
+    inserted as plain rows in batches instead of through the ORM.
     """
-    dataset = get_dataset()
+    if dataset is None:
+        dataset = get_dataset()
 
     g = dataset.properties.get
 
@@ -392,11 +558,20 @@ def db_main():
     concepticon = import_concepticon(dataset)
     languages = import_languages(dataset)
     sources = import_sources(dataset, contribution=provider)
-    forms = import_forms(dataset, concepticon, languages, sources, contribution=provider)
-    cognatesets = import_cognatesets(dataset, forms, sources, contribution=provider)
+    if bulk:
+        DBSession.add(provider)
+        DBSession.flush()
+        forms, rows = bulk_import_forms(
+            dataset, concepticon, languages, sources, contribution=provider)
+        rows += bulk_import_cognatesets(
+            dataset, forms, sources, contribution=provider)
+        bulk_load(rows)
+    else:
+        forms = import_forms(dataset, concepticon, languages, sources, contribution=provider)
+        import_cognatesets(dataset, forms, sources, contribution=provider)
 
 
-def main():
+def main(bulk=False):
     """Construct a new database from scratch."""
     print(os.path.join(
                   os.path.dirname(__file__),
@@ -407,10 +582,15 @@ def main():
                   "lexirumah_for_create_database.ini")])
 
     with transaction.manager:
-        db_main()
+        db_main(bulk=bulk)
     with transaction.manager:
         prime_cache(args)
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--bulk", action="store_true", default=False,
+                        help="Load forms and cognate judgements as plain rows"
+                        " in batches, instead of creating them as ORM objects"
+                        " one by one.")
+    main(bulk=parser.parse_args().bulk)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+
+"""The current state of a log-structured CognateTable.
+
+`append_changed_cognate_classes` never changes rows of the CognateTable, it
+appends new rows, and the last row for a form is the one that counts. This
+module reads the current state of the table through an index of the byte
+span of the last row of each form, which is cached and only extended by
+the rows appended since, so loading the current view costs time in the
+number of forms, not in the number of edits ever made. It also compacts the
+table, moving superseded rows to a history archive:
+
+    $ python -m pylexirumah.cognates --history cldf/cognates-history.csv
+
+"""
+
+import io
+import os
+import tempfile
+import collections
+
+from clldutils.path import Path
+from csvw.dsv import UnicodeReader, Dialect
+
+from pylexirumah import get_dataset, repository, cache_directory
+from pylexirumah.cache import cache_file, load_cache, save_cache, AppendOnlyFile
+
+LAST_ROW_INDEX_VERSION = 2
+
+
+def row_spans(content, start=0, quote=b'"'):
+    """Find the byte spans of the CSV rows in content, from start on.
+
+    A row ends at the first line break outside quotes. Empty lines are
+    skipped.
+
+    >>> list(row_spans(b'a,b\\n"x\\ny",z\\n\\nc,d'))
+    [(0, 4), (4, 12), (13, 16)]
+
+    """
+    end_of_content = len(content)
+    row_start = start
+    position = start
+    quotes = 0
+    while position < end_of_content:
+        line_end = content.find(b"\n", position)
+        if line_end < 0:
+            line_end = end_of_content
+        else:
+            line_end += 1
+        quotes += content.count(quote, position, line_end)
+        position = line_end
+        if quotes % 2 == 0:
+            if content[row_start:line_end].strip():
+                yield row_start, line_end
+            row_start = line_end
+            quotes = 0
+    if row_start < end_of_content and content[row_start:].strip():
+        yield row_start, end_of_content
+
+
+class LastRowIndex(AppendOnlyFile):
+    """The byte span of the last row of each form in a CognateTable file.
+
+    Like `pylexirumah.util.CognatesetAssignments`, this is an
+    `AppendOnlyFile`, and `update` only parses the rows appended since the
+    last update.
+
+    Forms are kept in order of their first row, which is the order in which
+    readers that keep the last row per form in a dict (eg.
+    clld_sqlite.import_cognatesets) see them.
+
+    """
+    def __init__(self):
+        super().__init__()
+        self.header = None
+        self.rows = 0
+        self.spans = collections.OrderedDict()
+
+    def update(self, table, form_reference, content=None, dialect=None):
+        """Index the rows appended to the table file since the last update.
+
+        `dialect` is the table group's dialect, for a table without a dialect
+        of its own (cf. `pylexirumah.query.iter_rows`).
+
+        Returns
+        -------
+        bool
+            Whether the file changed
+        """
+        appended = self.appended(table.url.resolve(table.base),
+                                 key=form_reference, content=content)
+        if appended is None:
+            return False
+        start, content = appended
+
+        dialect = table.dialect or dialect or Dialect()
+        spans = row_spans(content, start, dialect.quoteChar.encode())
+        if self.header is None:
+            try:
+                first, end = next(spans)
+            except StopIteration:
+                return True
+            self.header = parse_row(content[first:end], dialect)
+        j_form = self.header.index(form_reference)
+        for first, end in spans:
+            row = parse_row(content[first:end], dialect)
+            self.spans[row[j_form]] = (first, end)
+            self.rows += 1
+        return True
+
+    def iterdicts(self, table, content=None, dialect=None):
+        """Read the current row of every form, converted like csvw does."""
+        if content is None:
+            with Path(table.url.resolve(table.base)).open("rb") as file:
+                content = file.read()
+        dialect = table.dialect or dialect or Dialect()
+        readers = [table.tableSchema.get_column(h) for h in self.header]
+        for start, end in self.spans.values():
+            row = parse_row(content[start:end], dialect)
+            yield collections.OrderedDict(
+                (h, read.read(v) if read else v)
+                for h, read, v in zip(self.header, readers, row))
+
+
+def parse_row(raw, dialect):
+    """Parse the bytes of a single CSV row into a list of strings."""
+    with UnicodeReader(
+            io.StringIO(raw.decode(dialect.encoding)), dialect=dialect) as reader:
+        for row in reader:
+            return row
+    return []
+
+
+def last_row_index(dataset, cache_directory=cache_directory, content=None):
+    """Load the last-row index of the dataset's CognateTable, updating the cache."""
+    table = dataset["CognateTable"]
+    form_reference = dataset["CognateTable", "formReference"].name
+    file = cache_file("last_rows", table.url.resolve(table.base), cache_directory)
+    entry = load_cache(file, LAST_ROW_INDEX_VERSION)
+    index = entry["index"] if entry else LastRowIndex()
+    if index.update(table, form_reference, content,
+                    dialect=dataset.tablegroup.dialect):
+        save_cache(file, LAST_ROW_INDEX_VERSION, {"index": index})
+    return index
+
+
+def current_rows(dataset, cache_directory=cache_directory):
+    """Iterate over the current CognateTable row of every form.
+
+    This gives the same rows as keeping the last row per form of
+    `dataset["CognateTable"].iterdicts()`, in order of the forms' first rows.
+
+    """
+    table = dataset["CognateTable"]
+    with Path(table.url.resolve(table.base)).open("rb") as file:
+        content = file.read()
+    index = last_row_index(dataset, cache_directory, content)
+    return index.iterdicts(table, content, dialect=dataset.tablegroup.dialect)
+
+
+def compact(dataset, history=None, cache_directory=cache_directory):
+    """Rewrite the CognateTable to contain only the current row of each form.
+
+    The rows are copied byte for byte, in order of the forms' first rows.
+    Superseded rows are appended to the `history` CSV file, if given, which
+    is created with the table's header if it does not exist.
+
+    Returns
+    -------
+    (int, int)
+        The number of rows kept and the number of rows removed
+    """
+    table = dataset["CognateTable"]
+    path = Path(table.url.resolve(table.base))
+    with path.open("rb") as file:
+        content = file.read()
+    index = last_row_index(dataset, cache_directory, content)
+
+    dialect = table.dialect or dataset.tablegroup.dialect or Dialect()
+    spans = list(row_spans(content, 0, dialect.quoteChar.encode()))
+    header, rows = spans[0], spans[1:]
+    current = set(index.spans.values())
+    superseded = [span for span in rows if span not in current]
+
+    def raw(span):
+        line = content[span[0]:span[1]]
+        return line if line.endswith(b"\n") else line + b"\n"
+
+    if history is not None and superseded:
+        history = Path(history)
+        new_history = not history.exists()
+        with history.open("ab") as archive:
+            if new_history:
+                archive.write(raw(header))
+            for span in superseded:
+                archive.write(raw(span))
+
+    with tempfile.NamedTemporaryFile(
+            dir=str(path.parent), suffix=".tmp", delete=False) as compacted:
+        compacted.write(raw(header))
+        for span in index.spans.values():
+            compacted.write(raw(span))
+    os.replace(compacted.name, str(path))
+    return len(index.spans), len(superseded)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Compact the CognateTable of a CLDF Wordlist to the"
+        " current cognate coding of each form.")
+    parser.add_argument("--wordlist",
+                        type=Path, default=repository,
+                        help="The Wordlist to compact. (default: LexiRumah.)")
+    parser.add_argument("--history",
+                        type=Path, default=None,
+                        help="Append the superseded rows to this CSV file."
+                        " (default: discard them)")
+    args = parser.parse_args()
+
+    kept, removed = compact(get_dataset(args.wordlist), args.history)
+    print("Kept {:d} rows, removed {:d} superseded rows.".format(kept, removed))
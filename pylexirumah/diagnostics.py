@@ -0,0 +1,110 @@
+"""Structured diagnostics for the data checking scripts.
+
+Checks produce `Diagnostic` records instead of printing sentences. A
+`DiagnosticSink` streams them to a file as JSON lines, CSV rows or the
+plain-text messages, counts them by category and can cap the number of
+records written per category, so that a full run over the dataset stays
+cheap and its output can be diffed between commits.
+
+"""
+
+import csv
+import sys
+import json
+import random
+from collections import namedtuple, Counter
+
+Diagnostic = namedtuple(
+    "Diagnostic",
+    ["form", "step", "category", "expected", "given", "message"])
+Diagnostic.__doc__ = """A single problem found in the data.
+
+form : str
+    The ID of the form concerned
+step : str
+    The check that found the problem, eg. 'form', 'segments', 'orthography'
+category : str
+    A short, stable key for the kind of problem
+expected, given : str or None
+    The value the check derived, and the value found in the data
+message : str
+    A human-readable description
+"""
+
+
+class DiagnosticSink:
+    """Stream diagnostics to a file, counting them per category.
+
+    Parameters
+    ----------
+    stream : file-like, optional
+        Where to write the records (default: sys.stdout)
+    format : 'text', 'jsonl' or 'csv'
+        Write the human-readable messages, one JSON object per line, or CSV
+        rows with a header
+    cap : int, optional
+        Write at most this many records per category. All records are
+        counted nevertheless.
+    sample : float, optional
+        Write each record only with this probability, before applying the
+        cap. Sampling is seeded, so runs on the same data are comparable.
+
+    >>> import io
+    >>> out = io.StringIO()
+    >>> sink = DiagnosticSink(out, format="jsonl", cap=1)
+    >>> for i in range(3):
+    ...     sink.emit(Diagnostic(str(i), "form", "form-missing", "a", None, ""))
+    >>> out.getvalue()
+    '{"form": "0", "step": "form", "category": "form-missing", "expected": "a", "given": null, "message": ""}\\n'
+    >>> sink.counts
+    Counter({'form-missing': 3})
+
+    """
+    formats = ("text", "jsonl", "csv")
+
+    def __init__(self, stream=None, format="text", cap=None, sample=None,
+                 seed=0):
+        if format not in self.formats:
+            raise ValueError("Unknown diagnostics format: {:}".format(format))
+        self.stream = sys.stdout if stream is None else stream
+        self.format = format
+        self.cap = cap
+        self.sample = sample
+        self.random = random.Random(seed)
+        self.counts = Counter()
+        self.written = Counter()
+        if format == "csv":
+            self.writer = csv.writer(self.stream)
+            self.writer.writerow(Diagnostic._fields)
+
+    def emit(self, diagnostic):
+        """Count a diagnostic, and write it unless sampled out or capped."""
+        category = diagnostic.category
+        self.counts[category] += 1
+        if self.sample is not None and self.random.random() >= self.sample:
+            return
+        if self.cap is not None and self.written[category] >= self.cap:
+            return
+        self.written[category] += 1
+        if self.format == "text":
+            print(diagnostic.message, file=self.stream)
+        elif self.format == "jsonl":
+            self.stream.write(
+                json.dumps(diagnostic._asdict(), ensure_ascii=False) + "\n")
+        else:
+            self.writer.writerow(diagnostic)
+
+    def extend(self, diagnostics):
+        for diagnostic in diagnostics:
+            self.emit(diagnostic)
+
+    def note(self, text):
+        """Write a free-form progress note, in text format only."""
+        if self.format == "text":
+            print(text, file=self.stream)
+
+    def summary(self):
+        """Describe the counts per category, most frequent first."""
+        return "\n".join(
+            "{:}\t{:d}".format(category, count)
+            for category, count in self.counts.most_common())
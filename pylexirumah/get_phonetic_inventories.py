@@ -1,10 +1,8 @@
 import argparse
 import collections
-import pyclts
-
-bipa = pyclts.TranscriptionSystem()
 
 from pylexirumah import get_dataset, repository
+from pylexirumah.sounds import normalize
 parser = argparse.ArgumentParser(
     description="List the sound inventories contained in a CLDF Wordlist")
 parser.add_argument("--dataset", default=None)
@@ -17,7 +15,7 @@ c_language = dataset["FormTable", "languageReference"].name
 c_segments = dataset["FormTable", "segments"].name
 
 for row in dataset["FormTable"].iterdicts():
-    normalized = [str(bipa[x]) for x in row[c_segments]]
+    normalized = [normalize(x) for x in row[c_segments]]
     inventories[row[c_language]].update(normalized)
 
 all = collections.Counter()
@@ -14,7 +14,7 @@ import pycldf
 import pyclts
 
 from pylexirumah import (get_dataset, repository)
-from pylexirumah.check_transcription_systems import load_orthographic_profile, tokenizer, resolve_brackets, bipa
+from pylexirumah.check_transcription_systems import load_orthographic_profile, resolve_brackets
 
 
 parser = argparse.ArgumentParser(description="Import word lists from a new source into LexiRumah.")
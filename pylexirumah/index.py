@@ -0,0 +1,140 @@
+"""Persisted secondary indexes of a CLDF Wordlist.
+
+Scripts keep building the same lookup tables: form ID to row, forms by lect
+or concept, cognate class by form. `load_index` builds all of them in one
+pass over the FormTable and CognateTable, and caches them on disk keyed by
+the content hash of the dataset's files, so that later runs load them
+without reading the tables at all.
+
+All indexes refer to forms by their row number in the FormTable, which is
+also their row number in a `FormStore` or snapshot of the dataset.
+
+"""
+
+import collections
+
+import numpy
+
+from pylexirumah import get_dataset, cache_directory
+from pylexirumah.cache import cache_file, load_cache, save_cache
+from pylexirumah.cognates import current_rows
+from pylexirumah.query import iter_rows
+from pylexirumah.snapshot import content_hash, dataset_files
+
+INDEX_VERSION = 2
+
+
+def source_key(reference):
+    """Strip the page range from a source reference.
+
+    >>> source_key("klamer2010[12-13]")
+    'klamer2010'
+
+    """
+    return reference.split("[", 1)[0]
+
+
+class DatasetIndex:
+    """Lookups from IDs and references to FormTable row numbers.
+
+    Attributes
+    ----------
+    form : dict of str: int
+        Form ID → row number
+    lect, concept, cognateset, source : dict of str: numpy.ndarray of int32
+        Lect ID, concept ID, cognateset ID, source key → row numbers of the
+        forms, in table order
+
+    """
+    kinds = ("lect", "concept", "cognateset", "source")
+
+    def __init__(self, form, lect, concept, cognateset, source):
+        self.form = form
+        self.lect = lect
+        self.concept = concept
+        self.cognateset = cognateset
+        self.source = source
+
+    @classmethod
+    def build(cls, dataset, cache_directory=cache_directory):
+        """Build the indexes with one pass over the FormTable and CognateTable.
+
+        The CognateTable is append-only, so only the current row of each form
+        counts (see `pylexirumah.cognates.current_rows`).
+
+        """
+        c_id = dataset["FormTable", "id"].name
+        c_lect = dataset["FormTable", "languageReference"].name
+        c_concept = dataset["FormTable", "parameterReference"].name
+        try:
+            c_source = dataset["FormTable", "source"].name
+        except KeyError:
+            c_source = None
+
+        form = {}
+        groups = {kind: collections.defaultdict(list) for kind in cls.kinds}
+        for i, row in enumerate(iter_rows(
+                dataset["FormTable"],
+                [c for c in (c_id, c_lect, c_concept, c_source) if c],
+                dialect=dataset.tablegroup.dialect)):
+            form[row[c_id]] = i
+            groups["lect"][row[c_lect]].append(i)
+            groups["concept"][row[c_concept]].append(i)
+            if c_source:
+                for key in {source_key(s) for s in row[c_source] or ()}:
+                    groups["source"][key].append(i)
+
+        try:
+            c_form = dataset["CognateTable", "formReference"].name
+            c_cognateset = dataset["CognateTable", "cognatesetReference"].name
+        except KeyError:
+            pass
+        else:
+            for row in current_rows(dataset, cache_directory):
+                try:
+                    groups["cognateset"][row[c_cognateset]].append(
+                        form[row[c_form]])
+                except KeyError:
+                    # A cognate judgement of a form that does not exist
+                    continue
+
+        return cls(form, **{
+            kind: {key: numpy.array(sorted(rows), dtype=numpy.int32)
+                   for key, rows in index.items()}
+            for kind, index in groups.items()})
+
+    def forms(self, kind, key):
+        """Return the row numbers of the forms with this lect, concept, etc."""
+        try:
+            return getattr(self, kind)[key]
+        except KeyError:
+            return numpy.zeros(0, dtype=numpy.int32)
+
+    def cognateset_by_form(self):
+        """Invert the cognateset index into form row → list of cognatesets."""
+        result = collections.defaultdict(list)
+        for cognateset, rows in self.cognateset.items():
+            for i in rows.tolist():
+                result[i].append(cognateset)
+        return result
+
+
+def load_index(dataset=None, cache_directory=cache_directory):
+    """Load the indexes of a dataset from the cache, or build and cache them.
+
+    Cached indexes are used only if the content hash of the metadata and
+    table files matches the one they were built from.
+
+    """
+    if dataset is None:
+        dataset = get_dataset()
+    files = dataset_files(dataset)
+    current_hash = content_hash(files)
+    file = cache_file("indexes", files[0], cache_directory)
+    entry = load_cache(file, INDEX_VERSION)
+    if entry is not None and entry["hash"] == current_hash:
+        return entry["index"]
+
+    index = DatasetIndex.build(dataset, cache_directory)
+    save_cache(file, INDEX_VERSION, {"hash": current_hash, "index": index})
+    return index
@@ -10,11 +10,16 @@ Example
 import sys
 
 import csv
-import collections
+import heapq
+import pickle
+import tempfile
 
 import pycldf.dataset
 from clldutils.clilib import ArgumentParser
 
+from pylexirumah import cache_directory
+from pylexirumah.cognates import current_rows
+
 
 def cldf_to_lingpy(columns, replacement=None):
     """Turn CLDF column headers into LingPy column headers.
@@ -164,18 +169,131 @@ def no_separators_or_newlines(string, separator="\t"):
         return string.replace(separator, "\t")
 
 
+ROWS_PER_RUN = 50000
+
+
+def _dump_run(rows):
+    """Write rows to a temporary file, returning the open file."""
+    run = tempfile.TemporaryFile()
+    for row in rows:
+        pickle.dump(row, run, protocol=pickle.HIGHEST_PROTOCOL)
+    run.seek(0)
+    return run
+
+
+def _load_run(run):
+    while True:
+        try:
+            yield pickle.load(run)
+        except EOFError:
+            return
+
+
+def external_sort(rows, key, rows_per_run=ROWS_PER_RUN):
+    """Sort an iterable of picklable items stably, with bounded memory.
+
+    Read at most `rows_per_run` items at a time, sort them and spill them to
+    a temporary file, then merge all sorted runs. If the keys turn out to be
+    incomparable, the items are yielded in their original order instead.
+
+    >>> list(external_sort([3, 1, 2, 1], key=lambda x: x, rows_per_run=2))
+    [1, 1, 2, 3]
+
+    """
+    runs = []
+    comparable = True
+
+    def flush(buffer):
+        nonlocal comparable
+        if comparable:
+            try:
+                buffer.sort(key=lambda item: item[1])
+            except TypeError:
+                # Incomparable keys: Keep the original order after all.
+                comparable = False
+        runs.append(_dump_run(buffer))
+
+    buffer = []
+    try:
+        for i, row in enumerate(rows):
+            buffer.append((i, key(row), row))
+            if len(buffer) >= rows_per_run:
+                flush(buffer)
+                buffer = []
+        if buffer or not runs:
+            flush(buffer)
+
+        if comparable:
+            merged = heapq.merge(*map(_load_run, runs),
+                                 key=lambda item: (item[1], item[0]))
+            try:
+                first = next(merged)
+            except TypeError:
+                comparable = False
+            except StopIteration:
+                return
+        if comparable:
+            yield first[2]
+            for i, _, row in merged:
+                yield row
+        else:
+            for run in runs:
+                run.seek(0)
+            for i, _, row in heapq.merge(*map(_load_run, runs),
+                                         key=lambda item: item[0]):
+                yield row
+    finally:
+        for run in runs:
+            run.close()
+
+
+def _join_current(forms, cognate_rows):
+    """Join forms with their current CognateTable row.
+
+    Both iterables must be sorted by form ID: `forms` yields (index, row)
+    pairs of the FormTable, `cognate_rows` the current CognateTable rows.
+    Yield the (index, row) pairs, with the columns of the form's CognateTable
+    row, if any, added to the row and its ID renamed to COGNATESETTABLE_ID.
+    CognateTable rows for forms not in the FormTable are dropped.
+
+    """
+    cognate_rows = iter(cognate_rows)
+    cognate_row = next(cognate_rows, None)
+    for i, row in forms:
+        current = None
+        while cognate_row is not None and cognate_row["Form_ID"] <= row["ID"]:
+            if cognate_row["Form_ID"] == row["ID"]:
+                current = cognate_row
+            cognate_row = next(cognate_rows, None)
+        if current is not None:
+            current["COGNATESETTABLE_ID"] = current.pop("ID")
+            del current["Form_ID"]
+            row.update(current)
+        yield i, row
+
+
 def cldf(args):
     """Load a CLDF dataset and turn it into a LingPy word list file
 
     Sort by cognateset, for easier visual inspection of certain things I'm
     interested in.
 
+    The FormTable and the current coding of each form in the CognateTable
+    are both sorted by form ID with an external merge sort and joined, and
+    the joined rows are sorted back into FormTable order and then by COGID
+    the same way. Apart from the in-memory runs, only the raw CognateTable
+    and its per-form index (see `current_rows`) and the COGID of each
+    cognate set are kept in memory.
+
     Parameters
     ----------
     args : Namespace
         A Namespace object with an 'args' property, which is a tuple of strings.
         The strings should be valid paths corresponding to resp. the metadata file of
         the CLDF data set and the LingPy word list (edictor file).
+        Optional 'rows_per_run' and 'cache_directory' properties set the
+        number of rows sorted in memory at a time and the directory of the
+        `current_rows` index cache.
 
     Notes
     -----
@@ -183,68 +301,69 @@ def cldf(args):
         the output path that is passed, based on the input metadata file of the CLDF data set.
     """
     input_file, output_file = args.args
+    rows_per_run = getattr(args, "rows_per_run", None) or ROWS_PER_RUN
+    cache = getattr(args, "cache_directory", None) or cache_directory
     cogids = {None: 0}
     dataset = pycldf.dataset.Wordlist.from_metadata(input_file)
 
+    # All forms share the FormTable header, and forms with cognate codes
+    # have the CognateTable columns in addition.
+    header = [c.name for c in dataset["FormTable"].tableSchema.columns]
     try:
-        cognate_set_iter = dataset["CognateTable"].iterdicts()
+        cognate_set_iter = current_rows(dataset, cache)
+        header.extend(
+            c.name for c in dataset["CognateTable"].tableSchema.columns
+            if c.name not in ("ID", "Form_ID") and c.name not in header)
+        header.append("COGNATESETTABLE_ID")
     except KeyError:
         cognate_set_iter = []
-    cognate_set = {}
-    for cognate_table_row in cognate_set_iter:
-        cognate_table_row["COGNATESETTABLE_ID"] = cognate_table_row.pop("ID")
-        form = cognate_table_row.pop("Form_ID")
-        cognate_set[form] = cognate_table_row
-
-    all_rows = []
-    for i, row in enumerate(dataset["FormTable"].iterdicts()):
-        try:
-            cognate_table_row = cognate_set[row["ID"]]
-            row.update(cognate_table_row)
-        except KeyError:
-            pass
-
-        o_row = collections.OrderedDict()
-        for key, value in row.items():
-            if isinstance(value, str):
-                # Strings need special characters removed
-                o_row[cldf_to_lingpy(key)] = no_separators_or_newlines(value)
-            else:
-                try:
-                    # Sequences (Alignment, Segments) need conversion and
-                    # special characters removed
-                    o_row[cldf_to_lingpy(key)] = no_separators_or_newlines(
-                        " ".join(value))
-                except TypeError:
-                    # Other values are taken as-is
-                    o_row[cldf_to_lingpy(key)] = value
-        o_row["ID"] = i + 1
-        if "COGID" not in o_row.keys():
-            o_row["COGID"] = cogids.setdefault(row.get("Cognateset_ID"), len(cogids))
-        all_rows.append(o_row)
-
-        firstcols = ["ID", "COGID"]
-        if i == 0:
-            # Rearrange the headers so that 'ID' and 'COGID' are the first two columns.
-            for header in reversed(firstcols):
-                o_row.move_to_end(header, last=False)
-            writer = csv.DictWriter(
-                open(output_file, 'w', encoding='utf-8'), delimiter="\t",
-                fieldnames=o_row.keys())
-            writer.writeheader()
-            
-    try:
-        all_rows = sorted(all_rows, key=lambda row: row["COGID"])
-    except TypeError:
-        # Incomparable COGIDs?
-        pass
-    for row in all_rows:
-        writer.writerow(row)
+    forms = _join_current(
+        external_sort(enumerate(dataset["FormTable"].iterdicts()),
+                      key=lambda item: item[1]["ID"],
+                      rows_per_run=rows_per_run),
+        external_sort(cognate_set_iter, key=lambda row: row["Form_ID"],
+                      rows_per_run=rows_per_run))
+
+    fieldnames = ["ID", "COGID"] + [
+        c for c in cldf_to_lingpy(header) if c not in ("ID", "COGID")]
+
+    def lingpy_rows():
+        for i, row in external_sort(forms, key=lambda item: item[0],
+                                    rows_per_run=rows_per_run):
+            o_row = {}
+            for key, value in row.items():
+                if isinstance(value, str):
+                    # Strings need special characters removed
+                    o_row[cldf_to_lingpy(key)] = no_separators_or_newlines(value)
+                else:
+                    try:
+                        # Sequences (Alignment, Segments) need conversion and
+                        # special characters removed
+                        o_row[cldf_to_lingpy(key)] = no_separators_or_newlines(
+                            " ".join(value))
+                    except TypeError:
+                        # Other values are taken as-is
+                        o_row[cldf_to_lingpy(key)] = value
+            o_row["ID"] = i + 1
+            if "COGID" not in o_row.keys():
+                o_row["COGID"] = cogids.setdefault(row.get("Cognateset_ID"), len(cogids))
+            yield o_row
+
+    with open(output_file, 'w', encoding='utf-8', newline='',
+              buffering=1 << 20) as output:
+        writer = csv.DictWriter(
+            output, delimiter="\t", fieldnames=fieldnames, restval="")
+        writer.writeheader()
+        writer.writerows(external_sort(
+            lingpy_rows(), key=lambda row: row["COGID"],
+            rows_per_run=rows_per_run))
 
 
 def lingpy(args):
     """Load a Lingpy dataset and turn it into a CLDF word list file
 
+    Rows are converted one by one, so this runs in constant memory.
+
     Parameters
     ----------
     args : Namespace
@@ -257,23 +376,29 @@ def lingpy(args):
         When this function is called, a new CLDF wordlist file is generated at
         the output path that is passed, based on the input Lingpy dataset.
     """
-    # TODO: Finish this docstring.
     input_file, output_file = args.args
-    reader = csv.DictReader(input_file, delimiter="\t")
-    for i, row in enumerate(reader):
-        if i == 0:
-            # FIXME: Refactor 'writer' variable so it cannot be called if it is not defined yet.
-            writer = csv.DictWriter(
-                output_file, delimiter=",",
-                fieldnames=[
-                    lingpy_to_cldf(c)
-                    for c in reader.fieldnames])
-            writer.writeheader()
-        writer.writerow({
-            lingpy_to_cldf(key): value
-            for key, value in row.items()})
+    with open(input_file, encoding='utf-8', newline='') as input, \
+            open(output_file, 'w', encoding='utf-8', newline='',
+                 buffering=1 << 20) as output:
+        reader = csv.DictReader(input, delimiter="\t")
+        if reader.fieldnames is None:
+            return
+        writer = csv.DictWriter(
+            output, delimiter=",",
+            fieldnames=[
+                lingpy_to_cldf(c)
+                for c in reader.fieldnames])
+        writer.writeheader()
+        for row in reader:
+            writer.writerow({
+                lingpy_to_cldf(key): value
+                for key, value in row.items()})
 
 
 if __name__ == "__main__":
     parser = ArgumentParser('lingpycldf', cldf, lingpy)
+    parser.add_argument(
+        "--rows-per-run", type=int, default=ROWS_PER_RUN,
+        help="Number of rows to sort in memory at a time when exporting to"
+        " LingPy (default: {:d})".format(ROWS_PER_RUN))
     sys.exit(parser.main())
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+
+"""Fast pairwise alignment of segment sequences.
+
+The alignment engine in this module computes the same affine-gap
+Needleman-Wunsch alignments as
+`pylexirumah.check_transcription_systems.needleman_wunsch`, but it encodes
+segments as integers, keeps the scores in a dense NumPy matrix and fills the
+dynamic programming tables one anti-diagonal at a time, for a whole batch of
+equally long pairs at once.
+
+Example
+-------
+    $ python -m pylexirumah.pairwise --pairs 2000
+"""
+
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+
+class Aligner:
+    """Affine-gap global and local alignment over integer-coded segments.
+
+    The scoring scheme is given in the same way as for
+    `check_transcription_systems.needleman_wunsch`: `lodict` maps symbol pairs
+    to match scores (falling back to 1 for identical and -1 for different
+    symbols), gop and gep are gap opening and extension penalties, and with
+    `gop=None` the (symbol, indel) and (indel, symbol) entries of `lodict` give
+    element/gap alignment costs instead.
+
+    Symbols are assigned integer codes the first time they are seen, and the
+    score matrix grows accordingly, so one Aligner can be re-used for all
+    forms of a dataset.
+
+    >>> Aligner()("AAAAABBBB", "AACAABBCB")
+    (5.0, [('A', 'A'), ('A', 'A'), ('A', 'C'), ('A', 'A'), ('A', 'A'), ('B', 'B'), ('B', 'B'), ('B', 'C'), ('B', 'B')])
+    >>> Aligner(local=True)("banana", "mancala")
+    (2.0, [('a', 'a'), ('n', 'n')])
+    >>> Aligner(lodict={('a', ''): 0, ('b', ''): -2, ('c', ''): -0.5}, gop=None)("abc", "t")
+    (-1.5, [('a', ''), ('b', 't'), ('c', '')])
+
+    """
+    def __init__(self, lodict={}, gop=-2.5, gep=-1.75, local=False, indel=''):
+        self.lodict = lodict or {}
+        self.gop = gop
+        self.gep = gep
+        self.local = local
+        self.indel = indel
+
+        self.symbols = []
+        self.codes = {}
+        self.scores = np.zeros((0, 0))
+        self.gap_x = np.zeros(0)
+        self.gap_y = np.zeros(0)
+        self.add_symbols(
+            s for pair in self.lodict for s in pair if s != indel)
+
+    def __repr__(self):
+        return "Aligner({:d} symbols, gop={:}, gep={:}, local={:})".format(
+            len(self.symbols), self.gop, self.gep, self.local)
+
+    def add_symbols(self, symbols):
+        """Assign codes to all new symbols and extend the score tables."""
+        new = []
+        for symbol in symbols:
+            if symbol not in self.codes:
+                self.codes[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+                new.append(symbol)
+        if not new:
+            return
+
+        size = len(self.symbols)
+        scores = -np.ones((size, size))
+        np.fill_diagonal(scores, 1)
+        scores[:len(self.scores), :len(self.scores)] = self.scores
+        gap_x = np.full(size, self.gep, dtype=float)
+        gap_x[:len(self.gap_x)] = self.gap_x
+        gap_y = np.full(size, self.gep, dtype=float)
+        gap_y[:len(self.gap_y)] = self.gap_y
+
+        # Only pairs involving at least one new symbol need to be looked up.
+        for (s1, s2), score in self.lodict.items():
+            if s1 == self.indel and s2 in self.codes:
+                gap_y[self.codes[s2]] = score
+            elif s2 == self.indel and s1 in self.codes:
+                gap_x[self.codes[s1]] = score
+            elif s1 in self.codes and s2 in self.codes:
+                scores[self.codes[s1], self.codes[s2]] = score
+        self.scores, self.gap_x, self.gap_y = scores, gap_x, gap_y
+
+    def fill(self, x, y):
+        """Fill the skewed DP and pointer tables for a batch of sequence pairs.
+
+        `x` and `y` are integer arrays of shape (batch, n) and (batch, m), so
+        all pairs in one batch have the same lengths. The tables are indexed
+        by anti-diagonal first, so that `dp[b, i, j]` of the usual layout is
+        found at `[b, i + j, i]`. All cells of one anti-diagonal only depend
+        on the previous two, which makes every step a handful of array
+        operations over the whole batch.
+
+        Cells outside the original (n+1)×(m+1) tables are -inf.
+        """
+        batch, n = x.shape
+        m = y.shape[1]
+        gop, gep = self.gop, self.gep
+        dp = np.full((batch, n + m + 1, n + 1), -np.inf)
+        pointers = np.zeros((batch, n + m + 1, n + 1), np.int8)
+
+        gap_x = self.gap_x[x]
+        y_reversed = y[:, ::-1]
+        gap_y_reversed = self.gap_y[y_reversed]
+
+        rows = np.arange(n + 1)
+        columns = np.arange(m + 1)
+        if self.local:
+            dp[:, rows, rows] = 0
+            dp[:, columns, 0] = 0
+        else:
+            if gop is None:
+                dp[:, 0, 0] = 0
+                dp[:, rows[1:], rows[1:]] = gap_x
+                dp[:, columns[1:], 0] = self.gap_y[y]
+            else:
+                dp[:, rows, rows] = np.concatenate(
+                    ([0], np.cumsum([gop] + [gep] * (n - 1))))[:n + 1]
+                dp[:, columns, 0] = np.concatenate(
+                    ([0], np.cumsum([gop] + [gep] * (m - 1))))[:m + 1]
+            pointers[:, rows[1:], rows[1:]] = 1
+            pointers[:, columns[1:], 0] = 2
+
+        for d in range(2, n + m + 1):
+            lo, hi = max(1, d - m), min(n, d - 1) + 1
+            if lo >= hi:
+                continue
+            # Segment indices: x[i - 1] and y[d - i - 1] for i in lo..hi-1
+            x_slice = slice(lo - 1, hi - 1)
+            y_slice = slice(m - d + lo, m - d + hi)
+
+            match = dp[:, d - 2, lo - 1:hi - 1] + self.scores[
+                x[:, x_slice], y_reversed[:, y_slice]]
+            if gop is None:
+                insert = dp[:, d - 1, lo - 1:hi - 1] + gap_x[:, x_slice]
+                delet = dp[:, d - 1, lo:hi] + gap_y_reversed[:, y_slice]
+            else:
+                insert = dp[:, d - 1, lo - 1:hi - 1] + np.where(
+                    pointers[:, d - 1, lo - 1:hi - 1] == 1, gep, gop)
+                delet = dp[:, d - 1, lo:hi] + np.where(
+                    pointers[:, d - 1, lo:hi] == 2, gep, gop)
+
+            # Ties resolve as np.argmax([match, insert, delet]) would.
+            p = np.where(
+                (match >= insert) & (match >= delet), 0,
+                np.where(insert >= delet, 1, 2)).astype(np.int8)
+            max_score = np.where(p == 0, match, np.where(p == 1, insert, delet))
+            if self.local:
+                max_score = np.where(max_score < 0, 0, max_score)
+            dp[:, d, lo:hi] = max_score
+            pointers[:, d, lo:hi] = p
+        return dp, pointers
+
+    def end_cells(self, dp, n, m):
+        """Find the end cell of each alignment in a batch of skewed DP tables."""
+        batch = len(dp)
+        if not self.local:
+            return np.full(batch, n), np.full(batch, m)
+        # Emulate np.unravel_index(dp.argmax(), dp.shape) on the usual layout,
+        # which picks the first maximum in row-major order.
+        i, j = np.meshgrid(np.arange(n + 1), np.arange(m + 1), indexing="ij")
+        regular = dp[:, i + j, i].reshape(batch, -1)
+        return np.divmod(regular.argmax(axis=1), m + 1)
+
+    def batches(self, pairs, batch_size=1024):
+        """Group pairs by their lengths and encode them into arrays.
+
+        Yield the original indices of the pairs in each batch, together with
+        their encoded (batch, n) and (batch, m) arrays.
+        """
+        for x, y in pairs:
+            self.add_symbols(x)
+            self.add_symbols(y)
+        by_shape = {}
+        for k, (x, y) in enumerate(pairs):
+            by_shape.setdefault((len(x), len(y)), []).append(k)
+        codes = self.codes
+        for (n, m), indices in by_shape.items():
+            for start in range(0, len(indices), batch_size):
+                chunk = indices[start:start + batch_size]
+                x = np.array([[codes[s] for s in pairs[k][0]] for k in chunk],
+                             dtype=np.intp).reshape(len(chunk), n)
+                y = np.array([[codes[s] for s in pairs[k][1]] for k in chunk],
+                             dtype=np.intp).reshape(len(chunk), m)
+                yield chunk, x, y
+
+    def score_many(self, pairs, batch_size=1024):
+        """Return the alignment scores of many pairs of symbol sequences."""
+        pairs = list(pairs)
+        scores = np.empty(len(pairs))
+        for chunk, x, y in self.batches(pairs, batch_size):
+            n, m = x.shape[1], y.shape[1]
+            dp, _ = self.fill(x, y)
+            i, j = self.end_cells(dp, n, m)
+            scores[chunk] = dp[np.arange(len(chunk)), i + j, i]
+        return scores
+
+    def align_many(self, pairs, batch_size=1024):
+        """Return the score and one optimal alignment for many pairs."""
+        pairs = list(pairs)
+        results = [None] * len(pairs)
+        indel = self.indel
+        for chunk, xs, ys in self.batches(pairs, batch_size):
+            n, m = xs.shape[1], ys.shape[1]
+            dp, pointers = self.fill(xs, ys)
+            ends_i, ends_j = self.end_cells(dp, n, m)
+            for b, k in enumerate(chunk):
+                x, y = pairs[k]
+                i, j = int(ends_i[b]), int(ends_j[b])
+                score = float(dp[b, i + j, i])
+                alg = []
+                while (i > 0 or j > 0):
+                    pt = pointers[b, i + j, i]
+                    if pt == 0:
+                        i -= 1
+                        j -= 1
+                        alg.append((x[i], y[j]))
+                    elif pt == 1:
+                        i -= 1
+                        alg.append((x[i], indel))
+                    elif pt == 2:
+                        j -= 1
+                        alg.append((indel, y[j]))
+                    if self.local and dp[b, i + j, i] == 0:
+                        break
+                alg.reverse()
+                results[k] = score, alg
+        return results
+
+    def score(self, x, y):
+        """Return the alignment score of two symbol sequences."""
+        return float(self.score_many([(x, y)])[0])
+
+    def __call__(self, x, y):
+        """Return the alignment score and one optimal alignment."""
+        return self.align_many([(x, y)])[0]
+
+
+def needleman_wunsch(x, y, lodict={}, gop=-2.5, gep=-1.75, local=False, indel=''):
+    """Needleman-Wunsch algorithm with affine gaps penalties.
+
+    Drop-in replacement for
+    `pylexirumah.check_transcription_systems.needleman_wunsch`, see there and
+    in `Aligner` for the parameters. To align many pairs with the same
+    scoring scheme, construct one Aligner and call it repeatedly instead.
+
+    >>> needleman_wunsch("banana", "mancala", local=True)
+    (2.0, [('a', 'a'), ('n', 'n')])
+
+    """
+    return Aligner(lodict, gop=gop, gep=gep, local=local, indel=indel)(x, y)
+
+
+def random_pairs(n_pairs, alphabet="ptkbdgmnŋaeiouslrwjh", min_length=2,
+                 max_length=10, seed=0):
+    """Generate pairs of random strings, the second a mutation of the first."""
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(n_pairs):
+        x = [rng.choice(alphabet)
+             for _ in range(rng.randint(min_length, max_length))]
+        y = [s if rng.random() < 0.7 else rng.choice(alphabet) for s in x]
+        if len(y) > 1 and rng.random() < 0.3:
+            del y[rng.randrange(len(y))]
+        pairs.append(("".join(x), "".join(y)))
+    return pairs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the pairwise alignment engine to the reference"
+        " implementation in check_transcription_systems.")
+    parser.add_argument("--pairs", type=int, default=1000,
+                        help="Number of random string pairs to align."
+                        " (default: 1000)")
+    parser.add_argument("--local", action="store_true", default=False,
+                        help="Benchmark local instead of global alignment.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed for the test pairs. (default: 0)")
+    args = parser.parse_args()
+
+    from pylexirumah.check_transcription_systems import (
+        needleman_wunsch as reference)
+
+    pairs = random_pairs(args.pairs, seed=args.seed)
+
+    start = time.perf_counter()
+    expected = [reference(x, y, local=args.local) for x, y in pairs]
+    reference_time = time.perf_counter() - start
+
+    aligner = Aligner(local=args.local)
+    start = time.perf_counter()
+    results = aligner.align_many(pairs)
+    engine_time = time.perf_counter() - start
+
+    mismatches = sum(
+        1 for (s1, a1), (s2, a2) in zip(expected, results)
+        if s1 != s2 or a1 != a2)
+    print("Reference: {:8.3f}s".format(reference_time))
+    print("Aligner:   {:8.3f}s ({:.1f}× faster)".format(
+        engine_time, reference_time / engine_time))
+    print("Mismatches: {:d} of {:d}".format(mismatches, len(pairs)))
+    sys.exit(1 if mismatches else 0)
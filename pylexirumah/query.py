@@ -0,0 +1,138 @@
+"""Stream rows of CLDF tables, reading only the columns asked for.
+
+`iterdicts` of a csvw table converts every cell of every row. `iter_rows`
+and `iter_forms` instead read the CSV file row by row and
+
+ - convert only the projected `columns`,
+ - check `where` conditions on the raw cell text wherever possible, and
+   skip rows that fail them before converting anything,
+ - never hold more than one row in memory.
+
+>>> forms = iter_forms(columns=["ID", "Segments"],
+...                    where={"Lect_ID": {"alor1247-alor"}})   # doctest: +SKIP
+
+"""
+
+from csvw.dsv import UnicodeReader, Dialect
+
+from pylexirumah import get_dataset
+
+
+def _raw_condition(condition):
+    """Turn a `where` condition into a test of a raw, unconverted cell.
+
+    Strings and collections of strings can be tested on the raw text;
+    return None for conditions that need the converted value.
+
+    """
+    if isinstance(condition, str):
+        return lambda raw: raw == condition
+    if isinstance(condition, (set, frozenset, list, tuple)) and all(
+            isinstance(value, str) for value in condition):
+        condition = frozenset(condition)
+        return condition.__contains__
+    return None
+
+
+def _value_condition(condition):
+    """Turn a `where` condition into a test of a converted value."""
+    if callable(condition):
+        return condition
+    if isinstance(condition, (set, frozenset, list, tuple)):
+        return lambda value: value in condition
+    return lambda value: value == condition
+
+
+def iter_rows(table, columns=None, where=None, match=None, dialect=None):
+    """Stream the rows of a csvw table as dicts.
+
+    Parameters
+    ----------
+    table : csvw.Table
+        A table of a pycldf Dataset, eg. `dataset["FormTable"]`
+    columns : list of str, optional
+        The columns to read (default: all). Other columns are neither
+        converted nor returned.
+    where : dict, optional
+        Conditions the rows must satisfy, by column name: A string, or a
+        collection of strings, which the raw cell must be equal to or one
+        of, or a callable on the converted value, or any other value the
+        converted value must be equal to.
+    match : str, optional
+        Only yield rows in which the raw text of some cell contains this
+        substring (cf. check_transcription_systems --match).
+    dialect : csvw.Dialect, optional
+        The dialect of the table's table group, for tables without a
+        dialect of their own, eg. `dataset.tablegroup.dialect`. (default:
+        csvw's default dialect)
+
+    Yields
+    ------
+    dict
+        Column name: converted value, for the projected columns
+
+    """
+    where = where or {}
+    dialect = table.dialect or dialect or Dialect()
+    fname = table.url.resolve(table.base)
+    with UnicodeReader(fname, dialect=dialect) as reader:
+        reader = iter(reader)
+        if dialect.header:
+            try:
+                header = next(reader)
+            except StopIteration:
+                return
+        else:
+            header = [c.header for c in table.tableSchema.columns
+                      if not c.virtual]
+        readers = [table.tableSchema.get_column(h) for h in header]
+        index = {h: j for j, h in enumerate(header)}
+
+        for name in list(columns or ()) + list(where):
+            if name not in index:
+                raise KeyError("Table {:} has no column {:}".format(
+                    table.url, name))
+        if columns is None:
+            columns = header
+        projection = [(name, index[name], readers[index[name]])
+                      for name in columns]
+
+        raw_checks = []
+        value_checks = []
+        for name, condition in where.items():
+            j = index[name]
+            raw = _raw_condition(condition)
+            if raw is not None and readers[j] is not None and (
+                    readers[j].separator or (
+                        readers[j].datatype is not None and
+                        readers[j].datatype.base != "string")):
+                # Values of other data types or lists are not equal to
+                # their raw text, so these need conversion.
+                raw = None
+            if raw is None:
+                value_checks.append((j, readers[j], _value_condition(condition)))
+            else:
+                raw_checks.append((j, raw))
+
+        for row in reader:
+            if match is not None and not any(match in cell for cell in row):
+                continue
+            if not all(test(row[j]) for j, test in raw_checks):
+                continue
+            if not all(test(read.read(row[j]) if read else row[j])
+                       for j, read, test in value_checks):
+                continue
+            yield {name: read.read(row[j]) if read else row[j]
+                   for name, j, read in projection}
+
+
+def iter_forms(columns=None, where=None, match=None, dataset=None):
+    """Stream the forms of a CLDF Wordlist (default: LexiRumah).
+
+    See `iter_rows` for the parameters.
+
+    """
+    if dataset is None:
+        dataset = get_dataset()
+    return iter_rows(dataset["FormTable"], columns=columns, where=where,
+                     match=match, dialect=dataset.tablegroup.dialect)
@@ -4,6 +4,7 @@
 
 # import pandas
 
+import re
 import sys
 import argparse
 
@@ -31,6 +32,114 @@ WHITELIST = {
     'ʤ': 'dʒ'}
 
 
+class ClpaTokenizer:
+    """Greedy longest-match CLPA tokenizer with compiled preprocessing.
+
+    Tokenize forms exactly like the original `tokenize_clpa` algorithm: Apply
+    the `preprocess` replacements one after the other, then repeatedly take
+    the longest prefix of the rest of the form that CLPA recognizes as a
+    sound.
+
+    The preprocessing replacements are compiled into a single regular
+    expression, which replaces all of them in one pass when that gives the
+    same result as replacing them in order (which is the case for the
+    WHITELIST). CLPA's verdict on every substring is cached, and because CLPA
+    normalization never shortens a segment, a sound can only be a few
+    characters longer than the longest CLPA grapheme. So each form is
+    tokenized in one left-to-right pass, with a bounded number of cached
+    lookups per position.
+
+    """
+    def __init__(self, preprocess=WHITELIST, clpa=CLPA):
+        self.clpa = clpa
+        self.preprocess = list(preprocess.items())
+        self.tokens = {}
+        self.max_length = 1 + max(
+            max(map(len, clpa.whitelist)), max(map(len, clpa.explicit)))
+
+        befores = [before for before, after in self.preprocess]
+        afters = [after for before, after in self.preprocess]
+        single_pass = all(befores) and all(
+            after and not any(c.isspace() for c in after) for after in afters)
+        for i, before in enumerate(befores):
+            for j, other in enumerate(befores):
+                if j > i and set(before) & set(other):
+                    # Overlapping rules: Order matters.
+                    single_pass = False
+                if j > i and set(afters[i]) & set(other):
+                    # Replacements can feed later rules.
+                    single_pass = False
+        if single_pass and self.preprocess:
+            self.pattern = re.compile("|".join(
+                re.escape(before)
+                for before in sorted(befores, key=len, reverse=True)))
+            self.replacements = dict(self.preprocess)
+        else:
+            self.pattern = None
+
+    def normalize(self, form):
+        """Apply the preprocessing replacements to a form."""
+        if self.pattern is not None:
+            return self.pattern.sub(
+                lambda match: self.replacements[match.group()], form.strip())
+        for before, after in self.preprocess:
+            form = form.strip().replace(before, after)
+        return form
+
+    def token(self, string):
+        """Look up the CLPA token for a string, using the cache.
+
+        Tokens are shared between all forms they occur in.
+        """
+        try:
+            return self.tokens[string]
+        except KeyError:
+            token = self.tokens[string] = self.clpa(string)[0]
+            return token
+
+    def __call__(self, form, ignore_clpa_errors=True):
+        """Return the CLPA sequence of a word form, see `tokenize_clpa`."""
+        form = self.normalize(form)
+        n = len(form)
+        if " " in form or "/" in form:
+            # CLPA splits strings at spaces and accepts 'anything/sound' as
+            # custom symbol, so sounds can be arbitrarily long.
+            limit = n
+        else:
+            limit = self.max_length
+
+        result = []
+        start = 0
+        while start < n:
+            for end in range(min(n, start + limit), start, -1):
+                token = self.token(form[start:end])
+                if isinstance(token, pyclpa.base.Sound):
+                    result.append(token)
+                    start = end
+                    break
+            else:
+                if ignore_clpa_errors:
+                    result.append(self.token(form[start]))
+                    start += 1
+                else:
+                    raise ValueError(
+                        "\"%s\" is not a valid CLPA segment." % (form[start]))
+        return result
+
+
+_tokenizers = {}
+
+
+def compiled_tokenizer(preprocess=WHITELIST):
+    """Return the shared ClpaTokenizer for these preprocessing replacements."""
+    key = tuple(preprocess.items())
+    try:
+        return _tokenizers[key]
+    except KeyError:
+        tokenizer = _tokenizers[key] = ClpaTokenizer(preprocess)
+        return tokenizer
+
+
 def tokenize_clpa(form, ignore_clpa_errors=True, preprocess=WHITELIST):
     """Return the CLPA sequence of a word form.
 
@@ -79,36 +188,27 @@ def tokenize_clpa(form, ignore_clpa_errors=True, preprocess=WHITELIST):
       ...
     ValueError: "9" is not a valid CLPA segment.
     """
-    for before, after in preprocess.items():
-        form = form.strip().replace(before, after)
-
-    result = []
-    index_fw = 0
-    index_bw = len(form)
-
-    while True:
-        if index_bw == index_fw and index_bw < len(form):
-            # This section dictates what happens when the whole string is not parsed yet and
-            # a viable CLPA sequence has not been found.
-            if ignore_clpa_errors:
-                unknown_segment = CLPA(form[index_bw])[0]
-                result.append(unknown_segment)
-                index_fw += 1
-                index_bw = len(form)
-                continue
-            else:
-                raise ValueError("\"%s\" is not a valid CLPA segment." % (form[index_bw]))
-        elif index_fw == len(form):
-            return result
-
-        possible_token = CLPA(form[index_fw:index_bw])[0]
-        if isinstance(possible_token, pyclpa.base.Sound):
-            # This section appends a CLPA match to the list that is to be returned in the end.
-            result.append(possible_token)
-            index_fw = index_bw
-            index_bw = len(form)
-        else:
-            index_bw -= 1
+    return compiled_tokenizer(preprocess)(form, ignore_clpa_errors)
+
+
+def tokenize_many(forms, ignore_clpa_errors=True, preprocess=WHITELIST):
+    """Return the CLPA sequences of many word forms.
+
+    This is equivalent to calling `tokenize_clpa` on each form, see there
+    for the parameters.
+
+    Returns
+    -------
+    list of lists
+        One list of CLPA objects for each form.
+
+    Examples
+    --------
+    >>> [" ".join([str(x) for x in t]) for t in tokenize_many(["baa", "a"])]
+    ['b aː', 'a']
+    """
+    tokenizer = compiled_tokenizer(preprocess)
+    return [tokenizer(form, ignore_clpa_errors) for form in forms]
 
 
 if __name__ == '__main__':
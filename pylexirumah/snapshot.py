@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+
+"""Binary snapshots of a CLDF dataset, for fast loading.
+
+Parsing and type-checking the CSV files of LexiRumah takes seconds. A
+snapshot stores every column of every table as a NumPy array of codes into
+one table of all distinct strings (list-valued columns like Segments or
+Source get an additional array of offsets), next to a manifest recording
+the content hash of the metadata and CSV files it was built from. Loading a
+snapshot maps the arrays into memory and reads the string table, and
+columns are only decoded when they are used.
+
+Build a snapshot with
+
+    $ python -m pylexirumah.snapshot
+
+and load it with `load_snapshot()` or `get_dataset(snapshot=True)`, which
+fall back to the CSV files if the snapshot is missing or out of date.
+
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import collections
+from decimal import Decimal
+
+import numpy
+from clldutils.path import Path
+
+from pylexirumah import get_dataset, repository
+from pylexirumah.store import Encoding, FormStore, PackedStrings, make_column
+
+SNAPSHOT_VERSION = 1
+
+TERMS = "http://cldf.clld.org/v1.0/terms.rdf#"
+
+
+def snapshot_directory_of(metadata_file):
+    """The default location of the snapshot of a dataset."""
+    return Path(metadata_file).parent / ".snapshot"
+
+
+def content_hash(files):
+    """Hash the contents of the files, in order."""
+    digest = hashlib.sha1()
+    for file in files:
+        digest.update(str(Path(file).name).encode("utf-8"))
+        with Path(file).open("rb") as content:
+            for block in iter(lambda: content.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def dataset_files(dataset):
+    """List the metadata file and the table files of a pycldf Dataset."""
+    return [Path(dataset.tablegroup._fname)] + [
+        Path(dataset.directory) / table.url.string for table in dataset.tables]
+
+
+def _short_term(uri):
+    """Reduce a CLDF term URI to the term, eg. 'FormTable' or 'id'."""
+    if uri and uri.startswith(TERMS):
+        return uri[len(TERMS):]
+    return uri
+
+
+def _encode_scalar(value):
+    if isinstance(value, Decimal):
+        return {"decimal": str(value)}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return {"str": str(value)}
+
+
+def _decode_scalar(value):
+    if isinstance(value, dict):
+        if "decimal" in value:
+            return Decimal(value["decimal"])
+        return value["str"]
+    return value
+
+
+def write_snapshot(dataset, directory=None):
+    """Write a snapshot of a pycldf Dataset.
+
+    The snapshot goes to `directory` (default: '.snapshot' next to the
+    metadata file), replacing any previous snapshot there.
+
+    """
+    metadata_file, *table_files = dataset_files(dataset)
+    if directory is None:
+        directory = snapshot_directory_of(metadata_file)
+    directory = Path(directory)
+
+    strings = Encoding()
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "hash": content_hash([metadata_file] + table_files),
+        "metadata": metadata_file.name,
+        "files": [file.name for file in table_files],
+        "module": dataset.module,
+        "tables": []}
+    os.makedirs(str(directory.parent), exist_ok=True)
+    build = Path(tempfile.mkdtemp(dir=str(directory.parent), suffix=".tmp"))
+    try:
+        for t, table in enumerate(dataset.tables):
+            columns = table.tableSchema.columns
+            values = collections.OrderedDict((c.name, []) for c in columns)
+            n_rows = 0
+            for row in table.iterdicts():
+                n_rows += 1
+                for name, column in values.items():
+                    column.append(row.get(name))
+            description = {
+                "url": table.url.string,
+                "component": _short_term(table.common_props.get("dc:conformsTo")),
+                "rows": n_rows,
+                "columns": []}
+            for c, column in enumerate(columns):
+                file = "{:d}-{:d}".format(t, c)
+                cells = values[column.name]
+                entry = {
+                    "name": column.name,
+                    "property": _short_term(
+                        column.propertyUrl and column.propertyUrl.uri),
+                    "file": file}
+                if column.separator:
+                    entry["kind"] = "list"
+                    offsets = [0]
+                    codes = []
+                    for cell in cells:
+                        codes.extend(strings.add(v) for v in cell or ())
+                        offsets.append(len(codes))
+                    numpy.save(str(build / (file + ".offsets.npy")),
+                               numpy.array(offsets, dtype=numpy.int64))
+                elif all(cell is None or isinstance(cell, str) for cell in cells):
+                    entry["kind"] = "string"
+                    codes = [-1 if cell is None else strings.add(cell)
+                             for cell in cells]
+                else:
+                    entry["kind"] = "scalar"
+                    scalars = Encoding()
+                    codes = [scalars.add(cell) for cell in cells]
+                    entry["values"] = [_encode_scalar(v) for v in scalars.values]
+                numpy.save(str(build / (file + ".codes.npy")),
+                           numpy.array(codes, dtype=numpy.int32))
+                description["columns"].append(entry)
+            manifest["tables"].append(description)
+        with (build / "strings.json").open("w", encoding="utf-8") as file:
+            json.dump(strings.values, file, ensure_ascii=False)
+        # The manifest is written last: Without it, the snapshot is invalid.
+        with (build / "manifest.json").open("w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=1)
+
+        if directory.exists():
+            trash = Path(tempfile.mkdtemp(
+                dir=str(directory.parent), suffix=".old"))
+            os.replace(str(directory), str(trash / "snapshot"))
+            os.replace(str(build), str(directory))
+            shutil.rmtree(str(trash))
+        else:
+            os.replace(str(build), str(directory))
+    except BaseException:
+        shutil.rmtree(str(build), ignore_errors=True)
+        raise
+    return directory
+
+
+class SnapshotColumn(collections.namedtuple(
+        "SnapshotColumn", ["name", "propertyUrl", "kind"])):
+    """The description of a column, with a `name` like a csvw Column."""
+    __slots__ = ()
+
+
+class SnapshotTable:
+    """One table of a snapshot, decoded lazily column by column."""
+    def __init__(self, snapshot, description):
+        self.snapshot = snapshot
+        self.url = description["url"]
+        self.component = description["component"]
+        self.rows = description["rows"]
+        self.descriptions = collections.OrderedDict(
+            (c["name"], c) for c in description["columns"])
+        self._columns = {}
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def column_names(self):
+        return list(self.descriptions)
+
+    def column_description(self, name_or_property):
+        try:
+            return self.descriptions[name_or_property]
+        except KeyError:
+            for description in self.descriptions.values():
+                if description["property"] == name_or_property:
+                    return description
+        raise KeyError(name_or_property)
+
+    def codes(self, name):
+        """The codes of a column, memory-mapped.
+
+        For 'string' and 'list' columns, these are indices into the string
+        table of the snapshot, with -1 for None.
+
+        """
+        return self.snapshot.array(
+            self.column_description(name)["file"] + ".codes.npy")
+
+    def offsets(self, name):
+        return self.snapshot.array(
+            self.column_description(name)["file"] + ".offsets.npy")
+
+    def column(self, name):
+        """The decoded values of a column, as a list."""
+        description = self.column_description(name)
+        name = description["name"]
+        try:
+            return self._columns[name]
+        except KeyError:
+            pass
+        codes = self.codes(name).tolist()
+        if description["kind"] == "string":
+            strings = self.snapshot.strings + [None]
+            values = [strings[c] for c in codes]
+        elif description["kind"] == "list":
+            strings = self.snapshot.strings
+            offsets = self.offsets(name).tolist()
+            items = [strings[c] for c in codes]
+            values = [items[start:end]
+                      for start, end in zip(offsets[:-1], offsets[1:])]
+        else:
+            scalars = [_decode_scalar(v) for v in description["values"]]
+            values = [scalars[c] for c in codes]
+        self._columns[name] = values
+        return values
+
+    def iterdicts(self):
+        """Iterate over the rows as OrderedDicts, like csvw does."""
+        names = self.column_names
+        columns = [self.column(name) for name in names]
+        for values in zip(*columns):
+            yield collections.OrderedDict(zip(names, values))
+
+
+class Snapshot:
+    """A CLDF dataset loaded from a snapshot.
+
+    A Snapshot can stand in for a pycldf Dataset where data is only read:
+    `snapshot["FormTable"].iterdicts()` and `snapshot["FormTable", "id"].name`
+    work as usual. Everything else (eg. `sources`) is taken from the
+    pycldf Dataset, which is loaded on first use.
+
+    """
+    def __init__(self, directory, manifest, metadata_file):
+        self.directory = Path(directory)
+        self.manifest = manifest
+        self.metadata_file = metadata_file
+        self.module = manifest["module"]
+        self.tables = [SnapshotTable(self, description)
+                       for description in manifest["tables"]]
+        self._strings = None
+        self._dataset = None
+
+    @property
+    def strings(self):
+        if self._strings is None:
+            with (self.directory / "strings.json").open(encoding="utf-8") as file:
+                self._strings = json.load(file)
+        return self._strings
+
+    def array(self, file):
+        return numpy.load(str(self.directory / file), mmap_mode="r")
+
+    def table(self, name):
+        for table in self.tables:
+            if name in (table.component, table.url):
+                return table
+        raise KeyError(name)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            table, column = key
+            description = self.table(table).column_description(column)
+            return SnapshotColumn(
+                description["name"], description["property"],
+                description["kind"])
+        return self.table(key)
+
+    @property
+    def dataset(self):
+        """The pycldf Dataset the snapshot was built from."""
+        if self._dataset is None:
+            self._dataset = get_dataset(self.metadata_file)
+        return self._dataset
+
+    @property
+    def sources(self):
+        return self.dataset.sources
+
+    def form_store(self):
+        """Build a `FormStore` of the FormTable directly from the arrays."""
+        table = self.table("FormTable")
+        names = {p: table.column_description(p)["name"] for p in (
+            "id", "languageReference", "parameterReference", "segments")}
+        strings = self.strings
+
+        def encode(codes):
+            # Re-code densely, numbering in order of first occurrence
+            unique, first, inverse = numpy.unique(
+                codes, return_index=True, return_inverse=True)
+            order = numpy.argsort(first, kind="stable")
+            rank = numpy.empty_like(order)
+            rank[order] = numpy.arange(len(order))
+            encoding = Encoding(
+                None if c < 0 else strings[c] for c in unique[order])
+            return rank[inverse].astype(numpy.int32), encoding
+
+        lect, lects = encode(numpy.asarray(table.codes(names["languageReference"])))
+        concept, concepts = encode(numpy.asarray(table.codes(names["parameterReference"])))
+        segment_codes, segments = encode(numpy.asarray(table.codes(names["segments"])))
+
+        return FormStore(
+            PackedStrings.from_values(table.column(names["id"])), lect, concept,
+            segment_codes,
+            numpy.array(table.offsets(names["segments"]), dtype=numpy.int64),
+            lects, concepts, segments,
+            {name: make_column(table.column(name))
+             for name in table.column_names if name not in names.values()},
+            {p: name for p, name in names.items()})
+
+
+def load_snapshot(fname=None, directory=None):
+    """Load the snapshot of a CLDF dataset, if it is up to date.
+
+    Parameters
+    ----------
+    fname : str or Path
+        Path to the metadata file of the dataset (default: LexiRumah)
+    directory : str or Path
+        The snapshot directory (default: '.snapshot' next to `fname`)
+
+    Returns
+    -------
+    Snapshot or None
+        None if there is no snapshot, or if the dataset's files have changed
+        since the snapshot was built
+
+    """
+    metadata_file = Path(repository if fname is None else fname)
+    if directory is None:
+        directory = snapshot_directory_of(metadata_file)
+    directory = Path(directory)
+    try:
+        with (directory / "manifest.json").open(encoding="utf-8") as file:
+            manifest = json.load(file)
+        if manifest["version"] != SNAPSHOT_VERSION:
+            return None
+        if manifest["metadata"] != metadata_file.name:
+            return None
+        files = [metadata_file] + [
+            metadata_file.parent / name for name in manifest["files"]]
+        if content_hash(files) != manifest["hash"]:
+            return None
+    except (OSError, ValueError, KeyError):
+        return None
+    return Snapshot(directory, manifest, metadata_file)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Write a binary snapshot of a CLDF dataset for fast loading.")
+    parser.add_argument("--wordlist",
+                        type=Path, default=repository,
+                        help="The metadata file of the dataset."
+                        " (default: LexiRumah.)")
+    parser.add_argument("--output",
+                        type=Path, default=None,
+                        help="The snapshot directory. (default: .snapshot"
+                        " next to the metadata file)")
+    args = parser.parse_args()
+
+    directory = write_snapshot(get_dataset(args.wordlist), args.output)
+    print("Wrote snapshot to {:}".format(directory))
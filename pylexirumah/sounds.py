@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+"""A process-wide table of BIPA segments.
+
+Resolving a grapheme through pyclts's BIPA parser is slow, but word lists
+only contain a few hundred distinct segments. The `segments` table resolves
+each grapheme once and keeps the result, so that repeat lookups cost one
+dictionary access. The table can be preloaded from a precomputed file (see
+`SegmentTable.save` and the script below), so that worker processes start
+without loading pyclts at all unless they meet a new segment.
+
+>>> segment("a:").normalized
+'aː'
+>>> normalize("ˈa")
+'a'
+>>> segment("xyz").known
+False
+
+"""
+
+import json
+import tempfile
+from collections import namedtuple
+
+from clldutils.path import Path
+
+from pylexirumah import cache_directory
+
+SEGMENT_TABLE_VERSION = 1
+
+
+class Segment(namedtuple(
+        "Segment", ["grapheme", "normalized", "type", "name", "features",
+                    "known"])):
+    """A grapheme resolved with BIPA.
+
+    grapheme : str
+        The segment as given
+    normalized : str
+        Its normalized BIPA form (the grapheme itself if it is unknown)
+    type : str
+        The pyclts class of the sound, eg. 'Vowel', 'Marker', 'UnknownSound'
+    name : str or None
+        The BIPA feature description
+    features : frozenset of str
+        The BIPA feature bundle, empty for unknown sounds
+    known : bool
+        Whether BIPA knows the sound
+
+    A Segment converts to str like the pyclts sound does, ie. to its
+    normalized form.
+
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return self.normalized
+
+
+def bipa(transcription_system={}):
+    """Load the BIPA transcription system of pyclts, once."""
+    try:
+        return transcription_system["bipa"]
+    except KeyError:
+        import pyclts
+        transcription_system["bipa"] = pyclts.TranscriptionSystem("bipa")
+        return transcription_system["bipa"]
+
+
+def pyclts_version():
+    """The installed version of pyclts, or None if it is not known.
+
+    importlib.metadata is new in Python 3.8, older versions fall back to
+    pkg_resources.
+
+    """
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        try:
+            import pkg_resources
+        except ImportError:
+            return None
+        try:
+            return pkg_resources.get_distribution("pyclts").version
+        except pkg_resources.DistributionNotFound:
+            return None
+    try:
+        return version("pyclts")
+    except PackageNotFoundError:
+        return None
+
+
+class SegmentTable:
+    """A memo of graphemes resolved with BIPA.
+
+    Parameters
+    ----------
+    path : Path, optional
+        A file written by `save` to preload the table from. Missing, corrupt
+        or outdated files are ignored, and so are all files if the version of
+        pyclts is not known.
+
+    """
+    def __init__(self, path=None):
+        self.table = {}
+        if path is not None:
+            self.load(path)
+
+    def __getitem__(self, grapheme):
+        try:
+            return self.table[grapheme]
+        except KeyError:
+            pass
+        sound = bipa()[grapheme]
+        features = getattr(sound, "featureset", None)
+        result = self.table[grapheme] = Segment(
+            grapheme, str(sound), type(sound).__name__,
+            getattr(sound, "name", None),
+            frozenset(features or ()),
+            type(sound).__name__ != "UnknownSound")
+        return result
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, grapheme):
+        return grapheme in self.table
+
+    def normalize(self, grapheme):
+        """Return the normalized BIPA string of the grapheme."""
+        return self[grapheme].normalized
+
+    def update(self, graphemes):
+        """Resolve all graphemes, so they end up in the table."""
+        for grapheme in graphemes:
+            self[grapheme]
+
+    def load(self, path):
+        try:
+            with Path(path).open(encoding="utf-8") as table:
+                data = json.load(table)
+            version = pyclts_version()
+            if (data["version"] != SEGMENT_TABLE_VERSION or
+                    version is None or data["pyclts"] != version):
+                return False
+            for grapheme, normalized, type, name, features, known in (
+                    data["segments"]):
+                self.table.setdefault(grapheme, Segment(
+                    grapheme, normalized, type, name, frozenset(features),
+                    known))
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        return True
+
+    def save(self, path):
+        """Write the table to a file, replacing it atomically."""
+        path = Path(path)
+        try:
+            path.parent.mkdir(parents=True)
+        except FileExistsError:
+            pass
+        with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=str(path.parent), suffix=".tmp",
+                delete=False) as table:
+            json.dump({
+                "version": SEGMENT_TABLE_VERSION,
+                "pyclts": pyclts_version(),
+                "segments": [
+                    [s.grapheme, s.normalized, s.type, s.name,
+                     sorted(s.features), s.known]
+                    for s in self.table.values()]},
+                table, ensure_ascii=False)
+        Path(table.name).replace(path)
+
+
+segment_table_file = cache_directory / "bipa-segments.json"
+
+segments = SegmentTable(segment_table_file)
+
+
+def segment(grapheme):
+    """Look up a grapheme in the shared segment table."""
+    return segments[grapheme]
+
+
+def normalize(grapheme):
+    """Return the normalized BIPA string of a grapheme, using the shared table."""
+    return segments[grapheme].normalized
+
+
+if __name__ == "__main__":
+    import argparse
+    from pylexirumah import get_dataset, repository
+    parser = argparse.ArgumentParser(
+        description="Precompute the BIPA segment table for all segments in a"
+        " CLDF Wordlist.")
+    parser.add_argument("--wordlist",
+                        type=Path, default=repository,
+                        help="The Wordlist to take segments from."
+                        " (default: LexiRumah.)")
+    parser.add_argument("--output",
+                        type=Path, default=segment_table_file,
+                        help="The file to write the table to."
+                        " (default: {:})".format(segment_table_file))
+    args = parser.parse_args()
+
+    dataset = get_dataset(args.wordlist)
+    c_segments = dataset["FormTable", "segments"].name
+    segments.update(bipa().sounds)
+    for row in dataset["FormTable"].iterdicts():
+        segments.update(row[c_segments] or ())
+    segments.save(args.output)
+    print("Wrote {:d} segments to {:}".format(len(segments), args.output))
@@ -0,0 +1,439 @@
+"""A columnar in-memory store of a CLDF FormTable.
+
+Materializing the FormTable as a list of dicts costs a dict, and a key per
+column, for every form. `FormStore` instead keeps every column as one array:
+lects and concepts are dictionary-encoded as small integers, the segments of
+all forms are one flat int32 buffer of segment codes with offsets. The IDs
+are one UTF-8 buffer with offsets, and the other columns are dictionary
+encoded or packed the same way, list columns like Source as codes with
+offsets (see `make_column`). Grouping by lect or concept sorts the codes
+once, after which every group is a slice of an index array.
+
+"""
+
+import numpy
+
+from pylexirumah import get_dataset
+
+
+class Encoding:
+    """A dictionary encoding of strings as consecutive small integers.
+
+    >>> e = Encoding()
+    >>> e.encode(["b", "a", "b"])
+    array([0, 1, 0], dtype=int32)
+    >>> e.values
+    ['b', 'a']
+    >>> e["a"]
+    1
+
+    """
+    def __init__(self, values=()):
+        self.values = []
+        self.index = {}
+        for value in values:
+            self.add(value)
+
+    def add(self, value):
+        try:
+            return self.index[value]
+        except KeyError:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+            return code
+
+    def encode(self, values):
+        return numpy.fromiter((self.add(v) for v in values), dtype=numpy.int32)
+
+    def decode(self, codes):
+        return [self.values[c] for c in codes]
+
+    def __getitem__(self, value):
+        return self.index[value]
+
+    def __contains__(self, value):
+        return value in self.index
+
+    def __len__(self):
+        return len(self.values)
+
+
+def compact_codes(codes, n_values):
+    """Store codes in the smallest unsigned integer type that holds them."""
+    for dtype in (numpy.uint8, numpy.uint16, numpy.uint32):
+        if n_values <= numpy.iinfo(dtype).max + 1:
+            return numpy.array(codes, dtype=dtype)
+    return numpy.array(codes, dtype=numpy.int64)
+
+
+def compact_offsets(offsets):
+    """Store offsets as int32 where they fit, as int64 otherwise."""
+    if offsets and offsets[-1] > numpy.iinfo(numpy.int32).max:
+        return numpy.array(offsets, dtype=numpy.int64)
+    return numpy.array(offsets, dtype=numpy.int32)
+
+
+class Column:
+    """A column of values of a store, indexed like a sequence.
+
+    `column[i]` is the value of form i; indexing with a slice, an index
+    array or a boolean mask gives a list of values.
+
+    """
+    def __getitem__(self, i):
+        if isinstance(i, (int, numpy.integer)):
+            if i < 0:
+                i += len(self)
+            if not 0 <= i < len(self):
+                raise IndexError(i)
+            return self.value(int(i))
+        return [self.value(j) for j in numpy.arange(len(self))[i].tolist()]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.value(i)
+
+
+class CodedColumn(Column):
+    """A column of (hashable) values, dictionary-encoded as small integers."""
+    def __init__(self, codes, encoding):
+        self.codes = codes
+        self.encoding = encoding
+
+    @classmethod
+    def from_values(cls, values):
+        encoding = Encoding()
+        codes = [encoding.add(v) for v in values]
+        return cls(compact_codes(codes, len(encoding)), encoding)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def value(self, i):
+        return self.encoding.values[self.codes[i]]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+
+class PackedStrings(Column):
+    """A column of mostly distinct strings, as one UTF-8 buffer with offsets.
+
+    String i is `buffer[offsets[i]:offsets[i + 1]]`, or None where
+    `missing[i]`. Looking up the position of a string with `index` uses a
+    sorted permutation, built on first use.
+
+    >>> ids = PackedStrings.from_values(["b", "a", None, "c"])
+    >>> ids[1], ids[2], ids[[0, 3]]
+    ('a', None, ['b', 'c'])
+    >>> ids.index("c")
+    3
+
+    """
+    def __init__(self, buffer, offsets, missing=None):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.missing = missing
+        self._order = None
+
+    @classmethod
+    def from_values(cls, values):
+        encoded = []
+        offsets = [0]
+        missing = []
+        for value in values:
+            missing.append(value is None)
+            if value is not None:
+                encoded.append(value.encode("utf-8"))
+                offsets.append(offsets[-1] + len(encoded[-1]))
+            else:
+                offsets.append(offsets[-1])
+        return cls(numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8),
+                   compact_offsets(offsets),
+                   numpy.array(missing, dtype=bool) if any(missing) else None)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def value(self, i):
+        if self.missing is not None and self.missing[i]:
+            return None
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def index(self, value):
+        """Return the position of the first occurrence of value."""
+        if self._order is None:
+            self._order = numpy.array(
+                sorted((i for i in range(len(self))
+                        if self.missing is None or not self.missing[i]),
+                       key=lambda i: (self.value(i), i)),
+                dtype=numpy.int64)
+        low, high = 0, len(self._order)
+        while low < high:
+            middle = (low + high) // 2
+            if self.value(self._order[middle]) < value:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self._order) and self.value(self._order[low]) == value:
+            return int(self._order[low])
+        raise KeyError(value)
+
+    @property
+    def nbytes(self):
+        return (self.buffer.nbytes + self.offsets.nbytes +
+                (0 if self.missing is None else self.missing.nbytes))
+
+
+class ListColumn(Column):
+    """A column of lists (eg. Source, Alignment), as codes with offsets.
+
+    The items of list i are coded as `codes[offsets[i]:offsets[i + 1]]`;
+    where `missing[i]`, the value is None instead of a list.
+
+    """
+    def __init__(self, codes, offsets, encoding, missing=None):
+        self.codes = codes
+        self.offsets = offsets
+        self.encoding = encoding
+        self.missing = missing
+
+    @classmethod
+    def from_values(cls, values):
+        encoding = Encoding()
+        codes = []
+        offsets = [0]
+        missing = []
+        for value in values:
+            missing.append(value is None)
+            codes.extend(encoding.add(v) for v in value or ())
+            offsets.append(len(codes))
+        return cls(compact_codes(codes, len(encoding)),
+                   compact_offsets(offsets), encoding,
+                   numpy.array(missing, dtype=bool) if any(missing) else None)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def value(self, i):
+        if self.missing is not None and self.missing[i]:
+            return None
+        return self.encoding.decode(
+            self.codes[self.offsets[i]:self.offsets[i + 1]])
+
+    @property
+    def nbytes(self):
+        return (self.codes.nbytes + self.offsets.nbytes +
+                (0 if self.missing is None else self.missing.nbytes))
+
+
+def make_column(values):
+    """Store a list of cell values in the most compact kind of column.
+
+    Lists go into a `ListColumn`. Strings go into `PackedStrings` if most
+    of them are distinct, and like all other values into a `CodedColumn`
+    otherwise.
+
+    """
+    if any(isinstance(v, (list, tuple)) for v in values):
+        return ListColumn.from_values(values)
+    if all(v is None or isinstance(v, str) for v in values):
+        distinct = set(values)
+        if len(distinct) > len(values) // 2:
+            return PackedStrings.from_values(values)
+    return CodedColumn.from_values(values)
+
+
+class Groups:
+    """The forms of a store grouped by an integer-coded column.
+
+    `order` lists the form indices sorted (stably) by their code, and the
+    forms with code c are `order[starts[c]:starts[c + 1]]`.
+
+    """
+    def __init__(self, codes, encoding):
+        self.encoding = encoding
+        self.order = numpy.argsort(codes, kind="stable")
+        self.starts = numpy.searchsorted(
+            codes[self.order], numpy.arange(len(encoding) + 1))
+
+    def indices(self, code):
+        return self.order[self.starts[code]:self.starts[code + 1]]
+
+    def __getitem__(self, value):
+        """Return the indices of the forms with this value."""
+        try:
+            code = self.encoding[value]
+        except KeyError:
+            return self.order[:0]
+        return self.indices(code)
+
+    def __iter__(self):
+        """Iterate over (value, form indices) pairs, in order of first occurrence."""
+        for code, value in enumerate(self.encoding.values):
+            yield value, self.indices(code)
+
+    def __len__(self):
+        return len(self.encoding)
+
+    def sizes(self):
+        return numpy.diff(self.starts)
+
+
+class FormStore:
+    """The FormTable of a CLDF Wordlist as columns of arrays.
+
+    Build a store with `FormStore.from_dataset` or `FormStore.from_rows`.
+
+    Attributes
+    ----------
+    ids : PackedStrings
+        The form IDs, in FormTable order
+    lect, concept : numpy.ndarray of int32
+        The lect and concept codes of the forms, see `lects` and `concepts`
+    lects, concepts, segment_inventory : Encoding
+        The encodings of lect IDs, concept IDs and segments
+    segment_codes : numpy.ndarray of int32
+        The codes of the segments of all forms, concatenated
+    segment_offsets : numpy.ndarray of int64
+        The segments of form i are segment_codes[offsets[i]:offsets[i + 1]]
+    columns : dict of str: Column
+        All other columns, see `make_column`
+
+    """
+    def __init__(self, ids, lect, concept, segment_codes, segment_offsets,
+                 lects, concepts, segment_inventory, columns=None,
+                 column_names=None):
+        self.ids = ids
+        self.lect = lect
+        self.concept = concept
+        self.segment_codes = segment_codes
+        self.segment_offsets = segment_offsets
+        self.lects = lects
+        self.concepts = concepts
+        self.segment_inventory = segment_inventory
+        self.columns = columns or {}
+        self.column_names = column_names or {
+            "id": "ID", "languageReference": "Lect_ID",
+            "parameterReference": "Concept_ID", "segments": "Segments"}
+        self._groups = {}
+
+    @classmethod
+    def from_rows(cls, rows, id="ID", lect="Lect_ID", concept="Concept_ID",
+                  segments="Segments"):
+        """Build a store from an iterable of FormTable row dicts.
+
+        The rows are consumed one by one, so they need not fit in memory as
+        dicts. `id`, `lect`, `concept` and `segments` are the names of the
+        respective columns.
+
+        """
+        ids = []
+        lect_encoding, concept_encoding = Encoding(), Encoding()
+        segment_encoding = Encoding()
+        lects, concepts = [], []
+        segment_codes = []
+        offsets = [0]
+        other = {}
+        for i, row in enumerate(rows):
+            for key in row:
+                if key not in (id, lect, concept, segments) and key not in other:
+                    other[key] = [None] * i
+            for key, values in other.items():
+                values.append(row.get(key))
+            ids.append(row[id])
+            lects.append(lect_encoding.add(row[lect]))
+            concepts.append(concept_encoding.add(row[concept]))
+            segment_codes.extend(
+                segment_encoding.add(s) for s in row.get(segments) or ())
+            offsets.append(len(segment_codes))
+
+        return cls(
+            PackedStrings.from_values(ids),
+            numpy.array(lects, dtype=numpy.int32),
+            numpy.array(concepts, dtype=numpy.int32),
+            numpy.array(segment_codes, dtype=numpy.int32),
+            numpy.array(offsets, dtype=numpy.int64),
+            lect_encoding, concept_encoding, segment_encoding,
+            {key: make_column(values) for key, values in other.items()},
+            {"id": id, "languageReference": lect,
+             "parameterReference": concept, "segments": segments})
+
+    @classmethod
+    def from_dataset(cls, dataset=None):
+        """Load the FormTable of a CLDF Wordlist (default: LexiRumah)."""
+        if dataset is None:
+            dataset = get_dataset()
+        return cls.from_rows(
+            dataset["FormTable"].iterdicts(),
+            id=dataset["FormTable", "id"].name,
+            lect=dataset["FormTable", "languageReference"].name,
+            concept=dataset["FormTable", "parameterReference"].name,
+            segments=dataset["FormTable", "segments"].name)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index(self, form_id):
+        """Return the row number of a form ID."""
+        return self.ids.index(form_id)
+
+    def segment_slice(self, i):
+        """Return the segment codes of form i, as a view into the buffer."""
+        return self.segment_codes[
+            self.segment_offsets[i]:self.segment_offsets[i + 1]]
+
+    def segments(self, i):
+        """Return the segments of form i, as a list of str."""
+        return self.segment_inventory.decode(self.segment_slice(i))
+
+    def row(self, i):
+        """Return form i as a dict, like `iterdicts` of the FormTable would."""
+        names = self.column_names
+        row = {
+            names["id"]: self.ids[i],
+            names["languageReference"]: self.lects.values[self.lect[i]],
+            names["parameterReference"]: self.concepts.values[self.concept[i]],
+            names["segments"]: self.segments(i)}
+        for key, values in self.columns.items():
+            row[key] = values[i]
+        return row
+
+    def iterdicts(self, indices=None):
+        """Iterate over the forms (or the forms at indices) as dicts."""
+        if indices is None:
+            indices = range(len(self))
+        for i in indices:
+            yield self.row(i)
+
+    def groups(self, by):
+        """Group the forms by 'lect' or 'concept'. The grouping is cached."""
+        try:
+            return self._groups[by]
+        except KeyError:
+            pass
+        if by == "lect":
+            groups = Groups(self.lect, self.lects)
+        elif by == "concept":
+            groups = Groups(self.concept, self.concepts)
+        else:
+            raise ValueError("Cannot group forms by {:}".format(by))
+        self._groups[by] = groups
+        return groups
+
+    def by_lect(self):
+        return self.groups("lect")
+
+    def by_concept(self):
+        return self.groups("concept")
+
+    def nbytes(self):
+        """The memory taken by the arrays of the store.
+
+        This excludes the distinct values of dictionary-encoded columns.
+
+        """
+        return sum(a.nbytes for a in [
+            self.ids, self.lect, self.concept, self.segment_codes,
+            self.segment_offsets] + list(self.columns.values()))
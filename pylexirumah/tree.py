@@ -0,0 +1,338 @@
+"""Distance-based tree construction, eg. for alignment guide trees.
+
+All functions take a square, symmetric distance matrix and return the root of
+a `newick.Node` tree whose leaves are named after the rows of the matrix.
+
+"""
+
+import numpy
+from newick import Node
+
+
+def _agglomerate(distance_matrix, names, weighted):
+    """Cluster hierarchically, merging the closest pair of clusters.
+
+    This is the common implementation of UPGMA and WPGMA. The distance matrix
+    is copied once and then updated in place: merged clusters take the row of
+    the lower index of the two, the other row is masked with infinity. For
+    every row, the minimum distance and its column are cached, so finding the
+    closest pair takes O(n) and only rows whose cached minimum involved the
+    merged clusters need to be rescanned. In total, this takes O(n²) time in
+    all but pathological cases.
+
+    Ties are broken like a row-major scan of the upper triangle would, ie.
+    the pair with the lowest first and then lowest second index is merged.
+
+    """
+    d = numpy.array(distance_matrix, dtype=float)
+    n = len(d)
+    if n == 0:
+        raise ValueError("Cannot construct a tree without leaves.")
+    if d.shape != (n, n):
+        raise ValueError("Distance matrix must be square, not {:}".format(
+            d.shape))
+    if names is None:
+        names = [str(i) for i in range(n)]
+    nodes = [Node(name) for name in names]
+    if len(nodes) != n:
+        raise ValueError("Need {:d} names for the leaves, got {:d}".format(
+            n, len(nodes)))
+
+    numpy.fill_diagonal(d, numpy.inf)
+    sizes = numpy.ones(n)
+    heights = numpy.zeros(n)
+    active = numpy.ones(n, dtype=bool)
+    row_argmin = d.argmin(axis=1)
+    row_min = d[numpy.arange(n), row_argmin]
+
+    for _ in range(n - 1):
+        i = int(row_min.argmin())
+        j = int(row_argmin[i])
+        height = d[i, j] / 2
+
+        for k in (i, j):
+            nodes[k].length = max(height - heights[k], 0)
+        nodes[i] = Node.create(descendants=[nodes[i], nodes[j]])
+        heights[i] = height
+
+        if weighted:
+            new = 0.5 * d[i] + 0.5 * d[j]
+        else:
+            new = (sizes[i] * d[i] + sizes[j] * d[j]) / (sizes[i] + sizes[j])
+        sizes[i] += sizes[j]
+        new[i] = numpy.inf
+        new[j] = numpy.inf
+        d[i, :] = new
+        d[:, i] = new
+        d[j, :] = numpy.inf
+        d[:, j] = numpy.inf
+        active[j] = False
+        row_min[j] = numpy.inf
+
+        # Refresh the minimum caches
+        stale = active & ((row_argmin == i) | (row_argmin == j))
+        stale[i] = True
+        for k in numpy.flatnonzero(stale):
+            row_argmin[k] = d[k].argmin()
+            row_min[k] = d[k, row_argmin[k]]
+        closer = active & ~stale & (
+            (new < row_min) | ((new == row_min) & (i < row_argmin)))
+        row_min[closer] = new[closer]
+        row_argmin[closer] = i
+
+    return nodes[int(active.argmax())]
+
+
+def upgma(distance_matrix, names=None):
+    """Cluster based on a distance matrix using UPGMA.
+
+    That is, the Unweighted Pair Group Method with Arithmetic Mean algorithm:
+    The distance between two clusters is the average distance between their
+    members, so a merged cluster's distances are averaged weighted by the
+    sizes of its two parts.
+
+    If node names are given (not None), they must be a sequence of the same
+    length as the size of the square distance_matrix; otherwise, the leaves
+    are named by their row numbers. The matrix passed in is not modified.
+
+    Branch lengths are half the merge distances, so the tree is ultrametric.
+
+    >>> import numpy
+    >>> upgma(numpy.array([[0, 2, 6], [2, 0, 6], [6, 6, 0]]), "abc").newick
+    '((a:1.0,b:1.0):2.0,c:3.0)'
+
+    """
+    return _agglomerate(distance_matrix, names, weighted=False)
+
+
+def wpgma(distance_matrix, names=None):
+    """Cluster based on a distance matrix using WPGMA.
+
+    Like `upgma`, but the distances of a merged cluster are the plain average
+    of the distances of its two parts, irrespective of their sizes.
+
+    """
+    return _agglomerate(distance_matrix, names, weighted=True)
+
+
+def neighbor_joining(distance_matrix, names=None):
+    """Construct a tree from a distance matrix by neighbour joining.
+
+    Neighbour joining gives an unrooted tree; the returned tree is rooted
+    between the last two clusters, with the remaining distance split evenly.
+    Negative branch lengths are set to 0.
+
+    Like `_agglomerate`, this copies the matrix once and updates it in place,
+    masking joined rows, and it keeps the row sums up to date instead of
+    recomputing them. Every join still has to scan the Q matrix of all
+    active pairs, so neighbour joining takes O(n³) time, but only O(n²)
+    memory, allocated before the first join.
+
+    >>> import numpy
+    >>> d = numpy.array([[0, 5, 9, 9, 8], [5, 0, 10, 10, 9], [9, 10, 0, 8, 7],
+    ...                  [9, 10, 8, 0, 3], [8, 9, 7, 3, 0]])
+    >>> neighbor_joining(d, "abcde").newick
+    '((((a:2.0,b:3.0):3.0,c:4.0):2.0,d:2.0):0.5,e:0.5)'
+
+    """
+    d = numpy.array(distance_matrix, dtype=float)
+    n = len(d)
+    if n == 0:
+        raise ValueError("Cannot construct a tree without leaves.")
+    if names is None:
+        names = [str(i) for i in range(n)]
+    nodes = [Node(name) for name in names]
+    active = numpy.ones(n, dtype=bool)
+    r = d.sum(axis=1)
+    q = numpy.empty_like(d)
+
+    for m in range(n, 2, -1):
+        # Masked rows have distances 0 and row sum -∞, so their Q is +∞.
+        if m == 3:
+            # With three clusters left, all pairs have the same Q, up to
+            # the rounding errors of the updated row sums: Join the first.
+            i, j = numpy.flatnonzero(active)[:2]
+        else:
+            numpy.multiply(d, m - 2, out=q)
+            q -= r[:, None]
+            q -= r[None, :]
+            numpy.fill_diagonal(q, numpy.inf)
+            i, j = numpy.unravel_index(q.argmin(), q.shape)
+
+        length_i = 0.5 * d[i, j] + (r[i] - r[j]) / (2 * (m - 2))
+        length_j = d[i, j] - length_i
+        nodes[i].length = max(length_i, 0)
+        nodes[j].length = max(length_j, 0)
+        nodes[i] = Node.create(descendants=[nodes[i], nodes[j]])
+
+        new = 0.5 * (d[i] + d[j] - d[i, j])
+        active[j] = False
+        new[~active] = 0
+        new[i] = 0
+        r += new - d[i] - d[j]
+        r[i] = new.sum()
+        r[j] = -numpy.inf
+        d[i, :] = new
+        d[:, i] = new
+        d[j, :] = 0
+        d[:, j] = 0
+
+    remaining = numpy.flatnonzero(active)
+    if len(remaining) == 1:
+        return nodes[remaining[0]]
+    i, j = remaining
+    nodes[i].length = nodes[j].length = max(d[i, j] / 2, 0)
+    return Node.create(descendants=[nodes[i], nodes[j]])
+
+
+class SubtreeIndex:
+    """Induced subtrees of a tree, for many sets of leaves.
+
+    Preprocessing the tree takes O(n log n): Its nodes are numbered in
+    preorder, and a sparse table over the Euler tour answers lowest common
+    ancestor queries in O(1). The subtree induced by k leaves consists of
+    the leaves and the lowest common ancestors of neighbours in preorder,
+    so its shape is found in O(k log k), independent of the size of the
+    tree. Shapes are memoized by leaf set, because many cognate classes
+    share the same set of lects.
+
+    """
+    def __init__(self, tree):
+        self.nodes = []
+        parent, depth, height = [], [], []
+        stack = [(tree, -1)]
+        while stack:
+            node, up = stack.pop()
+            self.nodes.append(node)
+            parent.append(up)
+            depth.append(depth[up] + 1 if up >= 0 else 0)
+            height.append((height[up] if up >= 0 else 0) + node.length)
+            i = len(self.nodes) - 1
+            stack.extend((d, i) for d in reversed(node.descendants))
+        n = len(self.nodes)
+        self.parent = parent
+        self.height = height
+        self.leaves = {node.name: i for i, node in enumerate(self.nodes)
+                       if node.is_leaf}
+
+        # Every node is followed in preorder by its descendants, so it is an
+        # ancestor of the nodes up to its last descendant.
+        self.last = list(range(n))
+        for i in range(n - 1, 0, -1):
+            self.last[parent[i]] = max(self.last[parent[i]], self.last[i])
+
+        # The Euler tour lists each node before, between and after its
+        # descendants.
+        tour, self.first = [], [0] * n
+        for i in range(n):
+            if i:
+                # Climb back up from the previous node to the parent of i.
+                j = tour[-1]
+                while j != parent[i]:
+                    j = parent[j]
+                    tour.append(j)
+            self.first[i] = len(tour)
+            tour.append(i)
+        while tour[-1] != 0:
+            tour.append(parent[tour[-1]])
+        depth = numpy.array(depth)
+        self.sparse = [numpy.array(tour)]
+        width = 1
+        while 2 * width <= len(tour):
+            previous = self.sparse[-1]
+            left, right = previous[:-width], previous[width:]
+            self.sparse.append(
+                numpy.where(depth[left] <= depth[right], left, right))
+            width *= 2
+        self.depth = depth
+        self._shapes = {}
+
+    def lca(self, i, j):
+        """The lowest common ancestor of the nodes with preorder numbers i, j."""
+        left, right = sorted((self.first[i], self.first[j]))
+        level = (right - left + 1).bit_length() - 1
+        a = self.sparse[level][left]
+        b = self.sparse[level][right - (1 << level) + 1]
+        return int(a if self.depth[a] <= self.depth[b] else b)
+
+    def shape(self, names):
+        """The nodes of the induced subtree and their parents within it.
+
+        Returns
+        -------
+        tuple of (int, int)
+            (preorder number, position of the parent in this tuple or -1),
+            in preorder
+        """
+        key = frozenset(names)
+        try:
+            return self._shapes[key]
+        except KeyError:
+            pass
+        leaves = sorted(self.leaves[name] for name in key
+                        if name in self.leaves)
+        nodes = sorted(set(leaves) | {
+            self.lca(a, b) for a, b in zip(leaves[:-1], leaves[1:])})
+        shape = []
+        stack = []
+        for i in nodes:
+            while stack and self.last[nodes[stack[-1]]] < i:
+                stack.pop()
+            shape.append((i, stack[-1] if stack else -1))
+            stack.append(len(shape) - 1)
+        shape = tuple(shape)
+        self._shapes[key] = shape
+        return shape
+
+    def subtree(self, names):
+        """Build the subtree that connects the leaves with the given names.
+
+        See `induced_subtree`. Every call returns new nodes, which the caller
+        may modify.
+
+        """
+        shape = self.shape(names)
+        if not shape:
+            return None
+        descendants = [[] for _ in shape]
+        copies = [None] * len(shape)
+        for k in range(len(shape) - 1, -1, -1):
+            i, up = shape[k]
+            original = self.nodes[i]
+            if up < 0:
+                collapsed = i != 0
+                length = self.height[i]
+            else:
+                collapsed = self.parent[i] != shape[up][0]
+                length = self.height[i] - self.height[shape[up][0]]
+            if not collapsed:
+                length = original._length
+            if original.is_leaf:
+                copies[k] = Node(original.name, length=length)
+            else:
+                copies[k] = Node.create(
+                    name=original.name, length=length,
+                    descendants=descendants[k][::-1])
+            if up >= 0:
+                descendants[up].append(copies[k])
+        return copies[0]
+
+
+def induced_subtree(tree, names):
+    """Copy the part of a tree that connects the leaves with the given names.
+
+    Leaves not in `names` are dropped, and so are internal nodes left with
+    fewer than two descendants; the branch length of a dropped node is added
+    to that of its remaining descendant. The order of descendants is kept.
+    The tree passed in is not modified.
+
+    Returns None if no leaf of the tree is named in `names`. To take many
+    subtrees of the same tree, use a `SubtreeIndex`.
+
+    >>> from newick import loads
+    >>> tree = loads("(((a:1,b:1):1,c:2):1,d:3)")[0]
+    >>> induced_subtree(tree, {"a", "c", "d"}).newick
+    '((a:2.0,c:2):1,d:3)'
+
+    """
+    return SubtreeIndex(tree).subtree(names)
@@ -1,3 +1,4 @@
+import io
 import re
 import math
 import collections
@@ -12,6 +13,7 @@ from clldutils.path import Path
 from pycldf.sources import Source
 from pycldf.dataset import Wordlist, Dataset
 from csvw.metadata import Column
+from csvw.dsv import UnicodeReader, Dialect
 
 from urllib.error import HTTPError
 from urllib.request import urlopen
@@ -24,7 +26,8 @@ try:
 except (ValueError, ImportError):
     local_glottolog = None
 
-from . import get_dataset, repository
+from . import get_dataset, repository, cache_directory
+from .cache import cache_file, load_cache, save_cache, AppendOnlyFile
 
 REPLACE = {
     " ": "_",
@@ -234,7 +237,118 @@ def all_lects(dataset=None):
                 "cldf" / "Wordlist-metadata.json")
 
 
-def cognate_sets(dataset, code_column=None, partial_cognates="exact"):
+COGNATESET_CACHE_VERSION = 2
+
+
+def _partial_keys(cognateset, partial_cognates):
+    """The keys under which a form with this cognate code is listed."""
+    if partial_cognates == "exact":
+        if isinstance(cognateset, list):
+            return [tuple(cognateset)]
+        return [cognateset]
+    if isinstance(cognateset, list):
+        return cognateset
+    return [cognateset]
+
+
+class CognatesetAssignments(AppendOnlyFile):
+    """The latest cognate code of each form, read incrementally.
+
+    The CognateTable is append-only: New codings are appended, and the last
+    row for a form is the one that counts (as in
+    clld_sqlite.import_cognatesets). As an `AppendOnlyFile`, this object
+    remembers how much of the table file it has processed, and on `update`
+    only parses the rows appended since. If the processed prefix of the
+    file changed, everything is read again.
+
+    Both the form → cognate code mapping and the cognate set → forms
+    mappings for the two partial cognate modes are kept up to date.
+
+    """
+    def __init__(self):
+        super().__init__()
+        self.header = None
+        self.rows = 0
+        self.by_form = {}
+        self.members = {"exact": collections.defaultdict(set),
+                        "intersection": collections.defaultdict(set)}
+
+    def assign(self, form, cognateset):
+        """Set the cognate code of a form, replacing its previous one."""
+        try:
+            old = self.by_form[form]
+        except KeyError:
+            pass
+        else:
+            for mode, members in self.members.items():
+                for key in _partial_keys(old, mode):
+                    members[key].discard(form)
+                    if not members[key]:
+                        del members[key]
+        self.by_form[form] = cognateset
+        for mode, members in self.members.items():
+            for key in _partial_keys(cognateset, mode):
+                members[key].add(form)
+
+    def update(self, table, form_reference, code_column, dialect=None):
+        """Process the rows appended to the table file since the last update.
+
+        `dialect` is the table group's dialect, for a table without a dialect
+        of its own (cf. `pylexirumah.query.iter_rows`).
+
+        Returns
+        -------
+        bool
+            Whether the file changed
+        """
+        appended = self.appended(table.url.resolve(table.base),
+                                 key=(form_reference, code_column))
+        if appended is None:
+            return False
+        start, content = appended
+
+        dialect = table.dialect or dialect or Dialect()
+        tail = content[start:].decode(dialect.encoding)
+        with UnicodeReader(io.StringIO(tail), dialect=dialect) as reader:
+            reader = iter(reader)
+            if self.header is None:
+                try:
+                    self.header = next(reader)
+                except StopIteration:
+                    return True
+            j_form = self.header.index(form_reference)
+            j_code = self.header.index(code_column)
+            read_code = table.tableSchema.get_column(code_column)
+            for row in reader:
+                if not row:
+                    continue
+                self.assign(row[j_form], read_code.read(row[j_code]))
+                self.rows += 1
+        return True
+
+
+def cached_cognateset_assignments(dataset, form_reference, code_column,
+                                  cache_directory=cache_directory):
+    """Load the cognate codes of the CognateTable, updating a cached state.
+
+    The state (see `CognatesetAssignments`) is pickled in the cache
+    directory, and only rows appended to the table since it was saved are
+    parsed.
+
+    """
+    table = dataset["CognateTable"]
+    file = cache_file(
+        "cognatesets", table.url.resolve(table.base), cache_directory)
+    entry = load_cache(file, COGNATESET_CACHE_VERSION)
+    assignments = entry["assignments"] if entry else CognatesetAssignments()
+    if assignments.update(table, form_reference, code_column,
+                          dialect=dataset.tablegroup.dialect):
+        save_cache(file, COGNATESET_CACHE_VERSION, {"assignments": assignments})
+    return assignments
+
+
+def cognate_sets(dataset, code_column=None, partial_cognates="exact",
+                 cache_directory=cache_directory):
     """Load cognate codes from a CLDF.
 
     The distinction is made depending on the file extension: `.json` files are
@@ -247,6 +361,10 @@ def cognate_sets(dataset, code_column=None, partial_cognates="exact"):
     partial cognate classes '1 2' will be listed under class (1, 2) in "exact"
     mode and under both classes 1 and 2 in "intersection" mode.
 
+    Codes from a separate CognateTable are read incrementally through a
+    cache in `cache_directory` (see `cached_cognateset_assignments`); if a
+    form is coded several times, the last coding counts.
+
     Parameters
     ----------
     dataset : pycldf.Wordlist
@@ -264,15 +382,11 @@ def cognate_sets(dataset, code_column=None, partial_cognates="exact"):
 
     """
     data = collections.defaultdict(lambda: set())
-    if code_column:
-        cognate_column_in_form_table = True
-    else:
+    if not code_column:
         try:
             code_column = dataset["FormTable", "cognatesetReference"].name
-            cognate_column_in_form_table = True
             # The form table contains cognate sets!
         except KeyError:
-            cognatesets = collections.defaultdict(lambda: "?")
             try:
                 form_reference = dataset["CognateTable", "formReference"].name
                 code_column = dataset["CognateTable", "cognatesetReference"].name
@@ -281,32 +395,16 @@ def cognate_sets(dataset, code_column=None, partial_cognates="exact"):
                     "Dataset {:} has no cognatesetReference column in its "
                     "primary table or in a separate cognate table. "
                     "Is this a metadata-free wordlist and you forgot to "
-                    "specify code_column explicitly?".format(filename))
-            for row in dataset["CognateTable"].iterdicts():
-                cognatesets[row[form_reference]] = row[code_column]
-            cognate_column_in_form_table = False
+                    "specify code_column explicitly?".format(dataset))
+            assignments = cached_cognateset_assignments(
+                dataset, form_reference, code_column, cache_directory)
+            for cognateset, forms in assignments.members[partial_cognates].items():
+                data[cognateset] = set(forms)
+            return data
 
     form_column = dataset["FormTable", "id"].name
 
-    if cognate_column_in_form_table:
-        for row in dataset["FormTable"].iterdicts():
-            if partial_cognates == "exact":
-                try:
-                    data[tuple(row[code_column])].add(row[form_column])
-                except TypeError:
-                    data[row[code_column]].add(row[form_column])
-            else:
-                for pcognateset in row[code_column]:
-                    data[pcognateset].add(row[form_column])
-    else:
-        for form, cognateset in cognatesets.items():
-            if partial_cognates == "exact":
-                try:
-                    data[tuple(cognateset)].add(form)
-                except TypeError:
-                    data[cognateset].add(form)
-            else:
-                for pcognateset in cognateset:
-                    data[pcognateset].add(form)
+    for row in dataset["FormTable"].iterdicts():
+        for key in _partial_keys(row[code_column], partial_cognates):
+            data[key].add(row[form_column])
     return data
-
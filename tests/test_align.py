@@ -0,0 +1,175 @@
+import sys
+import copy
+import types
+import random
+import itertools
+import multiprocessing
+from unittest import TestCase, mock
+
+import numpy
+import pandas
+import newick
+
+from pylexirumah.align import (
+    pairwise_distance_matrix, lect_distance_matrix, alignment_tasks,
+    align_class, align_cognate_classes, update_alignments)
+from pylexirumah.pairwise import random_pairs
+
+
+def fake_dataio(calls):
+    """A stand-in for infomapcog.dataio that pads the forms with gaps."""
+    def multi_align(as_dict, tree, lodict, gop, gep):
+        forms = sorted(as_dict[0])
+        calls.append((tree.newick, lodict))
+        length = max(len(tokens) for _, _, tokens in forms)
+        columns = [tuple(tokens[i] if i < len(tokens) else ""
+                         for _, _, tokens in forms)
+                   for i in range(length)]
+        return {0: ([l for l, _, _ in forms], [c for _, c, _ in forms],
+                    columns)}
+    dataio = types.ModuleType("infomapcog.dataio")
+    dataio.MaxPairDict = dict
+    dataio.multi_align = multi_align
+    infomapcog = types.ModuleType("infomapcog")
+    infomapcog.dataio = dataio
+    return {"infomapcog": infomapcog, "infomapcog.dataio": dataio}
+
+
+def deep_copy_alignments(data, cognate_col, tree, lodict):
+    """Align like align.py did before the pool: one tree copy per class."""
+    import infomapcog.dataio as dataio
+    for i, cognateclass in data.groupby(cognate_col):
+        as_dict = [
+            {(l, c, tuple(t.split()))
+                for (c, l, t), row in cognateclass.iterrows()}]
+        if len(cognateclass) == 1:
+            language, concept, alg = as_dict[0].pop()
+            data.loc[(concept, language, ' '.join([a for a in alg if a])),
+                     "Alignment"] = " ".join([a for a in alg if a])
+            continue
+        for group, (languages, concepts, algs) in dataio.multi_align(
+                as_dict, copy.deepcopy(tree),
+                lodict=dataio.MaxPairDict(lodict),
+                gop=-2.5, gep=-1.75).items():
+            for language, concept, alg in zip(
+                    languages, concepts, zip(*algs)):
+                data.loc[(concept, language, ' '.join([a for a in alg if a])),
+                         "Alignment"] = " ".join([a or '-' for a in alg])
+
+
+class Tests(TestCase):
+    def test_pairwise_distance_matrix(self):
+        distances = pairwise_distance_matrix(
+            [["b", "a", "b", "a"], ["b", "a", "b", "a"], ["b", "a", "p", "a"]],
+            processes=1)
+        self.assertEqual(list(distances), [0.0, 0.5, 0.5])
+
+    def test_pairwise_distance_matrix_empty(self):
+        self.assertEqual(len(pairwise_distance_matrix([], processes=1)), 0)
+        self.assertEqual(list(pairwise_distance_matrix(["", ""], processes=1)), [0.0])
+
+    def test_pairwise_distance_matrix_pool(self):
+        forms = [f for pair in random_pairs(40, seed=4) for f in pair]
+        numpy.testing.assert_array_equal(
+            pairwise_distance_matrix(forms, processes=1),
+            pairwise_distance_matrix(forms, processes=2, chunksize=100))
+
+    def test_pairwise_distance_matrix_default_chunks(self):
+        # Some 7000 pairs, as for a concept with 120 forms, use the pool.
+        forms = [f for pair in random_pairs(60, seed=5) for f in pair]
+        with mock.patch("multiprocessing.Pool", wraps=multiprocessing.Pool) as pool:
+            distances = pairwise_distance_matrix(forms, processes=2)
+        self.assertTrue(pool.called)
+        numpy.testing.assert_array_equal(
+            distances, pairwise_distance_matrix(forms, processes=1))
+
+    def test_lect_distance_matrix(self):
+        rng = random.Random(0)
+        forms = [(rng.choice("abcde"), rng.randrange(8), rng.choice([1, 2, 3, None]))
+                 for _ in range(80)]
+        lects, distances = lect_distance_matrix(*zip(*forms))
+        self.assertEqual(lects, list("abcde"))
+        for (i1, l1), (i2, l2) in itertools.combinations(enumerate(lects), 2):
+            shared, c = 0, 0
+            for concept in {f[1] for f in forms if f[0] in (l1, l2)}:
+                c1 = {(f[2], k if f[2] is None else 0)
+                      for k, f in enumerate(forms) if f[:2] == (l1, concept)}
+                c2 = {(f[2], k if f[2] is None else 0)
+                      for k, f in enumerate(forms) if f[:2] == (l2, concept)}
+                shared += len(c1 & c2) / len(c1 | c2)
+                c += 1
+            self.assertAlmostEqual(distances[i1, i2], 1 - shared / c)
+            self.assertAlmostEqual(distances[i2, i1], 1 - shared / c)
+
+    def test_alignment_tasks(self):
+        data = pandas.DataFrame({
+            "English": ["one", "one", "one", "two"],
+            "Language_ID": ["l1", "l2", "l3", "l1"],
+            "Tokens": ["a p a", "a b a", "a p", "t u"],
+            "Group": [1, 1, 1, 2],
+            "Alignment": ["a p a", "a b a", "a p -", "t u"]}).set_index(
+                ["English", "Language_ID", "Tokens"])
+        tasks = alignment_tasks(data, "Group")
+        self.assertEqual([i for i, forms in tasks], [1, 2])
+        self.assertEqual(tasks[0][1][2], ("l3", "one", ("a", "p")))
+        self.assertEqual(alignment_tasks(data, "Group", only_necessary=True), [])
+
+    def test_align_single_form(self):
+        self.assertEqual(
+            align_class([("l1", "two", ("t", "u"))], None, {}),
+            [(("two", "l1", "t u"), "t u")])
+
+    def test_align_cognate_classes(self):
+        data = pandas.DataFrame({
+            "English": ["one", "one", "one", "two", "three", "three"],
+            "Language_ID": ["l1", "l2", "l3", "l1", "l8", "l9"],
+            "Tokens": ["a p a", "a b a", "a p", "t u", "i", "i n"],
+            "Group": [1, 1, 1, 2, 3, 3],
+            "Alignment": ["", "", "", "", "x", "y"]}).set_index(
+                ["English", "Language_ID", "Tokens"])
+        tree = newick.loads("((l1:1,l2:1):1,(l3:1,l4:1):1);")[0]
+        calls = []
+        with mock.patch.dict(sys.modules, fake_dataio(calls)):
+            alignments, skipped = align_cognate_classes(
+                alignment_tasks(data, "Group"), tree, processes=1)
+        # Only the class with lects in the tree went to multi_align, with
+        # the tree restricted to its lects.
+        self.assertEqual(calls, [("((l1:1,l2:1):1,l3:2.0)", {})])
+        self.assertEqual(skipped, [3])
+        update_alignments(data, alignments)
+        self.assertEqual(list(data["Alignment"]),
+                         ["a p a", "a b a", "a p -", "t u", "x", "y"])
+
+    def test_same_as_deep_copy(self):
+        rng = random.Random(1)
+        rows = []
+        for k in range(60):
+            lect = "l{:d}".format(rng.randrange(1, 7))
+            rows.append({
+                "English": "c{:d}".format(k % 9), "Language_ID": lect,
+                "Tokens": " ".join(rng.choice("aptku")
+                                   for _ in range(rng.randrange(1, 5))),
+                "Group": rng.randrange(12), "Alignment": ""})
+        data = pandas.DataFrame(rows).drop_duplicates(
+            ["English", "Language_ID", "Tokens"]).set_index(
+                ["English", "Language_ID", "Tokens"])
+        tree = newick.loads(
+            "(((l1:1,l2:1):1,(l3:1,l4:1):1):1,(l5:1,l6:1,l7:1):2);")[0]
+        old = data.sort_index()
+        with mock.patch.dict(sys.modules, fake_dataio([])):
+            deep_copy_alignments(old, "Group", tree, {})
+            alignments, skipped = align_cognate_classes(
+                alignment_tasks(data, "Group"), tree, processes=1)
+        self.assertEqual(skipped, [])
+        update_alignments(data, alignments)
+        self.assertTrue(data["Alignment"].str.contains("-").any())
+        pandas.testing.assert_frame_equal(data.sort_index(), old)
+
+    def test_update_alignments(self):
+        data = pandas.DataFrame({
+            "English": ["one", "one"], "Language_ID": ["l1", "l2"],
+            "Tokens": ["a", "b"]}).set_index(
+                ["English", "Language_ID", "Tokens"])
+        update_alignments(data, {("one", "l2", "b"): "b -"})
+        self.assertTrue(pandas.isna(data["Alignment"].iloc[0]))
+        self.assertEqual(data["Alignment"].iloc[1], "b -")
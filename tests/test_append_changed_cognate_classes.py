@@ -0,0 +1,70 @@
+import io
+import json
+import random
+import argparse
+import tempfile
+import itertools
+from unittest import TestCase
+
+from clldutils.path import Path
+
+from pylexirumah import get_dataset
+from pylexirumah.append_changed_cognate_classes import (
+    main, max_weight_matching)
+
+from tests.test_snapshot import write_wordlist
+
+
+def brute_force_matching_weight(weights):
+    lefts = sorted({l for l, r in weights})
+    rights = sorted({r for l, r in weights})
+    best = 0
+    rights = rights + [None] * len(lefts)
+    for permutation in itertools.permutations(rights, len(lefts)):
+        best = max(best, sum(weights.get((l, r), 0)
+                             for l, r in zip(lefts, permutation)))
+    return best
+
+
+class TestMatching(TestCase):
+    def test_optimal(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            weights = {(rng.randrange(5), rng.randrange(4)): rng.randrange(1, 9)
+                       for _ in range(rng.randrange(1, 10))}
+            matching = max_weight_matching(weights)
+            self.assertEqual(len(set(matching.values())), len(matching))
+            self.assertEqual(
+                sum(weights[pair] for pair in matching.items()),
+                brute_force_matching_weight(weights))
+
+
+def integer_cognate_ids(metadata):
+    """Make the CognateTable IDs integers, as in LexiRumah."""
+    with metadata.open(encoding="utf-8") as f:
+        description = json.load(f)
+    for table in description["tables"]:
+        if table["url"] == "cognates.csv":
+            table["tableSchema"]["columns"][0]["datatype"] = "integer"
+    with metadata.open("w", encoding="utf-8") as f:
+        json.dump(description, f)
+
+
+class TestMain(TestCase):
+    def test_minimal_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            metadata = write_wordlist(directory)
+            integer_cognate_ids(metadata)
+            edictor = io.StringIO(
+                "ID\tREFERENCE\tCOGID\tALIGNMENT\n"
+                "1\tf1\t7\ta p a\n"
+                "2\tf2\t8\t- t a\n"
+                "3\tf3\t7\tu\n")
+            main(argparse.Namespace(
+                edictor=edictor, cldf=metadata, source_id="edictor",
+                cogid="COGID"))
+            rows = list(get_dataset(metadata)["CognateTable"].iterdicts())
+        # f1 keeps s1, f3 joins it, f2 gets a new cognate set.
+        self.assertEqual(
+            [(row["Form_ID"], row["Cognateset_ID"]) for row in rows[2:]],
+            [("f2", "8"), ("f3", "s1")])
@@ -0,0 +1,278 @@
+import json
+import random
+import collections
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+import lingpy
+from clldutils.path import Path
+from pycldf import Wordlist
+
+from pylexirumah import autocode
+from pylexirumah.autocode import (
+    scorer_key, load_wordlist, parallel_get_scorer, balanced_shards,
+    anchor_concepts, sharded_cluster, concept_fingerprints, save_state,
+    load_state, STATE_VERSION, _integers, previous_results, changed_concepts,
+    incremental_cluster)
+
+# LingPy's from_cldf passes the FormTable columns in lower case
+RENAME_COLUMNS = {
+    "parameter_id": "concept",
+    "language_id": "doculect",
+    "segments": "tokens",
+    "form": "ipa",
+    "id": "reference",
+}
+
+PROTO_FORMS = ["pata", "kuri", "mana", "tolu", "lima", "wai", "api", "batu",
+               "nusa", "rumah", "ikan", "kutu"]
+
+SOUND_CHANGES = [{}, {"p": "f"}, {"k": "h", "u": "o"}, {"t": "s"},
+                 {"a": "e", "r": "l"}]
+
+
+def write_wordlist(directory, changes=SOUND_CHANGES, concepts=PROTO_FORMS):
+    """Write a word list of regular reflexes of the proto-forms.
+
+    Every lect has one reflex per concept, except that the last lect lacks
+    the first concept, and some reflexes are replaced by random words.
+
+    """
+    rng = random.Random(1)
+    forms = []
+    for l, change in enumerate(changes):
+        for c, proto in enumerate(concepts):
+            if l == len(changes) - 1 and c == 0:
+                continue
+            segments = [change.get(s, s) for s in proto]
+            if rng.random() < 0.2:
+                segments = rng.sample("ptkmnslraiu", len(segments))
+            forms.append({
+                "ID": "l{:d}-c{:d}".format(l, c), "Language_ID": "l{:d}".format(l),
+                "Parameter_ID": "c{:d}".format(c), "Form": "".join(segments),
+                "Segments": segments})
+    dataset = Wordlist.in_dir(str(directory))
+    dataset.write(FormTable=forms)
+    return Path(directory) / "Wordlist-metadata.json"
+
+
+class TestScorer(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.metadata = write_wordlist(Path(self.tmp.name) / "a")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def key(self, metadata, **parameters):
+        lex = load_wordlist(metadata, "sca", RENAME_COLUMNS)
+        arguments = dict(soundclass="sca", ratio=(3, 2), threshold=0.7,
+                         runs=1000, seed=0)
+        arguments.update(parameters)
+        return scorer_key(lex, **arguments)
+
+    def test_scorer_key(self):
+        key = self.key(self.metadata)
+        # The same data elsewhere has the same scorer
+        copy = Path(self.tmp.name) / "b"
+        shutil.copytree(str(self.metadata.parent), str(copy))
+        self.assertEqual(self.key(copy / "Wordlist-metadata.json"), key)
+        # Any parameter of the permutation test invalidates it
+        self.assertNotEqual(self.key(self.metadata, runs=2000), key)
+        self.assertNotEqual(self.key(self.metadata, seed=1), key)
+        self.assertNotEqual(self.key(self.metadata, ratio=(1, 0)), key)
+        self.assertNotEqual(self.key(self.metadata, soundclass="dolgo"), key)
+        # So does a changed form
+        changed = write_wordlist(
+            Path(self.tmp.name) / "c",
+            concepts=PROTO_FORMS[:-1] + ["kutuk"])
+        self.assertNotEqual(self.key(changed), key)
+
+    def scorer(self, processes, seed):
+        lex = load_wordlist(self.metadata, "sca", RENAME_COLUMNS)
+        parallel_get_scorer(lex, self.metadata, "sca", RENAME_COLUMNS,
+                            runs=100, processes=processes, seed=seed,
+                            ratio=(3, 2), threshold=0.7)
+        return lex.cscorer
+
+    def test_parallel_scorer(self):
+        # Fewer runs than form pairs per lect pair, so that the runs are a
+        # random sample, in several chunks.
+        with mock.patch.object(autocode, "RUNS_PER_CHUNK", 40):
+            serial = self.scorer(1, 3)
+            parallel = self.scorer(2, 3)
+            other_seed = self.scorer(1, 4)
+        self.assertEqual(serial.chars2int, parallel.chars2int)
+        self.assertEqual(serial.matrix, parallel.matrix)
+        self.assertNotEqual(serial.matrix, other_seed.matrix)
+
+
+def partition(lex, ref):
+    """The classes of forms, or of morphemes, with the same cognate ID."""
+    classes = collections.defaultdict(set)
+    for idx in lex:
+        ids = lex[idx, ref]
+        for m, id in enumerate(ids if isinstance(ids, list) else [ids]):
+            classes[id].add((lex[idx, "reference"], m))
+    return sorted(sorted(c) for c in classes.values())
+
+
+class TestShards(TestCase):
+    def test_sharded_cluster(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            metadata = write_wordlist(tmp)
+            lex = load_wordlist(metadata, "sca", RENAME_COLUMNS)
+            parallel_get_scorer(lex, metadata, "sca", RENAME_COLUMNS,
+                                runs=100, processes=1)
+            scorer_file = str(Path(tmp) / "scorer")
+            lex.output('tsv', filename=scorer_file, ignore=[])
+            keywords = dict(threshold=0.55, cluster_method="upgma",
+                            verbose=False, gop=-2, mode="overlap")
+            lex.cluster(method='lexstat', ref='cogid', override=True,
+                        **keywords)
+            lex.partial_cluster(method='lexstat', ref='partialcognateids',
+                                override=True, **keywords)
+
+            sharded = load_wordlist(metadata, "sca", RENAME_COLUMNS)
+            sharded_cluster(sharded, metadata, "sca", RENAME_COLUMNS,
+                            scorer_file + ".tsv", 3, processes=2, **keywords)
+        for ref in ["cogid", "partialcognateids"]:
+            self.assertEqual(partition(sharded, ref), partition(lex, ref))
+        cogids = [sharded[idx, "cogid"] for idx in sharded]
+        self.assertGreater(len(set(cogids)), 12)
+
+    def test_balanced_shards(self):
+        self.assertEqual(balanced_shards({}, 3), [])
+        self.assertEqual(balanced_shards({"a": 1, "b": 2}, 5),
+                         [["b"], ["a"]])
+        self.assertEqual(balanced_shards({"a": 1, "b": 2, "c": 2}, 1),
+                         [["b", "c", "a"]])
+        shards = balanced_shards({c: 3 for c in "abcdef"}, 3)
+        self.assertEqual(sorted(c for shard in shards for c in shard),
+                         list("abcdef"))
+        self.assertEqual([len(shard) for shard in shards], [2, 2, 2])
+
+    def test_anchor_concepts(self):
+        lects_by_concept = {"a": {"l1", "l2"}, "b": {"l2", "l3"},
+                            "c": {"l3"}, "d": {"l1"}}
+        all_lects = {"l1", "l2", "l3"}
+        self.assertEqual(anchor_concepts(["a", "b"], lects_by_concept,
+                                         all_lects), [])
+        self.assertEqual(anchor_concepts(["a"], lects_by_concept, all_lects),
+                         ["c"])
+        self.assertEqual(anchor_concepts(["d"], lects_by_concept, all_lects),
+                         ["b"])
+        self.assertEqual(anchor_concepts([], lects_by_concept, all_lects),
+                         ["b", "d"])
+
+
+class TestIncremental(TestCase):
+    keywords = dict(threshold=0.55, cluster_method="upgma", verbose=False,
+                    gop=-2, mode="overlap")
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.metadata = write_wordlist(self.dir / "data")
+        lex = load_wordlist(self.metadata, "sca", RENAME_COLUMNS)
+        parallel_get_scorer(lex, self.metadata, "sca", RENAME_COLUMNS,
+                            runs=100, processes=1)
+        self.scorer_file = str(self.dir / "scorer")
+        lex.output('tsv', filename=self.scorer_file, ignore=[])
+        lex.cluster(method='lexstat', ref='cogid', override=True,
+                    **self.keywords)
+        lex.partial_cluster(method='lexstat', ref='partialcognateids',
+                            override=True, **self.keywords)
+        lex.output("tsv", filename=str(self.dir / "auto-clusters"))
+        alm = lingpy.Alignments(lex, ref="partialcognateids", fuzzy=True)
+        alm.align(method='progressive')
+        alm.output('tsv', filename=str(self.dir / "aligned"), ignore='all',
+                   prettify=False)
+        self.fingerprints = concept_fingerprints(lex)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def previous(self):
+        return previous_results(self.dir / "auto-clusters.tsv",
+                                self.dir / "aligned.tsv")
+
+    def test_integers(self):
+        self.assertEqual(_integers("1 2"), [1, 2])
+        self.assertEqual(_integers(3), [3])
+        self.assertEqual(_integers([1, "2"]), [1, 2])
+
+    def test_state(self):
+        state_file = self.dir / "aligned.state.json"
+        parameters = {"runs": 100, "ratio": [3, 2]}
+        lects = ["l0", "l1"]
+        self.assertIsNone(load_state(state_file, parameters, lects))
+        save_state(state_file, {
+            "parameters": parameters, "lects": lects,
+            "scorer_file": self.scorer_file, "fingerprints": {}})
+        self.assertEqual(load_state(state_file, parameters, lects)["lects"],
+                         lects)
+        self.assertIsNone(load_state(state_file, {"runs": 200}, lects))
+        self.assertIsNone(load_state(state_file, parameters, ["l0"]))
+        Path(self.scorer_file + ".tsv").unlink()
+        self.assertIsNone(load_state(state_file, parameters, lects))
+        state_file.write_text(json.dumps({"version": STATE_VERSION - 1}))
+        self.assertIsNone(load_state(state_file, parameters, lects))
+
+    def test_previous_results(self):
+        cogids, partial_ids, alignments = self.previous()
+        self.assertEqual(len(cogids), 59)
+        self.assertEqual(set(partial_ids), set(cogids))
+        self.assertEqual(set(alignments), set(cogids))
+        self.assertTrue(all(isinstance(i, int) for i in cogids.values()))
+        self.assertEqual(
+            [len(partial_ids[r]) for r in ["l0-c1", "l3-c9"]], [1, 1])
+
+    def test_incremental_cluster(self):
+        old_cogids, old_partial_ids, old_alignments = previous = self.previous()
+        # Change the forms of one concept
+        write_wordlist(self.dir / "data",
+                       concepts=PROTO_FORMS[:-1] + ["kutuk"])
+        lex = load_wordlist(self.metadata, "sca", RENAME_COLUMNS)
+        scorers = lingpy.compare.lexstat.LexStat(
+            filename=self.scorer_file + ".tsv")
+        lex.scorer = scorers.scorer
+        lex.cscorer = scorers.cscorer
+        lex.bscorer = scorers.bscorer
+        changed = changed_concepts(lex, self.fingerprints, previous)
+        self.assertEqual(changed, {"c11"})
+
+        # A single shard is clustered without a process pool
+        with mock.patch.object(autocode.concurrent.futures,
+                               "ProcessPoolExecutor",
+                               side_effect=AssertionError):
+            alm = incremental_cluster(
+                lex, changed, previous, self.metadata, "sca", RENAME_COLUMNS,
+                self.scorer_file + ".tsv", **self.keywords)
+        lex.output("tsv", filename=str(self.dir / "auto-clusters"))
+        alm.output('tsv', filename=str(self.dir / "aligned"), ignore='all',
+                   prettify=False)
+        cogids, partial_ids, alignments = self.previous()
+        self.assertEqual(set(cogids), set(old_cogids))
+        for idx in lex:
+            reference = lex[idx, "reference"]
+            if lex[idx, "concept"] == "c11":
+                self.assertGreater(cogids[reference], max(old_cogids.values()))
+                self.assertEqual(
+                    [s for s in alignments[reference] if s != "-"],
+                    list(lex[idx, "tokens"]))
+            else:
+                self.assertEqual(cogids[reference], old_cogids[reference])
+                self.assertEqual(partial_ids[reference],
+                                 old_partial_ids[reference])
+                self.assertEqual(alignments[reference],
+                                 old_alignments[reference])
+        # IDs stay unique across concepts
+        concepts = {lex[idx, "reference"]: lex[idx, "concept"] for idx in lex}
+        for ids in [{r: [c] for r, c in cogids.items()}, partial_ids]:
+            concepts_by_id = collections.defaultdict(set)
+            for reference, i in ids.items():
+                for id in i:
+                    concepts_by_id[id].add(concepts[reference])
+            self.assertTrue(all(len(c) == 1 for c in concepts_by_id.values()))
@@ -0,0 +1,58 @@
+import pathlib
+import tempfile
+from unittest import TestCase, mock
+
+from clldutils.path import Path
+
+from pylexirumah.cache import cache_file, load_cache, save_cache, AppendOnlyFile
+
+
+class TestCache(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "file.csv"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_roundtrip(self):
+        file = cache_file("kind", self.path, Path(self.tmp.name) / "cache")
+        self.assertIsNone(load_cache(file, 1))
+        save_cache(file, 1, {"value": [1, 2]})
+        self.assertEqual(load_cache(file, 1), {"value": [1, 2], "version": 1})
+        self.assertIsNone(load_cache(file, 2))
+        file.write_bytes(b"not a pickle")
+        self.assertIsNone(load_cache(file, 1))
+
+    def test_appended(self):
+        reader = AppendOnlyFile()
+        self.path.write_bytes(b"a\nb\n")
+        self.assertEqual(reader.appended(self.path), (0, b"a\nb\n"))
+        self.assertIsNone(reader.appended(self.path))
+        with self.path.open("ab") as file:
+            file.write(b"c\n")
+        self.assertEqual(reader.appended(self.path), (4, b"a\nb\nc\n"))
+        # Another key starts from scratch
+        self.assertEqual(reader.appended(self.path, key="x")[0], 0)
+
+    def test_changed_prefix(self):
+        reader = AppendOnlyFile()
+        self.path.write_bytes(b"a\nb\n")
+        reader.appended(self.path)
+        self.path.write_bytes(b"x\nb\nc\n")
+        self.assertEqual(reader.appended(self.path)[0], 0)
+
+    def test_incomplete_line(self):
+        reader = AppendOnlyFile()
+        self.path.write_bytes(b"a\nb")
+        reader.appended(self.path)
+        with self.path.open("ab") as file:
+            file.write(b"c\n")
+        self.assertEqual(reader.appended(self.path)[0], 0)
+
+    def test_unchanged_file_is_not_read(self):
+        reader = AppendOnlyFile()
+        self.path.write_bytes(b"a\n")
+        reader.appended(self.path)
+        with mock.patch.object(pathlib.Path, "open", side_effect=AssertionError):
+            self.assertIsNone(reader.appended(self.path))
@@ -0,0 +1,76 @@
+import sys
+import subprocess
+from types import SimpleNamespace
+from unittest import TestCase
+
+from pylexirumah.check_transcription_systems import (
+    check_form, check_shards, shard_forms, load_pipeline)
+
+columns = SimpleNamespace(
+    segments="Segments", source="Source", language="Lect_ID",
+    value="Form_according_to_Source", form="Form", id="ID",
+    orth="Local_Orthography")
+
+
+def forms():
+    return [
+        {"ID": "a1", "Lect_ID": "a", "Source": ["s1"],
+         "Form_according_to_Source": "apa", "Form": "apa",
+         "Segments": ["a", "p", "a"], "Local_Orthography": "apa"},
+        {"ID": "a2", "Lect_ID": "a", "Source": ["s1"],
+         "Form_according_to_Source": "ana", "Form": None,
+         "Segments": [], "Local_Orthography": None},
+        {"ID": "b1", "Lect_ID": "b", "Source": ["s2"],
+         "Form_according_to_Source": "-", "Form": "ta",
+         "Segments": ["t", "a"], "Local_Orthography": "ta"},
+        {"ID": "b2", "Lect_ID": "b", "Source": [],
+         "Form_according_to_Source": "tu", "Form": "tu",
+         "Segments": ["t", "o"], "Local_Orthography": "tu"},
+    ]
+
+
+class TestCheckForms(TestCase):
+    def test_check_form(self):
+        line = forms()[1]
+        messages = check_form(line, load_pipeline([]), None, columns,
+                              step=["fill", "override", "fill"])
+        self.assertEqual(line["Form"], "ana")
+        self.assertEqual(line["Segments"], ["a", "n", "a"])
+        self.assertEqual(line["Local_Orthography"], "ana")
+        self.assertEqual(
+            [(m.form, m.step, m.category) for m in messages],
+            [("a2", "form", "form-missing"),
+             ("a2", "orthography", "orthography-underivable"),
+             ("a2", "orthography", "orthography-missing")])
+        self.assertEqual(messages[0].expected, "ana")
+
+    def test_shard_forms(self):
+        shards = list(shard_forms(forms(), columns, match="t"))
+        self.assertEqual(
+            [(source, [(row["ID"], check) for row, check in rows])
+             for source, rows in shards],
+            [(None, [("a1", False), ("a2", False)]),
+             ("s2", [("b1", True)]),
+             (None, [("b2", True)])])
+
+    def test_parallel_like_serial(self):
+        settings = {"language_orthographies": {"a": None, "b": None},
+                    "columns": columns,
+                    "step": ["fill", "override", "fill"],
+                    "check_stress": False}
+        shards = [([], rows) for _, rows in shard_forms(forms(), columns)]
+        serial = list(check_shards(shards, settings, processes=1))
+        shards = [([], rows) for _, rows in shard_forms(forms(), columns)]
+        parallel = list(check_shards(shards, settings, processes=2))
+        self.assertEqual(serial, parallel)
+        self.assertEqual(len(serial), 3)
+        original, new, messages = serial[2]
+        self.assertEqual(original[0]["Segments"], ["t", "o"])
+        self.assertEqual(new[0]["Segments"], ["t", "u"])
+        self.assertIn("source-missing", [m.category for m in messages])
+        self.assertIn("segments-mismatch", [m.category for m in messages])
+
+    def test_import_does_not_load_pyclts(self):
+        subprocess.check_call([sys.executable, "-c", (
+            "import sys, pylexirumah.check_transcription_systems\n"
+            "assert 'pyclts' not in sys.modules")])
@@ -0,0 +1,125 @@
+import csv
+import json
+import shutil
+import tempfile
+import multiprocessing
+import concurrent.futures
+from unittest import TestCase, skipIf
+
+from clldutils.path import Path
+
+from pylexirumah import get_dataset, repository
+
+try:
+    import sqlalchemy
+    import transaction
+    from clld.db.meta import Base, DBSession
+    from pylexirumah import clld_sqlite
+except ImportError:
+    clld_sqlite = None
+
+SOURCE = "datasets_ABVD"
+
+
+def write_wordlist(directory, n_lects=3, n_concepts=4):
+    """Write a small word list with the metadata of the repository.
+
+    It takes its lects and concepts from the repository, and has forms,
+    cognate judgements (including a re-coded form) and a loan of its own.
+
+    """
+    directory = Path(directory)
+    metadata = directory / repository.name
+    shutil.copy(str(repository), str(metadata))
+    shutil.copy(str(repository.parent / "sources.bib"), str(directory))
+    tables = {table["url"]: [column["name"] for column in
+                             table["tableSchema"]["columns"]]
+              for table in json.loads(metadata.read_text())["tables"]}
+    with (repository.parent / "lects.csv").open(encoding="utf-8") as file:
+        lects = list(csv.DictReader(file))[:n_lects]
+    with (repository.parent / "concepts.csv").open(encoding="utf-8") as file:
+        concepts = list(csv.DictReader(file))[:n_concepts]
+    forms, cognates = [], []
+    for l, lect in enumerate(lects):
+        for c, concept in enumerate(concepts):
+            id = "{:}-{:}".format(lect["ID"], concept["ID"])
+            segments = ["t", "a", "p"[:l], "u"[:c]]
+            forms.append({
+                "ID": id, "Lect_ID": lect["ID"], "Concept_ID": concept["ID"],
+                "Form_according_to_Source": "".join(segments),
+                "Form": "".join(segments),
+                "Segments": " ".join(s for s in segments if s),
+                "Source": SOURCE if l else ""})
+            cognates.append({
+                "ID": str(len(cognates) + 1), "Form_ID": id,
+                "Cognateset_ID": "{:}-{:d}".format(concept["ID"], l % 2),
+                "Alignment": " ".join(s or "-" for s in segments),
+                "Source": "LexStat" if c else SOURCE})
+    # Re-code one form
+    cognates.append(dict(cognates[0], ID=str(len(cognates) + 1),
+                         Cognateset_ID="recoded"))
+    rows = {
+        "lects.csv": lects, "concepts.csv": concepts, "forms.csv": forms,
+        "cognates.csv": cognates, "missing_forms.csv": [],
+        "borrowings.csv": [{
+            "ID": "1", "Form_ID_Target": forms[-1]["ID"],
+            "Form_ID_Source": forms[0]["ID"], "Status": "2"}]}
+    for url, columns in tables.items():
+        with (directory / url).open("w", encoding="utf-8", newline="") as file:
+            writer = csv.DictWriter(file, columns, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows[url])
+    return metadata
+
+
+def build_database(metadata, database, bulk):
+    engine = sqlalchemy.create_engine("sqlite:///{:}".format(database))
+    DBSession.configure(bind=engine)
+    Base.metadata.create_all(engine)
+    with transaction.manager:
+        clld_sqlite.db_main(bulk=bulk, dataset=get_dataset(metadata))
+
+
+def table_contents(database):
+    """All rows of all tables, without their time stamps."""
+    engine = sqlalchemy.create_engine("sqlite:///{:}".format(database))
+    tables = sqlalchemy.MetaData()
+    tables.reflect(bind=engine)
+    contents = {}
+    with engine.connect() as connection:
+        for table in tables.sorted_tables:
+            result = connection.execute(
+                table.select().order_by(*table.primary_key.columns))
+            keys = list(result.keys())
+            contents[table.name] = [
+                {key: value for key, value in zip(keys, row)
+                 if key not in ("created", "updated")}
+                for row in result]
+    return contents
+
+
+@skipIf(clld_sqlite is None, "clld and lexirumah are not installed")
+class TestBulkLoad(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.metadata = write_wordlist(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_bulk_equals_orm(self):
+        databases = {}
+        # The importers cache ORM objects across calls, so every database
+        # is built in a fresh process.
+        for bulk in [False, True]:
+            databases[bulk] = Path(self.tmp.name) / "{:}.sqlite".format(bulk)
+            with concurrent.futures.ProcessPoolExecutor(
+                    1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                executor.submit(build_database, self.metadata,
+                                databases[bulk], bulk).result()
+        orm, bulk = (table_contents(databases[b]) for b in [False, True])
+        self.assertEqual(set(orm), set(bulk))
+        self.assertTrue(orm["value"])
+        self.assertTrue(orm["valueset"])
+        for table in orm:
+            self.assertEqual(orm[table], bulk[table], table)
@@ -0,0 +1,50 @@
+import tempfile
+from unittest import TestCase
+
+from clldutils.path import Path
+
+from pylexirumah import get_dataset
+from pylexirumah.cognates import current_rows, compact, last_row_index
+
+from tests.test_snapshot import write_wordlist
+
+
+def reference_current_rows(dataset):
+    """Keep the last row per form, like clld_sqlite.import_cognatesets did."""
+    by_form = {}
+    for row in dataset["CognateTable"].iterdicts():
+        by_form[row["Form_ID"]] = row
+    return list(by_form.values())
+
+
+class TestCurrentView(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dataset = get_dataset(write_wordlist(self.tmp.name))
+        self.cache = Path(self.tmp.name) / "cache"
+        self.cognates = Path(self.tmp.name) / "cognates.csv"
+        with self.cognates.open("a", encoding="utf-8") as f:
+            f.write('3,f1,s2,,"a p a",edictor\n4,f3,s2,,u,\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_current_rows(self):
+        self.assertEqual(list(current_rows(self.dataset, self.cache)),
+                         reference_current_rows(self.dataset))
+        with self.cognates.open("a", encoding="utf-8") as f:
+            f.write('5,f2,"s\n3",,,\n')
+        self.assertEqual(list(current_rows(self.dataset, self.cache)),
+                         reference_current_rows(self.dataset))
+        self.assertEqual(last_row_index(self.dataset, self.cache).rows, 5)
+
+    def test_compact(self):
+        before = reference_current_rows(self.dataset)
+        history = Path(self.tmp.name) / "history.csv"
+        self.assertEqual(compact(self.dataset, history, self.cache), (3, 1))
+        self.assertEqual(list(self.dataset["CognateTable"].iterdicts()), before)
+        self.assertEqual(list(current_rows(self.dataset, self.cache)), before)
+        self.assertEqual(
+            history.read_text(encoding="utf-8").splitlines()[1],
+            "1,f1,s1,,a p a,")
+        self.assertEqual(compact(self.dataset, history, self.cache), (3, 0))
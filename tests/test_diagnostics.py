@@ -0,0 +1,42 @@
+import io
+import csv
+import json
+from unittest import TestCase
+
+from pylexirumah.diagnostics import Diagnostic, DiagnosticSink
+
+
+def diagnostics():
+    for i in range(10):
+        yield Diagnostic("f{:d}".format(i), "form",
+                         "form-mismatch" if i % 2 else "form-missing",
+                         "a", None if i % 2 else "b", "Form {:d}".format(i))
+
+
+class TestDiagnosticSink(TestCase):
+    def test_jsonl(self):
+        out = io.StringIO()
+        sink = DiagnosticSink(out, format="jsonl")
+        sink.extend(diagnostics())
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([Diagnostic(**r) for r in records],
+                         list(diagnostics()))
+
+    def test_csv_cap(self):
+        out = io.StringIO()
+        sink = DiagnosticSink(out, format="csv", cap=2)
+        sink.extend(diagnostics())
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+        self.assertEqual([r["form"] for r in rows], ["f0", "f1", "f2", "f3"])
+        self.assertEqual(sink.counts,
+                         {"form-mismatch": 5, "form-missing": 5})
+
+    def test_text_sample(self):
+        out = io.StringIO()
+        sink = DiagnosticSink(out, sample=0.5)
+        sink.note("source")
+        sink.extend(diagnostics())
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], "source")
+        self.assertLess(len(lines), 11)
+        self.assertEqual(sum(sink.counts.values()), 10)
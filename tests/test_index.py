@@ -0,0 +1,50 @@
+import tempfile
+from unittest import TestCase
+
+from clldutils.path import Path
+
+from pylexirumah import get_dataset
+from pylexirumah.index import DatasetIndex, load_index
+
+from tests.test_snapshot import write_wordlist
+
+
+class TestIndex(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dataset = get_dataset(write_wordlist(self.tmp.name))
+        self.cache = Path(self.tmp.name) / "cache"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_build(self):
+        index = DatasetIndex.build(self.dataset, self.cache)
+        self.assertEqual(index.form, {"f1": 0, "f2": 1, "f3": 2})
+        self.assertEqual(list(index.forms("lect", "l1")), [0, 2])
+        self.assertEqual(list(index.forms("concept", "c1")), [0, 1])
+        self.assertEqual(list(index.forms("cognateset", "s1")), [0, 1])
+        self.assertEqual(list(index.forms("source", "s1")), [0])
+        self.assertEqual(list(index.forms("lect", "l9")), [])
+        self.assertEqual(index.cognateset_by_form()[1], ["s1"])
+
+    def test_recoded_form(self):
+        # Only the last row of each form in the CognateTable counts.
+        cognates = Path(self.tmp.name) / "cognates.csv"
+        with cognates.open("a", encoding="utf-8") as f:
+            f.write("3,f2,s2,,,\n4,f1,s1,,,\n")
+        index = DatasetIndex.build(self.dataset, self.cache)
+        self.assertEqual(list(index.forms("cognateset", "s1")), [0])
+        self.assertEqual(list(index.forms("cognateset", "s2")), [1])
+        self.assertEqual(index.cognateset_by_form()[1], ["s2"])
+
+    def test_cache(self):
+        index = load_index(self.dataset, cache_directory=self.cache)
+        cached = load_index(self.dataset, cache_directory=self.cache)
+        self.assertEqual(cached.form, index.form)
+        self.assertIsNot(cached, index)
+        forms = Path(self.tmp.name) / "forms.csv"
+        with forms.open("a", encoding="utf-8") as f:
+            f.write("f4,l2,c2,i,i,,\n")
+        self.assertIn("f4", load_index(
+            self.dataset, cache_directory=self.cache).form)
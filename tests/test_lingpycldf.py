@@ -0,0 +1,72 @@
+import csv
+import argparse
+import tempfile
+from unittest import TestCase
+
+from clldutils.path import Path
+
+from pylexirumah.lingpycldf import cldf, lingpy, external_sort
+
+from tests.test_snapshot import write_wordlist
+
+
+class TestExternalSort(TestCase):
+    def test_stable(self):
+        items = [(i % 7, i) for i in range(100)]
+        self.assertEqual(
+            list(external_sort(items, key=lambda x: x[0], rows_per_run=9)),
+            sorted(items, key=lambda x: x[0]))
+
+    def test_incomparable(self):
+        items = [1, "a", 2, None]
+        self.assertEqual(
+            list(external_sort(items, key=lambda x: x, rows_per_run=2)),
+            items)
+
+
+class TestConversion(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp.name)
+        self.metadata = write_wordlist(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def export(self, rows_per_run):
+        output = self.directory / "edictor-{:d}.tsv".format(rows_per_run)
+        cldf(argparse.Namespace(args=(str(self.metadata), str(output)),
+                                rows_per_run=rows_per_run,
+                                cache_directory=self.directory / "cache"))
+        with output.open(encoding="utf-8") as f:
+            return list(csv.DictReader(f, delimiter="\t"))
+
+    def test_cldf_to_lingpy(self):
+        rows = self.export(1)
+        self.assertEqual(rows, self.export(1000))
+        self.assertEqual([(row["REFERENCE"], row["COGID"]) for row in rows],
+                         [("f3", "0"), ("f1", "1"), ("f2", "1")])
+        self.assertEqual(rows[1]["ALIGNMENT"], "a p a")
+        self.assertEqual(rows[0]["ALIGNMENT"], "")
+        self.assertEqual(rows[0]["IPA"], "u")
+
+    def test_recoded_and_unknown_forms(self):
+        with (self.directory / "cognates.csv").open(
+                "a", encoding="utf-8") as f:
+            f.write("3,f9,s1,,x,\n4,f2,s2,,- t a,\n")
+        rows = self.export(1)
+        self.assertEqual(rows, self.export(1000))
+        self.assertEqual(
+            [(row["REFERENCE"], row["COGID"], row["COGNATESETTABLE_ID"])
+             for row in rows],
+            [("f3", "0", ""), ("f1", "1", "1"), ("f2", "2", "4")])
+
+    def test_lingpy_to_cldf(self):
+        self.export(10)
+        output = self.directory / "forms.csv"
+        lingpy(argparse.Namespace(args=(
+            str(self.directory / "edictor-10.tsv"), str(output))))
+        with output.open(encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([row["Language_Id"] for row in rows], ["l1", "l1", "l2"])
+        self.assertEqual(rows[1]["Segments"], "a p a")
@@ -0,0 +1,35 @@
+from unittest import TestCase
+
+from pylexirumah.check_transcription_systems import needleman_wunsch
+from pylexirumah.pairwise import Aligner, random_pairs
+
+
+class Tests(TestCase):
+    def test_global_same_as_reference(self):
+        pairs = random_pairs(300, seed=1)
+        self.assertEqual(
+            Aligner().align_many(pairs),
+            [needleman_wunsch(x, y) for x, y in pairs])
+
+    def test_local_same_as_reference(self):
+        pairs = random_pairs(300, seed=2)
+        self.assertEqual(
+            Aligner(local=True).align_many(pairs),
+            [needleman_wunsch(x, y, local=True) for x, y in pairs])
+
+    def test_element_gap_costs_same_as_reference(self):
+        lodict = {("a", ""): 0, ("b", ""): -2, ("", "t"): -0.5,
+                  ("a", "e"): 0.5, ("p", "b"): 0.25}
+        pairs = random_pairs(300, alphabet="abptek", seed=3)
+        self.assertEqual(
+            Aligner(lodict, gop=None).align_many(pairs),
+            [needleman_wunsch(x, y, lodict=lodict, gop=None) for x, y in pairs])
+
+    def test_empty(self):
+        self.assertEqual(Aligner()("", ""), (0.0, []))
+        self.assertEqual(Aligner()("ab", ""), needleman_wunsch("ab", ""))
+        self.assertEqual(Aligner()("", "abc"), needleman_wunsch("", "abc"))
+
+    def test_score(self):
+        aligner = Aligner()
+        self.assertEqual(aligner.score("AAAAABBBB", "AACAABBCB"), 5.0)
@@ -0,0 +1,56 @@
+import tempfile
+from unittest import TestCase
+
+from pylexirumah import get_dataset
+from pylexirumah.query import iter_forms, iter_rows
+
+from tests.test_snapshot import write_wordlist
+
+
+class TestIterForms(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dataset = get_dataset(write_wordlist(self.tmp.name))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_projection(self):
+        self.assertEqual(
+            list(iter_forms(["ID", "Segments"], dataset=self.dataset)),
+            [{"ID": row["ID"], "Segments": row["Segments"]}
+             for row in self.dataset["FormTable"].iterdicts()])
+        self.assertEqual(
+            list(iter_forms(dataset=self.dataset)),
+            list(self.dataset["FormTable"].iterdicts()))
+
+    def test_where(self):
+        def ids(**kwargs):
+            return [row["ID"] for row in iter_forms(
+                ["ID"], dataset=self.dataset, **kwargs)]
+        self.assertEqual(ids(where={"Language_ID": "l1"}), ["f1", "f3"])
+        self.assertEqual(ids(where={"Language_ID": {"l2", "l3"},
+                                    "Parameter_ID": ["c1"]}), ["f2"])
+        self.assertEqual(ids(where={"Segments": lambda s: len(s) > 2}),
+                         ["f1"])
+        self.assertEqual(ids(match="comm"), ["f2"])
+        with self.assertRaises(KeyError):
+            ids(where={"Nonexistent": "x"})
+
+    def test_typed_where(self):
+        from decimal import Decimal
+        rows = iter_rows(self.dataset["LanguageTable"], ["ID"],
+                         where={"Latitude": Decimal("1.5")},
+                         dialect=self.dataset.tablegroup.dialect)
+        self.assertEqual(list(rows), [{"ID": "l1"}])
+
+    def test_dialect(self):
+        from csvw.dsv import Dialect
+        table = self.dataset["LanguageTable"]
+        path = table.url.resolve(table.base)
+        with open(str(path), "a", encoding="utf-8") as file:
+            file.write("% not a lect\n")
+        self.assertEqual(
+            [row["ID"] for row in iter_rows(
+                table, ["ID"], dialect=Dialect(commentPrefix="%"))],
+            ["l1", "l2"])
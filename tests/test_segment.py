@@ -1,6 +1,9 @@
+import random
 from unittest import TestCase
 
-from pylexirumah.segment import tokenize_clpa
+from pyclpa.base import Sound
+
+from pylexirumah.segment import CLPA, WHITELIST, tokenize_clpa, tokenize_many
 
 
 class Tests(TestCase):
@@ -15,3 +18,33 @@ class Tests(TestCase):
     def test_tokenize_clpa_unknown_exception(self):
         with self.assertRaisesRegex(ValueError, "\"9\" is not a valid CLPA segment."):
             " ".join([str(x) for x in tokenize_clpa("a9b", ignore_clpa_errors=False)])
+
+    def test_tokenize_many(self):
+        self.assertEqual(
+            [" ".join([str(x) for x in t]) for t in tokenize_many(["baa", "", "ku9"])],
+            ['b aː', '', 'k u �'])
+
+    def test_tokenize_clpa_same_as_exhaustive_search(self):
+        def exhaustive(form):
+            for before, after in WHITELIST.items():
+                form = form.strip().replace(before, after)
+            result = []
+            start = 0
+            while start < len(form):
+                for end in range(len(form), start, -1):
+                    token = CLPA(form[start:end])[0]
+                    if isinstance(token, Sound):
+                        break
+                else:
+                    token, end = CLPA(form[start])[0], start + 1
+                result.append(token)
+                start = end
+            return [(type(t), str(t)) for t in result]
+
+        rng = random.Random(0)
+        alphabet = "ptkbdgmnŋaeiouːhwjˈ' ʃʒ/ʤäé:9ts"
+        for _ in range(300):
+            form = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+            self.assertEqual(
+                [(type(t), str(t)) for t in tokenize_clpa(form)],
+                exhaustive(form))
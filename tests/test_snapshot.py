@@ -0,0 +1,71 @@
+import tempfile
+from unittest import TestCase
+
+from clldutils.path import Path
+from pycldf import Wordlist
+
+from pylexirumah import get_dataset
+from pylexirumah.snapshot import Snapshot, write_snapshot, load_snapshot
+from pylexirumah.store import FormStore
+
+
+def write_wordlist(directory):
+    dataset = Wordlist.in_dir(str(directory))
+    dataset.add_component("LanguageTable")
+    dataset.add_component("CognateTable")
+    dataset.write(
+        FormTable=[
+            {"ID": "f1", "Language_ID": "l1", "Parameter_ID": "c1",
+             "Form": "apa", "Segments": ["a", "p", "a"], "Source": ["s1"]},
+            {"ID": "f2", "Language_ID": "l2", "Parameter_ID": "c1",
+             "Form": "ta", "Segments": ["t", "a"], "Comment": "a comment"},
+            {"ID": "f3", "Language_ID": "l1", "Parameter_ID": "c2",
+             "Form": "u", "Segments": []}],
+        LanguageTable=[
+            {"ID": "l1", "Name": "One", "Latitude": 1.5},
+            {"ID": "l2", "Name": "Two", "Longitude": -120.25}],
+        CognateTable=[
+            {"ID": "1", "Form_ID": "f1", "Cognateset_ID": "s1",
+             "Alignment": ["a", "p", "a"]},
+            {"ID": "2", "Form_ID": "f2", "Cognateset_ID": "s1",
+             "Alignment": ["-", "t", "a"]}])
+    return Path(directory) / "Wordlist-metadata.json"
+
+
+class TestSnapshot(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.metadata = write_wordlist(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        dataset = get_dataset(self.metadata)
+        self.assertIsNone(load_snapshot(self.metadata))
+        write_snapshot(dataset)
+        snapshot = get_dataset(self.metadata, snapshot=True)
+        self.assertIsInstance(snapshot, Snapshot)
+        self.assertEqual(snapshot.module, "Wordlist")
+        for table in ["FormTable", "LanguageTable", "CognateTable"]:
+            self.assertEqual(list(snapshot[table].iterdicts()),
+                             list(dataset[table].iterdicts()))
+        self.assertEqual(snapshot["FormTable", "languageReference"].name,
+                         dataset["FormTable", "languageReference"].name)
+
+    def test_form_store(self):
+        dataset = get_dataset(self.metadata)
+        write_snapshot(dataset)
+        store = load_snapshot(self.metadata).form_store()
+        self.assertEqual(list(store.iterdicts()),
+                         list(FormStore.from_dataset(dataset).iterdicts()))
+        self.assertEqual(list(store.ids[store.by_lect()["l1"]]), ["f1", "f3"])
+
+    def test_stale(self):
+        write_snapshot(get_dataset(self.metadata))
+        forms = Path(self.tmp.name) / "forms.csv"
+        with forms.open("a", encoding="utf-8") as f:
+            f.write("f4,l2,c2,i,i,,\n")
+        self.assertIsNone(load_snapshot(self.metadata))
+        self.assertNotIsInstance(
+            get_dataset(self.metadata, snapshot=True), Snapshot)
@@ -0,0 +1,58 @@
+import sys
+import types
+import tempfile
+import importlib.metadata
+from unittest import TestCase, mock
+
+from clldutils.path import Path
+
+from pylexirumah.sounds import SegmentTable, bipa, pyclts_version
+
+
+class TestSegmentTable(TestCase):
+    def test_like_bipa(self):
+        table = SegmentTable()
+        for grapheme in ["a", "tʰ", "a:", "ˈa", "+", "_", "0", "xyz"]:
+            sound = bipa()[grapheme]
+            self.assertEqual(str(table[grapheme]), str(sound))
+            self.assertEqual(table[grapheme].known,
+                             type(sound).__name__ != "UnknownSound")
+        self.assertIs(table["a:"], table["a:"])
+        self.assertEqual(table["a"].features,
+                         {"unrounded", "vowel", "front", "open"})
+
+    def test_save_load(self):
+        table = SegmentTable()
+        table.update(["a", "tʰ", "xyz"])
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "segments.json"
+            table.save(path)
+            loaded = SegmentTable(path)
+        self.assertEqual(loaded.table, table.table)
+        self.assertFalse(SegmentTable(Path("/nonexistent")).table)
+
+    def test_unknown_pyclts_version(self):
+        table = SegmentTable()
+        table.update(["a"])
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "segments.json"
+            table.save(path)
+            with mock.patch("importlib.metadata.version", side_effect=
+                            importlib.metadata.PackageNotFoundError):
+                self.assertIsNone(pyclts_version())
+                self.assertFalse(SegmentTable(path).table)
+
+    def test_without_importlib_metadata(self):
+        # Python before 3.8 has no importlib.metadata
+        pkg_resources = types.ModuleType("pkg_resources")
+        pkg_resources.DistributionNotFound = LookupError
+        pkg_resources.get_distribution = mock.Mock(
+            return_value=mock.Mock(version="1.0"))
+        with mock.patch.dict(sys.modules, {"importlib.metadata": None,
+                                           "pkg_resources": pkg_resources}):
+            self.assertEqual(pyclts_version(), "1.0")
+            pkg_resources.get_distribution.assert_called_with("pyclts")
+            pkg_resources.get_distribution.side_effect = LookupError
+            self.assertIsNone(pyclts_version())
+            with mock.patch.dict(sys.modules, {"pkg_resources": None}):
+                self.assertIsNone(pyclts_version())
@@ -0,0 +1,61 @@
+import random
+from unittest import TestCase
+
+from pylexirumah.store import (
+    FormStore, PackedStrings, ListColumn, CodedColumn, make_column)
+
+
+def rows(n=200, seed=0):
+    rng = random.Random(seed)
+    for i in range(n):
+        row = {"ID": "f{:d}".format(i),
+               "Lect_ID": "l{:d}".format(rng.randrange(7)),
+               "Concept_ID": "c{:d}".format(rng.randrange(13)),
+               "Form": "x{:d}".format(i),
+               "Segments": [rng.choice("ptkaiu")
+                            for _ in range(rng.randrange(6))]}
+        if i % 3 == 0:
+            row["Comment"] = "comment {:d}".format(i)
+        row["Source"] = None if i % 7 == 0 else ["s{:d}".format(i % 4)] * (i % 3)
+        yield row
+
+
+class TestFormStore(TestCase):
+    def test_round_trip(self):
+        store = FormStore.from_rows(rows())
+        self.assertEqual(len(store), 200)
+        for original, stored in zip(rows(), store.iterdicts()):
+            original.setdefault("Comment", None)
+            self.assertEqual(original, stored)
+        self.assertEqual(store.index("f17"), 17)
+
+    def test_groups(self):
+        store = FormStore.from_rows(rows())
+        by_concept = {}
+        for row in rows():
+            by_concept.setdefault(row["Concept_ID"], []).append(row["ID"])
+        self.assertEqual(
+            {concept: list(store.ids[indices])
+             for concept, indices in store.by_concept()},
+            by_concept)
+        self.assertEqual(list(store.by_lect()["nonexistent"]), [])
+        self.assertEqual(store.by_lect().sizes().sum(), 200)
+
+    def test_columns(self):
+        store = FormStore.from_rows(rows())
+        self.assertIsInstance(store.ids, PackedStrings)
+        self.assertIsInstance(store.columns["Form"], PackedStrings)
+        self.assertIsInstance(store.columns["Comment"], CodedColumn)
+        self.assertIsInstance(store.columns["Source"], ListColumn)
+        self.assertEqual(store.columns["Source"][7], None)
+        self.assertEqual(store.columns["Source"][8], ["s0", "s0"])
+        self.assertEqual(store.columns["Source"][3], [])
+        with self.assertRaises(KeyError):
+            store.index("f200")
+        self.assertLess(store.nbytes(), 60 * len(store))
+
+    def test_make_column(self):
+        for values in [["a", None, "b", "a"], [1, 2, None, 2], [["x"], None, []],
+                       ["ä", "é", "ö", None, "ü"]]:
+            self.assertEqual(list(make_column(values)), values)
+        self.assertEqual(make_column(["a", "b", "a"])[[2, 1]], ["a", "b"])
@@ -0,0 +1,132 @@
+import os
+import random
+import tempfile
+from unittest import TestCase
+
+from clldutils.path import Path
+
+from pylexirumah import repository
+from pylexirumah.check_transcription_systems import (
+    Transducer, load_orthographic_profile, load_pipeline,
+    cached_orthographic_profile)
+
+
+def reference_apply(rules, line, wordboundary="_"):
+    """The original, rule-by-rule implementation of Transducer.__call__"""
+    line = wordboundary + line + wordboundary
+    start = 0
+    output = ""
+    while start < len(line):
+        oldStart = start
+        for (left, right) in rules:
+            match = False
+            end = len(line) + 1
+            while end > start:
+                if left == line[start:end]:
+                    output += right
+                    start = end
+                    match = True
+                    break
+                else:
+                    end -= 1
+            if match:
+                break
+        if start == oldStart:
+            output += line[start]
+            start += 1
+    return output.strip(wordboundary)
+
+
+def profiles(cache_directory):
+    for path in sorted((repository.parent / "p").iterdir()):
+        try:
+            transducer, = load_orthographic_profile(
+                ["p/" + path.name], transducer_cache={},
+                cache_directory=cache_directory)
+        except (NotImplementedError, ValueError):
+            continue
+        yield path.name, transducer
+
+
+def random_strings(rules, n, rng):
+    pieces = [s for rule in rules for s in rule if s]
+    pieces += list({c for piece in pieces for c in piece}) + ["_", " "]
+    for _ in range(n):
+        yield "".join(rng.choice(pieces) for _ in range(rng.randint(0, 8)))
+
+
+class Tests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_directory = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_first_rule_wins(self):
+        t = Transducer([("a", "x"), ("ab", "y"), ("b", "z")])
+        self.assertEqual(t("ab"), "xz")
+        t = Transducer([("ab", "y"), ("a", "x"), ("b", "z")])
+        self.assertEqual(t("aab"), "xy")
+
+    def test_all_profiles_same_as_reference(self):
+        rng = random.Random(0)
+        for name, transducer in profiles(self.cache_directory):
+            backward = [(after, before) for before, after in transducer.rules]
+            for string in random_strings(transducer.rules, 50, rng):
+                self.assertEqual(
+                    transducer(string),
+                    reference_apply(transducer.rules, string),
+                    "{:} on {:}".format(name, string))
+                self.assertEqual(
+                    transducer.undo(string),
+                    reference_apply(backward, string),
+                    "{:} undo on {:}".format(name, string))
+
+    def test_pipeline_same_as_stages(self):
+        rng = random.Random(1)
+        pipelines = {}
+        pipeline = load_pipeline(["p/general", "p/abui1241-fuime"],
+                                 pipeline_cache=pipelines,
+                                 cache_directory=self.cache_directory)
+        stages = load_orthographic_profile(
+            ["p/general", "p/abui1241-fuime"], transducer_cache={},
+            cache_directory=self.cache_directory)
+        for string in random_strings(stages[0].rules, 100, rng):
+            expected = string
+            for transducer in stages:
+                expected = transducer(expected)
+            self.assertEqual(pipeline(string), expected)
+            self.assertEqual(pipeline(string), expected)
+            expected = string
+            for transducer in reversed(stages):
+                expected = transducer.undo(expected)
+            self.assertEqual(pipeline.undo(string), expected)
+        self.assertIs(pipeline, load_pipeline(
+            ["p/general", "", "p/abui1241-fuime"], pipeline_cache=pipelines,
+            cache_directory=self.cache_directory))
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            profile = directory / "profile"
+            profile.write_text("a\tb\n", encoding="utf-8")
+            self.assertEqual(
+                cached_orthographic_profile(profile, directory / "cache").rules,
+                [("a", "b")])
+            cache_file, = (directory / "cache" / "profiles").iterdir()
+
+            # Touching the profile does not invalidate the cache…
+            os.utime(str(profile), ns=(0, 0))
+            self.assertEqual(
+                cached_orthographic_profile(profile, directory / "cache").rules,
+                [("a", "b")])
+            # …but editing it does.
+            profile.write_text("a\tc\n", encoding="utf-8")
+            os.utime(str(profile), ns=(1, 1))
+            self.assertEqual(
+                cached_orthographic_profile(profile, directory / "cache")("a"),
+                "c")
+            self.assertEqual(
+                cached_orthographic_profile(profile, directory / "cache").rules,
+                [("a", "c")])
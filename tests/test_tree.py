@@ -0,0 +1,152 @@
+import itertools
+from unittest import TestCase
+
+import numpy
+from newick import loads
+
+from pylexirumah.tree import (
+    upgma, wpgma, neighbor_joining, induced_subtree, SubtreeIndex)
+
+
+def clades(tree):
+    return {frozenset(n.name for n in node.get_leaves())
+            for node in tree.walk()}
+
+
+def leaf_distances(tree):
+    distances = {}
+    for leaf in tree.get_leaves():
+        node, path = leaf, 0
+        up = {}
+        while node is not None:
+            up[id(node)] = path
+            path += node.length
+            node = node.ancestor
+        for other in tree.get_leaves():
+            node, path = other, 0
+            while id(node) not in up:
+                path += node.length
+                node = node.ancestor
+            distances[leaf.name, other.name] = path + up[id(node)]
+    return distances
+
+
+def splits(tree):
+    leaves = frozenset(tree.get_leaf_names())
+    return {min(side, leaves - side, key=sorted)
+            for side in (frozenset(n.get_leaf_names()) for n in tree.walk())
+            if 1 < len(side) < len(leaves) - 1}
+
+
+def naive_neighbor_joining(distance_matrix):
+    d = {(a, b): distance_matrix[a][b]
+         for a in range(len(distance_matrix)) for b in range(len(distance_matrix))}
+    clusters = {i: frozenset([str(i)]) for i in range(len(distance_matrix))}
+    result = set()
+    while len(clusters) > 3:
+        m = len(clusters)
+        r = {a: sum(d[a, b] for b in clusters) for a in clusters}
+        a, b = min(itertools.combinations(sorted(clusters), 2),
+                   key=lambda p: (m - 2) * d[p] - r[p[0]] - r[p[1]])
+        new = max(d)[0] + 1
+        for c in clusters:
+            d[new, c] = d[c, new] = 0.5 * (d[a, c] + d[b, c] - d[a, b])
+        d[new, new] = 0
+        clusters[new] = clusters.pop(a) | clusters.pop(b)
+        result.add(clusters[new])
+    leaves = frozenset().union(*clusters.values())
+    return {min(side, leaves - side, key=sorted) for side in result
+            if 1 < len(side) < len(leaves) - 1}
+
+
+def naive_upgma(distance_matrix, weighted=False):
+    clusters = [frozenset([str(i)]) for i in range(len(distance_matrix))]
+    d = {(a, b): distance_matrix[int(next(iter(a))), int(next(iter(b)))]
+         for a in clusters for b in clusters}
+    result = set(clusters)
+    while len(clusters) > 1:
+        a, b = min(itertools.combinations(clusters, 2), key=lambda p: d[p])
+        merged = a | b
+        clusters = [c for c in clusters if c not in (a, b)]
+        for c in clusters:
+            if weighted:
+                d[merged, c] = d[c, merged] = (d[a, c] + d[b, c]) / 2
+            else:
+                d[merged, c] = d[c, merged] = (
+                    len(a) * d[a, c] + len(b) * d[b, c]) / len(merged)
+        clusters.append(merged)
+        result.add(merged)
+    return result
+
+
+class Tests(TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(1)
+        self.distances = random.rand(30, 30)
+        self.distances += self.distances.T
+        numpy.fill_diagonal(self.distances, 0)
+
+    def test_upgma(self):
+        self.assertEqual(clades(upgma(self.distances)),
+                         naive_upgma(self.distances))
+
+    def test_wpgma(self):
+        self.assertEqual(clades(wpgma(self.distances)),
+                         naive_upgma(self.distances, weighted=True))
+
+    def test_upgma_does_not_modify_input(self):
+        distances = self.distances.copy()
+        upgma(distances)
+        numpy.testing.assert_array_equal(distances, self.distances)
+
+    def test_single_leaf(self):
+        self.assertEqual(upgma(numpy.zeros((1, 1)), ["a"]).newick, "a")
+        self.assertEqual(neighbor_joining(numpy.zeros((1, 1)), ["a"]).newick, "a")
+
+    def test_neighbor_joining_additive(self):
+        # On an additive distance matrix, neighbour joining recovers the tree.
+        d = numpy.array([[0, 5, 9, 9, 8], [5, 0, 10, 10, 9], [9, 10, 0, 8, 7],
+                         [9, 10, 8, 0, 3], [8, 9, 7, 3, 0]])
+        self.assertIn(frozenset("ab"), clades(neighbor_joining(d, "abcde")))
+        self.assertIn(frozenset("abc"), clades(neighbor_joining(d, "abcde")))
+
+    def test_induced_subtree(self):
+        tree = upgma(self.distances)
+        names = {"3", "7", "12", "29"}
+        subtree = induced_subtree(tree, names)
+        self.assertEqual(set(subtree.get_leaf_names()), names)
+        self.assertEqual(clades(subtree) - {frozenset()},
+                         {c & names for c in clades(tree)} - {frozenset()})
+        self.assertTrue(all(len(n.descendants) != 1 for n in subtree.walk()))
+        self.assertEqual(len(list(tree.walk())), 59)
+        self.assertIsNone(induced_subtree(tree, {"x"}))
+
+    def test_subtree_index(self):
+        tree = neighbor_joining(self.distances)
+        index = SubtreeIndex(tree)
+        distances = leaf_distances(tree)
+        rng = numpy.random.RandomState(2)
+        for k in (1, 2, 3, 5, 12, 30):
+            names = {str(i) for i in rng.choice(30, k, replace=False)}
+            subtree = index.subtree(names)
+            self.assertEqual(set(subtree.get_leaf_names()), names)
+            self.assertEqual(clades(subtree),
+                             {c & names for c in clades(tree)} - {frozenset()})
+            for pair, distance in leaf_distances(subtree).items():
+                self.assertAlmostEqual(distance, distances[pair])
+        pruned = loads(tree.newick)[0]
+        pruned.prune_by_names(list("0123456789"), inverse=True)
+        pruned.remove_redundant_nodes()
+        pruned.remove_lengths()
+        subtree = induced_subtree(tree, set("0123456789"))
+        subtree.remove_lengths()
+        self.assertEqual(subtree.newick, pruned.newick)
+
+    def test_subtree_index_memoizes(self):
+        index = SubtreeIndex(upgma(self.distances))
+        self.assertIs(index.shape(["1", "2", "3"]), index.shape({"3", "2", "1"}))
+        self.assertIsNot(index.subtree(["1", "2"]), index.subtree(["1", "2"]))
+
+    def test_neighbor_joining(self):
+        self.assertEqual(splits(neighbor_joining(self.distances)),
+                         naive_neighbor_joining(self.distances))
@@ -0,0 +1,51 @@
+import tempfile
+from unittest import TestCase
+
+from clldutils.path import Path
+
+from pylexirumah import get_dataset
+from pylexirumah.util import cognate_sets, cached_cognateset_assignments
+
+from tests.test_snapshot import write_wordlist
+
+
+class TestCognateSets(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dataset = get_dataset(write_wordlist(self.tmp.name))
+        self.cache = Path(self.tmp.name) / "cache"
+        self.cognates = Path(self.tmp.name) / "cognates.csv"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def cognate_sets(self, mode="exact", cache=None):
+        return dict(cognate_sets(self.dataset, partial_cognates=mode,
+                                 cache_directory=cache or self.cache))
+
+    def test_appended_rows(self):
+        self.assertEqual(self.cognate_sets(), {"s1": {"f1", "f2"}})
+        with self.cognates.open("a", encoding="utf-8") as f:
+            f.write("3,f2,s2,,,\n4,f3,s2,,,\n")
+        self.assertEqual(self.cognate_sets(),
+                         {"s1": {"f1"}, "s2": {"f2", "f3"}})
+        state = cached_cognateset_assignments(
+            self.dataset, "Form_ID", "Cognateset_ID", self.cache)
+        self.assertEqual(state.rows, 4)
+        with self.cognates.open("a", encoding="utf-8") as f:
+            f.write("5,f1,s2,,,\n")
+        self.assertEqual(self.cognate_sets("intersection"),
+                         {"s2": {"f1", "f2", "f3"}})
+        state = cached_cognateset_assignments(
+            self.dataset, "Form_ID", "Cognateset_ID", self.cache)
+        self.assertEqual(state.rows, 5)
+
+    def test_rewritten_table(self):
+        self.cognate_sets()
+        self.cognates.write_text(
+            "ID,Form_ID,Cognateset_ID,Segment_Slice,Alignment,Source\n"
+            "1,f3,s3,,,\n", encoding="utf-8")
+        self.assertEqual(self.cognate_sets(), {"s3": {"f3"}})
+        self.assertEqual(
+            self.cognate_sets(),
+            self.cognate_sets(cache=Path(self.tmp.name) / "fresh"))